@@ -74,7 +74,7 @@ def get_meta_from_articles_spec(tei_logger, url, bs):
                             auth_tags.append(author_name_tag)
                     author_list = [au.get_text(strip=True) for au in auth_tags if au.get_text(strip=True) is not None]
                     if len(author_list) > 0:
-                        data['sch:author'] = list(set(author_list))
+                        data['sch:author'] = list(dict.fromkeys(author_list))
                     else:
                         tei_logger.log('DEBUG', f'{url}: NEWSFEED AUTHOR TAGS NOT FOUND!')
                 else:
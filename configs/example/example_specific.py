@@ -49,6 +49,7 @@ def decompose_spec(article_dec):
     return article_dec
 
 
+# URLs to skip, entries ending with * are treated as prefixes, re.compile() objects as patterns
 BLACKLIST_SPEC = []
 
 # with complicated links, its best to use re.compile('|'.join([re.escape(s) for s in url_list]))
@@ -56,6 +56,7 @@ def decompose_spec(article_dec):
     return article_dec
 
 
+# URLs to skip, entries ending with * are treated as prefixes, re.compile() objects as patterns
 BLACKLIST_SPEC = []
 
 MULTIPAGE_URL_END = re.compile(r'^\b$')  # Dummy
@@ -2,7 +2,6 @@
 # -*- coding: utf-8, vim: expandtab:ts=4 -*
 
 import re
-from bs4 import BeautifulSoup
 from html2tei import parse_date, BASIC_LINK_ATTRS, decompose_listed_subtrees_and_mark_media_descendants, tei_defaultdict
 
 PORTAL_URL_PREFIX = 'https://hvg.hu/'
@@ -302,8 +301,7 @@ MULTIPAGE_URL_END = re.compile(r'.*\?isPrintView.*')
 # https://hvg.hu/sport/20210614_foci_eb_euro_2020_junius_14_percrol_percre/2?isPrintView=False&liveReportItemId=0&isPreview=False&ver=1&order=desc
 
 
-def next_page_of_article_spec(curr_html):
-    bs = BeautifulSoup(curr_html, 'lxml')
+def next_page_of_article_spec(bs):
     if bs.find('div', class_='G-pagination') is not None:
         next_tag = bs.find('a', {'class': 'arrow next', 'rel': 'next', 'href': True})
         if next_tag is not None:
@@ -4,8 +4,6 @@
 import re
 from os.path import join as os_path_join, dirname as os_path_dirname, abspath as os_path_abspath
 
-from bs4 import BeautifulSoup
-
 from src.html2tei import parse_date, BASIC_LINK_ATTRS, decompose_listed_subtrees_and_mark_media_descendants,\
     tei_defaultdict
 
@@ -346,8 +344,7 @@ MULTIPAGE_URL_END = re.compile(r'.*/\?p=.*')
 # <nav class=pager default tobboldalas_cikk id=pager_bottom>
 
 
-def next_page_of_article_spec(curr_html):
-    bs = BeautifulSoup(curr_html, 'lxml')
+def next_page_of_article_spec(bs):
     pages = bs.find('div', class_='pagination clearfix')
     if pages is not None:
         for p in pages.find_all('a', class_='next'):
@@ -4,8 +4,6 @@
 import re
 from os.path import join as os_path_join, dirname as os_path_dirname, abspath as os_path_abspath
 
-from bs4 import BeautifulSoup
-
 from html2tei import parse_date, BASIC_LINK_ATTRS, decompose_listed_subtrees_and_mark_media_descendants, tei_defaultdict
 
 PORTAL_URL_PREFIX = 'https://index.hu/24ora/?cimke=koronav%C3%ADrus'
@@ -319,9 +317,8 @@ MULTIPAGE_URL_END = re.compile(r'^\b$')  # (r'.*/\?p=.*')
 # https://index.hu/belfold/2020/02/29/eloben_kozvetitjuk_az_eddigi_legnagyobb_magyar_lottonyeremeny_kihuzasa/?p=1
 
 
-def next_page_of_article_spec(curr_html):
-    """    bs = BeautifulSoup(curr_html, 'lxml')
-        pages = bs.find('div', class_='pagination clearfix')
+def next_page_of_article_spec(bs):
+    """    pages = bs.find('div', class_='pagination clearfix')
         if pages is not None:
             for p in pages.find_all('a', class_='next'):
                 if 'rel' not in p.attrs.keys():
@@ -3,8 +3,6 @@
 
 import re
 
-from bs4 import BeautifulSoup
-
 from html2tei import parse_date, BASIC_LINK_ATTRS, decompose_listed_subtrees_and_mark_media_descendants, tei_defaultdict
 
 PORTAL_URL_PREFIX = 'https://forum.kremmania.hu'
@@ -74,12 +72,11 @@ LINK_FILTER_SUBSTRINGS_SPEC = re.compile('|'.join(['LINK_FILTER_DUMMY_STRING']))
 MULTIPAGE_URL_END = re.compile(r'.*\?page=.*')
 
 
-def next_page_of_article_spec(archive_page_raw_html):
-    """extracts and returns next page URL from an HTML code if there is one...
+def next_page_of_article_spec(soup):
+    """extracts and returns next page URL from the parsed HTML if there is one...
         Specific for https://forum.kremmania.hu (next page of forum topics)
         :returns string of url if there is one, None otherwise"""
     ret = None
-    soup = BeautifulSoup(archive_page_raw_html, 'lxml')
     next_page = soup.find('link', rel='next')
     if next_page is not None and next_page.has_attr('href'):
         url_end = next_page.attrs['href']
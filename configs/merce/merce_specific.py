@@ -3,8 +3,6 @@
 
 import re
 
-from bs4 import BeautifulSoup
-
 from html2tei import parse_date, BASIC_LINK_ATTRS, decompose_listed_subtrees_and_mark_media_descendants, tei_defaultdict
 
 PORTAL_URL_PREFIX = 'https://merce.hu'
@@ -121,9 +119,8 @@ LINK_FILTER_SUBSTRINGS_SPEC = re.compile('|'.join(['LINK_FILTER_DUMMY_STRING']))
 MULTIPAGE_URL_END = re.compile(r'^\b$')  # Dummy
 
 
-def next_page_of_article_spec(curr_html):
+def next_page_of_article_spec(soup):
     ret = None
-    soup = BeautifulSoup(curr_html, 'lxml')
     next_page = soup.find('a', attrs={'data-act': 'load-more'})
     last_page = soup.select('div.pplive__loadmore-wrap.text-center.d-none')
     if next_page is not None and 'href' in next_page.attrs and len(last_page) == 0:
@@ -2,7 +2,6 @@
 # -*- coding: utf-8, vim: expandtab:ts=4 -*
 
 import re
-from bs4 import BeautifulSoup
 from os.path import join as os_path_join, dirname as os_path_dirname, abspath as os_path_abspath
 from html2tei import parse_date, decompose_listed_subtrees_and_mark_media_descendants, tei_defaultdict, BASIC_LINK_ATTRS
 
@@ -122,7 +121,7 @@ def get_meta_from_articles_spec(tei_logger, url, bs):
                 url_keywords.append(URL_KEYWORDS[split_url[k]])
 
         if len(intext) > 0 or len(keywords_from_meta) > 0 or len(url_keywords) > 0:
-            data['sch:keywords'] = list(set(intext) | set(keywords_from_meta) | set(url_keywords))
+            data['sch:keywords'] = list(dict.fromkeys(intext + keywords_from_meta + url_keywords))
         else:
             tei_logger.log('DEBUG', f'{url} NO KEYWORDS FOUND')
         return data
@@ -604,8 +603,7 @@ LINK_FILTER_SUBSTRINGS_SPEC = re.compile('|'.join([re.escape(s) for s in bad_url
 MULTIPAGE_URL_END = re.compile(r'.*\?pIdx=[0-9]*')
 
 
-def next_page_of_article_spec(curr_html):
-    bs = BeautifulSoup(curr_html, 'lxml')
+def next_page_of_article_spec(bs):
     pages = bs.find('a', {'class': 'ap-next', 'rel': 'next', 'href': True})
     if pages:
         link = pages['href']
@@ -70,7 +70,7 @@ def get_meta_from_articles_spec(tei_logger, url, bs):
             tei_logger.log('WARNING', f'{url}: COULD NOT FIND NEWSFEED ARTICLE AUTHORS!')
 
     if len(author_list) > 0:  # Previous two clauses should throw errors when authors not found
-        data['sch:author'] = list(set(author_list))  # TODO might be okay to pass just set?
+        data['sch:author'] = list(dict.fromkeys(author_list))  # TODO might be okay to pass just set?
 
     date = bs.find('span', {'class': ['o-post__date', 'a-date', 'fl']})
     if date is not None:
@@ -3,7 +3,6 @@
 
 import re
 
-from bs4 import BeautifulSoup
 from os.path import join as os_path_join, dirname as os_path_dirname, abspath as os_path_abspath
 from src.html2tei import parse_date, BASIC_LINK_ATTRS, decompose_listed_subtrees_and_mark_media_descendants,\
     tei_defaultdict
@@ -136,9 +135,8 @@ MULTIPAGE_URL_END = re.compile(r'.*/[1-9]/')
 # https://rangado.24.hu/nemzetkozi_foci/2021/05/26/europa-liga-donto-villarreal-manchester-united/2/
 
 
-def next_page_of_article_spec(curr_html):
+def next_page_of_article_spec(bs):
     # Rangado 24.hu operates with a reverse multipage logic: the start page is the newest page of the article
-    bs = BeautifulSoup(curr_html, 'lxml')
     current_page = bs.find('span', class_='page-numbers current')
     if current_page is not None and current_page.get_text().isdecimal():
         current_page_num = int(current_page.get_text())
@@ -3,7 +3,6 @@
 
 import re
 from langdetect import detect
-from bs4 import BeautifulSoup
 from os.path import join as os_path_join, dirname as os_path_dirname, abspath as os_path_abspath
 
 from src.html2tei import parse_date, decompose_listed_subtrees_and_mark_media_descendants, tei_defaultdict
@@ -225,8 +224,7 @@ LINK_FILTER_SUBSTRINGS_SPEC = re.compile('|'.join(['http://Az%20Index%20egy%C3%A
 MULTIPAGE_URL_END = re.compile(r'.*(\?|&)page=.*')
 
 
-def next_page_of_article_spec(curr_html):
-    bs = BeautifulSoup(curr_html, 'lxml')
+def next_page_of_article_spec(bs):
     next_page_cont1 = bs.find('li', class_='arrow')
     next_page_link2 = bs.find('a', {'class': 'page-link', 'aria-label': 'Következő »'})
     if next_page_cont1 is not None:
@@ -47,7 +47,7 @@ def get_meta_from_articles_spec(tei_logger, url, bs):
             if p_auth is not None:
                 post_authors.append(p_auth.text.strip())
         if len(post_authors) > 0:
-            authors.extend(list(set(post_authors)))
+            authors.extend(dict.fromkeys(post_authors))
         if len(authors) > 0:
             data['sch:author'] = authors
         elif len(authors) > 1:
@@ -101,8 +101,7 @@ MULTIPAGE_URL_END = re.compile(r'.*oldal=.')
 LINK_FILTER_SUBSTRINGS_SPEC = re.compile('|'.join(['https://alapjarat.hu/aktualis/elfogyott-shell-v-power-95-']))
 
 
-def next_page_of_article_spec(curr_html):  # https://telex.hu/koronavirus/2020/11/12/koronavirus-pp-2020-11-12/elo
-    bs = BeautifulSoup(curr_html, 'lxml')
+def next_page_of_article_spec(bs):  # https://telex.hu/koronavirus/2020/11/12/koronavirus-pp-2020-11-12/elo
     if bs.find('div', class_='pagination') is not None:
         current_pagenum = int(bs.find('a', class_='current-page').attrs['href'][-1])
         for pagelink in bs.find_all('a', class_='page'):
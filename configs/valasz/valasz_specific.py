@@ -3,7 +3,7 @@
 
 import re
 
-from bs4 import Tag, BeautifulSoup
+from bs4 import Tag
 from os.path import join as os_path_join, dirname as os_path_dirname, abspath as os_path_abspath
 
 from html2tei import parse_date, decompose_listed_subtrees_and_mark_media_descendants, tei_defaultdict
@@ -144,8 +144,7 @@ BLACKLIST_SPEC = [url.strip() for url in
 MULTIPAGE_URL_END = re.compile(r'.*?page=.')
 
 
-def next_page_of_article_spec(curr_html):
-    bs = BeautifulSoup(curr_html, 'lxml')
+def next_page_of_article_spec(bs):
     if bs.find('article', class_='percro-percre-lista') is not None:
         next_tag = bs.find('a', rel='next')
         if next_tag is not None and 'href' in next_tag.attrs.keys():
@@ -5,11 +5,13 @@ from argparse import ArgumentParser, ArgumentTypeError
 
 from .workflow_helpers.processing_utils import run_main
 from .workflow_helpers.read_config import WRITE_OUT_MODES
+from .workflow_helpers.validate_hash_zip import TEI_ALL_SCHEMA_URL, DEFAULT_SCHEMA_CACHE_DIR
+from .workflow_helpers.output_containers import OUTPUT_CONTAINERS, SHARD_BY, DEFAULT_SHARD_SIZE_MB
 from .modes.update_and_filter_tables import diff_all_tag_table
 from .modes.tag_bigrams_maker import init_portal as tag_bigrams_init_portal
 from .modes.html_content_tree import init_portal as content_tree_init_portal
 from .modes.tag_inventory_maker import init_portal as tag_inventory_init_portal
-from .modes.portal_article_cleaner import init_portal as portal_article_cleaner_init_portal
+from .modes.portal_article_cleaner import init_portal as portal_article_cleaner_init_portal, TEI_XML_FORMATS
 
 
 def str2bool(v):
@@ -58,6 +60,30 @@ def entrypoint():
     subparsers = parent_parser.add_subparsers(help='Running mode', dest='command', required=True,
                                               metavar='MODE')
 
+    # The arguments of the modes which can process the articles in parallel
+    parallel_params = {'run_parallel': (('-p', '--run-parallel'),
+                                        {'type': str2bool, 'nargs': '?', 'const': True, 'default': True,
+                                         'help': 'Run processing in parallel or all operation must be used '
+                                                 'sequentially', 'metavar': 'True/False'}),
+                       'parallel_portals': (('-P', '--parallel-portals'),
+                                            {'type': int, 'default': 1,
+                                             'help': 'The number of portals processed at once in parallel mode '
+                                                     'sharing the workers (the largest WARC first)', 'metavar': 'N'}),
+                       'workers': (('-j', '--workers'),
+                                   {'type': int, 'default': None,
+                                    'help': 'The number of worker processes in parallel mode '
+                                            '(default: the number of CPUs)', 'metavar': 'N'}),
+                       'max_in_flight': (('--max-in-flight',),
+                                         {'type': int, 'default': None,
+                                          'help': 'The maximal number of articles of a portal under processing at once '
+                                                  'in parallel mode (default: 256 for each worker)', 'metavar': 'N'}),
+                       'max_pending_mb': (('--max-pending-mb',),
+                                          {'type': int, 'default': None,
+                                           'help': 'The maximal size (in MB) of the results of a portal waiting '
+                                                   'for the slower articles before them in parallel mode '
+                                                   '(default: 256)', 'metavar': 'MB'})
+                       }
+
     # For each subparser define the common arguments (to ensure the ordering of arguments)
     spdict = {}
     for cmd, (_, help_text) in command_dict.items():
@@ -77,9 +103,48 @@ def entrypoint():
                                         'or print into the output directory without validation using human-friendly '
                                         'names', metavar='True/False')
 
-    spdict['cleaner'].add_argument('-p', '--run-parallel', type=str2bool, nargs='?', const=True, default=True,
-                                   help='Run processing in parallel or all operation must be used sequentially',
-                                   metavar='True/False')
+    spdict['cleaner'].add_argument('-F', '--xml-format', type=str, choices=TEI_XML_FORMATS, default='bs4-prettify',
+                                   help='The format of the output XML: prettified with BeautifulSoup as in earlier '
+                                        'versions (slow) or pretty printed or compact (with lxml, faster)',
+                                   metavar='FORMAT')
+
+    spdict['cleaner'].add_argument('-T', '--processing-time', type=str, default=None,
+                                   help='Deterministic mode: write this processing time (a date and time in ISO '
+                                        'format or "run" for the start of the run) into the output instead of '
+                                        'the current time of each article and compute the hashsums without it '
+                                        '(default: the current time)', metavar='TIME')
+
+    spdict['cleaner'].add_argument('-k', '--container', type=str, choices=OUTPUT_CONTAINERS.keys(), default=None,
+                                   help='The container of the output files: zip, tar, jsonl (one JSON object per '
+                                        'line) or dir (one file per article) (default: zip, dir in debug mode)',
+                                   metavar='CONTAINER')
+
+    spdict['cleaner'].add_argument('--shard-by', type=str, choices=SHARD_BY, default=None,
+                                   help='Split the output container into a directory of shards by size or by '
+                                        'the year of publication (default: no sharding)', metavar='SHARD_BY')
+
+    spdict['cleaner'].add_argument('--shard-size-mb', type=int, default=DEFAULT_SHARD_SIZE_MB,
+                                   help='The size (in MB) after which a new shard is started when sharding by size '
+                                        f'(default: {DEFAULT_SHARD_SIZE_MB})', metavar='MB')
+
+    spdict['cleaner'].add_argument('-z', '--compression-level', type=int, default=None,
+                                   help='Compress the zip output with deflate at this level (0-9) '
+                                        '(default: no compression)', metavar='LEVEL')
+
+    for _, (args, kwargs) in parallel_params.items():
+        spdict['cleaner'].add_argument(*args, **kwargs)
+
+    spdict['cleaner'].add_argument('-U', '--unordered-output', type=str2bool, nargs='?', const=True, default=False,
+                                   help='Write the articles in the order of their completion in parallel mode '
+                                        'instead of the order of the WARC file', metavar='True/False')
+
+    spdict['cleaner'].add_argument('-C', '--result-cache-dir', type=str, default=None,
+                                   help='The directory for the persistent cache of the processed articles to skip '
+                                        'the unchanged ones on rerun (default: no cache)', metavar='DIR')
+
+    spdict['cleaner'].add_argument('-R', '--resume', type=str2bool, nargs='?', const=True, default=False,
+                                   help='Continue the output of the previous (interrupted) run from its last '
+                                        'checkpoint skipping the already written articles', metavar='True/False')
 
     spdict['cleaner'].add_argument('-d', '--with-specific-dicts', dest='w_specific_dicts', type=str2bool, nargs='?',
                                    const=True, default=True, help='Load portal-specific dictionaries (tables)',
@@ -89,19 +154,37 @@ def entrypoint():
                                    nargs='?', const=True, default=True, help='Load portal-specific base TEI XML',
                                    metavar='True/False')
 
+    spdict['cleaner'].add_argument('-s', '--tei-schema', type=str, default=TEI_ALL_SCHEMA_URL,
+                                   help='The RelaxNG schema (URL or local file) to validate the output with '
+                                        f'(default: {TEI_ALL_SCHEMA_URL})', metavar='FILE_OR_URL')
+
+    spdict['cleaner'].add_argument('-S', '--schema-cache-dir', type=str, default=DEFAULT_SCHEMA_CACHE_DIR,
+                                   help='The directory to cache the downloaded schema in '
+                                        f'(default: {DEFAULT_SCHEMA_CACHE_DIR})', metavar='DIR')
+
     spdict['inventory-maker'].add_argument('-t', '--task-name', type=str, default='Tag Inventory Maker',
                                            help='The name of the task to appear in the logs', metavar='TASK_NAME')
     spdict['inventory-maker'].add_argument('-r', '--recursive', type=str2bool, nargs='?', const=True, default=True,
                                            help='Use just direct descendants or all', metavar='True/False')
+    spdict['inventory-maker'].add_argument('-u', '--url-sample-size', type=int, default=5,
+                                           help='The number of example URLs (sampled uniformly) for each tag',
+                                           metavar='N')
 
     spdict['bigram-maker'].add_argument('-t', '--task-name', type=str, default='Tag Bigrams Maker',
                                         help='The name of the task to appear in the logs', metavar='TASK_NAME')
     spdict['bigram-maker'].add_argument('-r', '--recursive', type=str2bool, nargs='?', const=True, default=True,
                                         help='Use just direct descendants or all', metavar='True/False')
+    spdict['bigram-maker'].add_argument('-u', '--url-sample-size', type=int, default=5,
+                                        help='The number of example URLs (sampled uniformly) for each tag', metavar='N')
 
     spdict['content-tree'].add_argument('-t', '--task-name', type=str, default='HTML Content Tree',
                                         help='The name of the task to appear in the logs', metavar='TASK_NAME')
 
+    # The articles are summarized in parallel (map-reduce) in these modes as well
+    for cmd in ('inventory-maker', 'bigram-maker', 'content-tree'):
+        for _, (args, kwargs) in parallel_params.items():
+            spdict[cmd].add_argument(*args, **kwargs)
+
     # A totally different subparser
     p = subparsers.add_parser('diff-tables', help='Diff Tag Tables')
     p.add_argument('--diff-dir', type=str, help='The directory which contains the directories', metavar='DIR',
@@ -2,15 +2,14 @@
 # -*- coding: utf-8, vim: expandtab:ts=4 -*
 
 import copy
-from bs4 import BeautifulSoup
 from bs4.element import NavigableString, Tag, Comment
 
 from ..basic_tag_dicts import *
 from ..correctors.link_corrector import link_corrector
 from ..correctors.unicode_error import unicode_test, article_encoding_correction
 from ..tei_utils import immediate_text, imtext_children_descendants_of_tag, to_friendly, \
-    real_text_length, language_attr_recognition, complex_wrapping, normal_tag_to_tei_xml_converter, unwrap_all, \
-    decompose_all, complex_wrapping_for_news_feed
+    real_text_length, real_text_lengths, language_attr_recognition, complex_wrapping, normal_tag_to_tei_xml_converter, \
+    unwrap_all, decompose_all, complex_wrapping_for_news_feed
 
 TABLE_CELL = {'oszlop', 'tablazat_cimsor'}
 
@@ -23,20 +22,47 @@ PARAGRAPH_AND_INLINES = ({'bekezdes'} | INLINE_TAGS)
 
 
 # Only process_article is used outside of this file
+#  (and copy_article_body_root, prepare_article_body and convert_article_body by eltedh_lxml_abc)
 
 def process_article(article_page_tups, tei_logger, spec_get_meta_fun, spec_body_params):
     """It executes our own metadata extraction and text extraction, normalization,
-        TEI to XML conversion method per URL"""
-    (one_url, warc_response_datetime, warc_id, raw_html) = article_page_tups
-    bs = BeautifulSoup(raw_html, 'lxml')
+        TEI to XML conversion method per URL
+       The already parsed HTML is used: the article body is converted on a copy of its subtree
+        as the portal-specific get_meta function is allowed to modify the parsed document
+    """
+    (one_url, warc_response_datetime, warc_id, raw_html, bs) = article_page_tups
+    article = copy_article_body_root(bs, spec_body_params[0])
     meta = spec_get_meta_fun(tei_logger, one_url, bs)
     if meta is not None:
-        converted_body_list = article_body_converter(tei_logger, one_url, raw_html, spec_body_params)
+        converted_body_list = article_body_converter(tei_logger, one_url, bs, article, spec_body_params)
         return meta, converted_body_list
     else:
         return None, None
 
 
+def copy_article_body_root(bs, article_roots):
+    """Find the first matching article body root in the parsed document and return its copy
+        (with normalised line breaks) or None if there is no matching root
+    """
+    for args, kwargs in article_roots:
+        article = bs.find(*args, **kwargs)
+        if article is not None:
+            article = copy.copy(article)  # Copies the subtree without reparsing it
+            normalise_line_breaks(article)
+            return article
+    return None
+
+
+def normalise_line_breaks(article):
+    """Replace the bare <br> tags with a space (formerly done on the raw HTML before parsing)
+        and merge the adjacent strings created by the replacement
+    """
+    for br in article.find_all('br'):
+        if len(br.attrs) == 0:
+            br.replace_with(' ')
+    article.smooth()
+
+
 def correct_and_store_link(tag, link, portal_url_prefix, portal_url_filter, extra_key, article_url):
     """This function stores the result of link_corrector in tag.
        The input links can be:
@@ -61,14 +87,11 @@ def tag_freezer(bs_tag, excluded_tags_fun, link_attrs):
     """This function produces the dictionary form of the current tag.
        It simplifies the different parts of the attributes, with merging the irrelevant variations of values
     """
-    if bs_tag.name in link_attrs or language_attr_recognition(bs_tag) is not None:
-        # When it has attributes to be preserved, which were marked in the configuration
-        f_attrs = copy.deepcopy(bs_tag.attrs)
-        tag_exl = to_friendly(bs_tag, excluded_tags_fun)
-        bs_tag.attrs = f_attrs
-    else:  # No attributes are preserved
-        tag_exl = to_friendly(bs_tag, excluded_tags_fun)
-        bs_tag.attrs.clear()
+    # The attributes to be preserved, which were marked in the configuration, are kept
+    preserve_attrs = bs_tag.name in link_attrs or language_attr_recognition(bs_tag) is not None
+    tag_exl = to_friendly(bs_tag, excluded_tags_fun, keep_attrs=True)
+    if not preserve_attrs:  # No attributes are preserved
+        bs_tag.attrs = {}
     return tag_exl
 
 
@@ -76,7 +99,7 @@ def disambiguate_table_or_frame(article, article_url, tei_logger):
     """This function disambiguates if selected tags are real tables or just frames/boxes (a typical use in HTML)
         based on the proportion of rows and columns in table tag
     """
-    tei_logger.log('DEBUG', f'disambiguate_table_or_frame in {article_url}')
+    tei_logger.log('DEBUG', 'disambiguate_table_or_frame in', article_url)
     for tag in article.find_all('table_text'):
         cell, row = 0, 0
         for table_c in tag.find_all():
@@ -100,17 +123,17 @@ def rename_by_bigram_rules(article, change_by_bigram, article_url, tei_logger):
        c) det_by_any_child: Rename it, if the second member of bigram is one of its children
        b) det_by_any_desc: Rename it, if the second member of bigram is one of its descendants
         (this is the most permissive condition)
+       The rules are compiled when the config is loaded (see read_config.compile_bigram_rules)
     """
-    tei_logger.log('DEBUG', f'rename_by_bigram_rules in {article_url}')
+    tei_logger.log('DEBUG', 'rename_by_bigram_rules in', article_url)
     for tag in reversed(article.find_all(change_by_bigram.keys())):
         # The structures (which could be recursive) can be handled safely from the inside out (hence reversed).
         #  Iterating from the outside to the inside crosses the boundaries of the levels
         naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(tag)
-        # The inner dictionary's key is a tuple of second_tag_part and case
-        second_tags_of_bigram = {tup[0] for tup in change_by_bigram[tag.name].keys()}
+        # The set of the second tags and the rules: tuples of second_tag_part, case and the new names
+        second_tags_of_bigram, bigram_rules = change_by_bigram[tag.name]
         if len(desc_tags & second_tags_of_bigram) > 0:
-            for second_part_tag, case in change_by_bigram[tag.name].keys():
-                parent_level_name, child_level_name = change_by_bigram[tag.name][(second_part_tag, case)]
+            for second_part_tag, case, parent_level_name, child_level_name in bigram_rules:
                 if second_part_tag in desc_tags and case == 'det_by_any_desc':
                     # https://www.nnk.gov.hu/index.php/koronavirus-tajekoztato/660-munkasszallok-mukodesere-vonatkozo
                     # -kozegeszsegugyi-jarvanyugyi-szabalyok table tag under attachment has no mean
@@ -132,10 +155,10 @@ def rename_by_bigram_rules(article, change_by_bigram, article_url, tei_logger):
                     tag.name = parent_level_name
                     break
         else:
-            if any(st in tag.text for st in second_tags_of_bigram):
-                for second_part_tag, case in change_by_bigram[tag.name].keys():
-                    parent_level_name, child_level_name = change_by_bigram[tag.name][(second_part_tag, case)]
-                    if case == 'det_by_string' and second_part_tag in tag.text:
+            tag_text = tag.text  # Computed only once as it walks the whole subtree
+            if any(st in tag_text for st in second_tags_of_bigram):
+                for second_part_tag, case, parent_level_name, child_level_name in bigram_rules:
+                    if case == 'det_by_string' and second_part_tag in tag_text:
                         tag.name = parent_level_name
                         break
 
@@ -144,12 +167,15 @@ def block_specific_renaming(article, block_dict, article_url, tei_logger):
     """Within special ("block") structures, some members must be given a different name.
        Mainly because of TEI rules
     """
-    tei_logger.log('DEBUG', f'block_specific_renaming in {article_url}')
-    for block_root in reversed(article.find_all(BLOCKS)):
-        # The structures (which could be recursive) can be handled safely from the inside out (hence reversed).
-        #  Iterating from the outside to the inside crosses the boundaries of the levels
-        block_root_name = block_root.name
-        if block_dict[block_root_name]['rename'].keys():
+    tei_logger.log('DEBUG', 'block_specific_renaming in', article_url)
+    # Only the blocks having renaming rules are visited
+    #  (the names of the roots do not change before they are visited as only their descendants are renamed)
+    renaming_blocks = [block_name for block_name in BLOCKS if len(block_dict[block_name]['rename']) > 0]
+    if len(renaming_blocks) > 0:
+        for block_root in reversed(article.find_all(renaming_blocks)):
+            # The structures (which could be recursive) can be handled safely from the inside out (hence reversed).
+            #  Iterating from the outside to the inside crosses the boundaries of the levels
+            block_root_name = block_root.name
             for descendant_tag in block_root.find_all():
                 child_tagname = descendant_tag.name
                 if descendant_tag.child_tagname in BLOCKS and descendant_tag.name != 'cimsor':
@@ -170,13 +196,15 @@ def block_specific_curation_of_internal_structure(article, block_dict, article_u
         occurrence is valid, or one excludes the interpretation of the other.
        At the same time the rules required by the TEI
     """
-    tei_logger.log('DEBUG', f'rename_by_bigram_rules in {article_url}')
+    tei_logger.log('DEBUG', 'rename_by_bigram_rules in', article_url)
+    # Unwrapping does not change the text of the blocks in the tree, so it is computed only once for each block
+    block_texts = {}
     for tag in article.find_all(BLOCKS):
         tag_name = tag.name
-        tag_text = tag.text.strip()
+        tag_text = block_text(tag, block_texts)
         # Block in block
         for tag_descendant in tag.find_all(BLOCKS):
-            ch_text = tag_descendant.text.strip()
+            ch_text = block_text(tag_descendant, block_texts)
             if tag_name == tag_descendant.name and tag_text == ch_text:
                 # Double root
                 tag_descendant.unwrap()
@@ -191,6 +219,15 @@ def block_specific_curation_of_internal_structure(article, block_dict, article_u
                     tag.name = 'to_unwrap'
 
 
+def block_text(tag, block_texts):
+    """Helper function to block_specific_curation_of_internal_structure: the stripped text of the block (cached)"""
+    tag_text = block_texts.get(id(tag))
+    if tag_text is None:
+        tag_text = tag.text.strip()
+        block_texts[id(tag)] = tag_text
+    return tag_text
+
+
 def block_structure(article, bs, block_dict, article_url, tei_logger):
     """Arranges the internal structure of the block for a uniform structure.
        Checks to see if the expected division units are at the level below the root.
@@ -198,7 +235,7 @@ def block_structure(article, bs, block_dict, article_url, tei_logger):
         an equivalent label (not a formatting label or a text without a wrapper).
        The complex wrapper is able to concatenate and package texts and formatting labels
     """
-    tei_logger.log('DEBUG', f'block_structure in {article_url}')
+    tei_logger.log('DEBUG', 'block_structure in', article_url)
     for block_tag in article.find_all(BLOCKS_MINUS_CIMSOR):
         default_child_name = block_dict[block_tag.name]['default']
         complex_wrapping(bs, block_tag, default_child_name, article_url, tei_logger)
@@ -211,7 +248,7 @@ def block_structure(article, bs, block_dict, article_url, tei_logger):
 
 def correct_table_structure(article, bs, article_url, tei_logger):
     """Corrects tables inherited from HTML that are corrupted or incomplete in structure"""
-    tei_logger.log('DEBUG', f'correct_table_structure in {article_url}')
+    tei_logger.log('DEBUG', 'correct_table_structure in', article_url)
     for tab in article.find_all('table_text'):
         for table_root_direct_child in tab.find_all(recursive=False):
             if table_root_direct_child.name not in TABLES_VALID:  # Non table-member
@@ -259,7 +296,7 @@ def deal_with_paragraphs(article, article_url, tei_logger):
         contain each other.
        In these cases, it must be decided which levels can be omitted for the TEI to be valid
     """
-    tei_logger.log('DEBUG', f'deal_with_paragraphs in {article_url}')
+    tei_logger.log('DEBUG', 'deal_with_paragraphs in', article_url)
     for p_tag in article.find_all('bekezdes'):
         p_naked_text, p_child_tags, p_desc_tags = imtext_children_descendants_of_tag(p_tag)
         if len(p_child_tags & PARAGRAPH_LIKE_TAGS) > 0 or (not p_naked_text and len(p_child_tags & INLINE_TAGS) == 0):
@@ -283,7 +320,7 @@ def handling_unnecessary_wrappers(article, article_url, tei_logger):
         - Interprets the levels inherited from HTML
         - Finds which level is redundant, or can be omitted for a clear structure free of duplication
     """
-    tei_logger.log('DEBUG', f'unnecessary_wrappers in {article_url}')
+    tei_logger.log('DEBUG', 'unnecessary_wrappers in', article_url)
     for a_tag in article.find_all(name=lambda x: x.name not in BLOCKS):
         naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(a_tag)
         if len(child_tags) == 1 and a_tag.name in child_tags:
@@ -391,13 +428,13 @@ def isempty_figures_and_galleries(article, article_url, tei_logger):
     for social_figure in article.find_all(MEDIA_MINUS_FIG):
         ref_tags = [c.name for c in social_figure.find_all(lambda tag: tag.has_attr('target'))]
         if real_text_length(social_figure) == 0 and len(ref_tags) == 0 and not social_figure.has_attr('target'):
-            tei_logger.log('DEBUG', f'{article_url}: EMPTY SOCIAL MEDIA CONTENT OR FIGURE {social_figure}')
+            tei_logger.log('DEBUG', f'{article_url}: EMPTY SOCIAL MEDIA CONTENT OR FIGURE', social_figure)
             social_figure.decompose()
 
 
 def correct_lists(bs, l_article, article_url, tei_logger):
     """This function corrects irregular lists which was inherited from HTML"""
-    tei_logger.log('DEBUG', f'correct_lists in {article_url}')
+    tei_logger.log('DEBUG', 'correct_lists in', article_url)
     for li in l_article.find_all('item'):
         if li.parent.name != 'list':
             missing_root_replacement(bs, 'item', True, 'list', l_article)
@@ -413,7 +450,7 @@ def prepare_tei_body(art_child_tags, art_naked_text, article, bs, article_url, t
         with using a list of subtrees as output)
     """
 
-    tei_logger.log('DEBUG', f'prepare_tei_body in {article_url}')
+    tei_logger.log('DEBUG', 'prepare_tei_body in', article_url)
     tei_body_contents_list = []
     if art_naked_text or len(INLINE_TAGS & art_child_tags) > 0:
         concatenated_naked_and_freetag = ''
@@ -475,11 +512,13 @@ def normal_tag_names_by_dict_new(article, bs, excluded_tags_fun, tag_normal_dict
     """This function generates the dictionary form of the tags, retrieves its normalized name from the dictionary,
         and then performs the renaming and other specific operations accordingly
     """
+    # Only wrapping and renaming is done here, so the lengths of the text of the tags do not change
+    text_lengths = real_text_lengths(article)
     for tag in article.find_all():
         tag_exl = tag_freezer(tag, excluded_tags_fun, link_attrs)
         if tag_exl in tag_normal_dict.keys():
             # Look up the normalised name for the tag and return it with the attributes to be retained if there are any
-            normalized_name, extra_key = tag_normal_dict[tag_exl].split('\t', maxsplit=2)
+            normalized_name, extra_key = tag_normal_dict[tag_exl]
             if normalized_name in UNUSED_TAGS:
                 tag.name = 'to_unwrap'
             elif normalized_name in BLOCKS or normalized_name == 'szakasz':
@@ -501,9 +540,9 @@ def normal_tag_names_by_dict_new(article, bs, excluded_tags_fun, tag_normal_dict
                         correct_and_store_link(tag, href, url_prefix, portal_url_filter, extra_key, article_url)
                         if normalized_name == 'media_hivatkozas' and 'target' not in tag.attrs:
                             tag.name = 'to_unwrap'
-            if tag.name == 'social_media' and len(tag.text.strip()) == 0:
+            if tag.name == 'social_media' and text_lengths[id(tag)] == 0:
                 tag.name = 'beagyazott_social'
-            if len(tag.text.strip()) == 0 and tag.name not in TEMPORARILY_USED_TAGS \
+            if text_lengths[id(tag)] == 0 and tag.name not in TEMPORARILY_USED_TAGS \
                     and tag.name not in MEDIA_DICT.keys() and tag.name not in USED_NOTEXT_TAGS \
                     and tag.name not in link_attrs and tag.name != 'to_decompose':
                 tag.name = 'to_unwrap'  # Tags that only currently do not contain text
@@ -513,39 +552,64 @@ def normal_tag_names_by_dict_new(article, bs, excluded_tags_fun, tag_normal_dict
             tag.name = 'to_unwrap'
 
 
-def article_body_converter(tei_logger, article_url, raw_html, spec_params):
-    """This function cleans and converts HTML content into a valid TEI XML"""
-    article_roots, decompose_fun, excluded_tags_fun, tag_normal_dict, link_attrs, block_dict, change_by_bigram, \
-        portal_url_prefix, portal_url_filter = spec_params
-    raw_html = raw_html.replace('<br>', ' ')
-    bs = BeautifulSoup(raw_html, 'lxml')
-    for args, kwargs in article_roots:
-        article = bs.find(*args, **kwargs)
-        if article is not None:
-            break
-    else:
+def resolve_marked_tags(article, with_sections=False):
+    """Decompose the tags marked with to_decompose and unwrap the tags marked with to_unwrap (and resolve the sections:
+        the ones with immediate text are paragraphs, the others are unwrapped) in one traversal.
+       In document order it gives the same tree as handling the sections, then decompose_all and unwrap_all:
+        the tags in the decomposed subtrees are skipped and the children of a tag are not changed
+        before it is visited
+    """
+    tag_names = ['to_decompose', 'to_unwrap', 'szakasz'] if with_sections else ['to_decompose', 'to_unwrap']
+    decomposed = set()  # The ids of the marked tags in the decomposed subtrees
+    for tag in article.find_all(tag_names):
+        if id(tag) in decomposed:
+            continue
+        if tag.name == 'to_decompose':
+            decomposed.update(id(desc) for desc in tag.find_all(tag_names))
+            tag.decompose()
+        elif tag.name == 'to_unwrap':
+            tag.unwrap()
+        elif immediate_text(tag) > 0:  # Section
+            tag.name = 'bekezdes'
+        else:
+            tag.unwrap()
+
+
+def article_body_converter(tei_logger, article_url, bs, article, spec_params):
+    """This function cleans and converts HTML content into a valid TEI XML
+        (article is the copy of the article body root from the parsed document: bs, see copy_article_body_root)
+    """
+    if article is None:
         tei_logger.log('WARNING', f'{article_url} ARTICLE BODY ROOT NOT FOUND!')
         return None
+    article = prepare_article_body(tei_logger, article_url, article, spec_params[1])
+    return convert_article_body(tei_logger, article_url, bs, article, spec_params)
+
+
+def prepare_article_body(tei_logger, article_url, article, decompose_fun):
+    """Correct the encoding of the article body if needed, then remove the subtrees to be decomposed
+        (portal-specific) and the comments
+    """
     if unicode_test(article.text) > 25 or article.text.count("00e1") > 10:
         # These two numbers are an approximation to separate normal coded and faulty items.
         article = article_encoding_correction(article, decompose_fun)
         tei_logger.log('WARNING', f'{article_url} BAD ENCODING (ARTICLE BODY)!')
     decompose_fun(article)
-    for element in article(text=lambda text: isinstance(text, Comment)):
+    for element in article.find_all(string=lambda text: isinstance(text, Comment)):
         element.extract()  # Delete the Comments
+    return article
+
+
+def convert_article_body(tei_logger, article_url, bs, article, spec_params):
+    """Convert the prepared article body (see prepare_article_body) to the list of the TEI subtrees of the body"""
+    _, _, excluded_tags_fun, tag_normal_dict, link_attrs, block_dict, change_by_bigram, \
+        portal_url_prefix, portal_url_filter = spec_params
     # 1) Renaming based on manually evaluated tag table(dictionary)
     normal_tag_names_by_dict_new(article, bs, excluded_tags_fun, tag_normal_dict, link_attrs, portal_url_prefix,
                                  portal_url_filter, article_url, tei_logger)
 
-    for un_tag in article.find_all('szakasz'):
-        if immediate_text(un_tag) > 0:
-            un_tag.name = 'bekezdes'
-        else:
-            un_tag.unwrap()
-
-    # Decompose/unwrap
-    decompose_all(article, 'to_decompose')
-    unwrap_all(article, 'to_unwrap')
+    # Sections and decompose/unwrap
+    resolve_marked_tags(article, with_sections=True)
 
     # 2) BIGRAM RULES
     if len(change_by_bigram) > 0:
@@ -558,15 +622,16 @@ def article_body_converter(tei_logger, article_url, raw_html, spec_params):
     block_specific_renaming(article, block_dict, article_url, tei_logger)
 
     # Decompose/unwrap
-    decompose_all(article, 'to_decompose')
-    unwrap_all(article, 'to_unwrap')
+    resolve_marked_tags(article)
 
     # 5) Media
     handling_media_blocks_attrs_and_tags(article_url, article, tei_logger)
 
     # 6) Cleaning: Delete tags that do not contain text and are used temporarily
+    #  (unwrapping does not change the lengths of the text of the tags remaining in the tree)
+    text_lengths = real_text_lengths(article)
     for tag in article.find_all():
-        if len(tag.text.strip()) == 0 and tag.name not in USED_NOTEXT_TAGS and tag.name not in link_attrs:
+        if text_lengths[id(tag)] == 0 and tag.name not in USED_NOTEXT_TAGS and tag.name not in link_attrs:
             tag.unwrap()
         if tag.name not in OUR_BUILTIN_TAGS:
             tag.name = 'to_unwrap'
@@ -0,0 +1,1068 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*
+
+from bs4.element import NavigableString, Tag
+from lxml import etree
+
+from ..basic_tag_dicts import *
+from ..correctors.link_corrector import link_corrector
+from ..tei_utils import to_friendly, language_attr_recognition, XML_NAMESPACE
+from .eltedh_abc import TABLE_CELL, BLOCKS_MINUS_CIMSOR, MEDIA_MINUS_FIG, UNUSED_TAGS, TABLES_VALID, \
+    PARAGRAPH_AND_INLINES, copy_article_body_root, prepare_article_body, convert_article_body
+
+# The same pipeline as eltedh_abc on lxml elements producing the same output:
+#  - The article body is converted to lxml after the portal-specific decomposing (prepare_article_body)
+#     computing the dictionary form of the tags (tag_freezer) on the BeautifulSoup tags
+#  - The text and tail of the elements contain the strings which are separate NavigableStrings in BeautifulSoup
+#     (e.g. after unwrapping a tag) separated by STRING_SEPARATOR, as the output depends on them
+#     (e.g. complex_wrapping drops the whitespace-only strings, prettify() prints them in separate lines)
+#  - The elements are named after step 1) only, until then they are UNNAMED (HTML names are not valid XML names)
+#  - The subtrees of the body are converted back to BeautifulSoup tags for tei_writer
+#  - If the article can not be converted (e.g. it contains strings which are not XML compatible) the BeautifulSoup
+#     implementation processes it (raise ValueError to fall back), the fallbacks are logged with FALLBACK_MESSAGE
+
+STRING_SEPARATOR = '\ufdd0'  # Noncharacter (it is not expected in the input, but allowed in XML)
+UNNAMED = 'unnamed'
+FALLBACK_MESSAGE = 'CONVERTING THE ARTICLE WITH THE BEAUTIFULSOUP IMPLEMENTATION (eltedh)'
+XML_LANG = f'{{{XML_NAMESPACE}}}lang'
+
+# Only process_article is used outside of this file
+
+
+def process_article(article_page_tups, tei_logger, spec_get_meta_fun, spec_body_params):
+    """It executes our own metadata extraction and text extraction, normalization,
+        TEI to XML conversion method per URL (see eltedh_abc.process_article)
+    """
+    (one_url, warc_response_datetime, warc_id, raw_html, bs) = article_page_tups
+    article = copy_article_body_root(bs, spec_body_params[0])
+    meta = spec_get_meta_fun(tei_logger, one_url, bs)
+    if meta is not None:
+        converted_body_list = article_body_converter(tei_logger, one_url, bs, article, spec_body_params)
+        return meta, converted_body_list
+    else:
+        return None, None
+
+
+class BufferedLogger:
+    """Store the log messages (see Logger.log) until they are replayed into the real logger"""
+    def __init__(self):
+        self._messages = []
+
+    def log(self, *args, **kwargs):
+        self._messages.append((args, kwargs))
+
+    def replay(self, logger):
+        for args, kwargs in self._messages:
+            logger.log(*args, **kwargs)
+
+
+def join_strings(first, second):
+    """Concatenate two strings (text or tail) keeping them separate (None means no string)"""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return f'{first}{STRING_SEPARATOR}{second}'
+
+
+def split_strings(text):
+    """The separate strings of a text or tail"""
+    if text is None:
+        return []
+    return text.split(STRING_SEPARATOR)
+
+
+def is_blank(text):
+    return text is None or len(text.replace(STRING_SEPARATOR, '').strip()) == 0
+
+
+def text_of(tag):
+    """The text of the element like tag.text in BeautifulSoup"""
+    return etree.tostring(tag, method='text', encoding=str, with_tail=False).replace(STRING_SEPARATOR, '')
+
+
+def real_text_length(tag):
+    """This function counts non-whitespace characters in text under the parameter tag recursively!"""
+    return sum(int(not i.isspace()) for i in text_of(tag))
+
+
+def non_whitespace_length(text):
+    if text is None:
+        return 0
+    return sum(int(not i.isspace()) for i in text) - text.count(STRING_SEPARATOR)
+
+
+def real_text_lengths(root):
+    """This function computes real_text_length for the root and all of its descendants in one bottom-up pass
+        (see tei_utils.real_text_lengths)
+    """
+    lengths = {}
+    # Reversed document order: the children are processed before their parent
+    for tag in reversed([root, *root.iterdescendants()]):
+        length = non_whitespace_length(tag.text)
+        for child in tag:
+            length += lengths[child] + non_whitespace_length(child.tail)
+        lengths[tag] = length
+    return lengths
+
+
+def contents_of(tag):
+    """The list of the children of the element including the strings like tag.contents in BeautifulSoup"""
+    contents = split_strings(tag.text)
+    for child in tag:
+        contents.append(child)
+        contents.extend(split_strings(child.tail))
+    return contents
+
+
+def set_contents(tag, contents):
+    """Replace the children of the element with the list of elements and strings (see contents_of)"""
+    del tag[:]
+    tag.text = None
+    last = None
+    for node in contents:
+        if isinstance(node, str):
+            if last is None:
+                tag.text = join_strings(tag.text, node)
+            else:
+                last.tail = join_strings(last.tail, node)
+        else:
+            node.tail = None
+            tag.append(node)
+            last = node
+
+
+def append_node(tag, node):
+    """Append an element or a string to the element"""
+    last = next(tag.iterchildren(reversed=True), None)
+    if not isinstance(node, str):
+        node.tail = None
+        tag.append(node)
+    elif last is None:
+        tag.text = join_strings(tag.text, node)
+    else:
+        last.tail = join_strings(last.tail, node)
+
+
+def extract(tag):
+    """Remove the element from the tree keeping its tail in place like tag.extract() in BeautifulSoup"""
+    parent = tag.getparent()
+    if parent is None:
+        return
+    previous = tag.getprevious()
+    if previous is None:
+        parent.text = join_strings(parent.text, tag.tail)
+    else:
+        previous.tail = join_strings(previous.tail, tag.tail)
+    tag.tail = None
+    parent.remove(tag)
+
+
+def unwrap(tag):
+    """Replace the element with its contents like tag.unwrap() in BeautifulSoup"""
+    parent = tag.getparent()
+    if parent is None:  # BeautifulSoup fails here too
+        raise ValueError('Unwrapping a detached element')
+    previous = tag.getprevious()
+    children = list(tag)
+    head = tag.text
+    if len(children) > 0:
+        children[-1].tail = join_strings(children[-1].tail, tag.tail)
+    else:
+        head = join_strings(head, tag.tail)
+    if previous is None:
+        parent.text = join_strings(parent.text, head)
+    else:
+        previous.tail = join_strings(previous.tail, head)
+    tag.text, tag.tail = None, None
+    index = parent.index(tag)
+    parent[index:index + 1] = children
+
+
+def wrap(tag, wrapper):
+    """Put the element into the (new) wrapper element in place like tag.wrap() in BeautifulSoup"""
+    wrapper.tail, tag.tail = tag.tail, None
+    tag.addprevious(wrapper)
+    wrapper.append(tag)
+    return wrapper
+
+
+def set_attributes(tag, attrs):
+    """Replace the attributes of the element with the dictionary (like tag.attrs = attrs in BeautifulSoup)"""
+    tag.attrib.clear()
+    for key, value in attrs.items():
+        if key == 'xml:lang':
+            key = XML_LANG
+        tag.set(key, value)
+
+
+def attributes_of(tag):
+    """The attributes of the element as a dictionary (like tag.attrs in BeautifulSoup)"""
+    return {('xml:lang' if key == XML_LANG else key): value for key, value in tag.attrib.items()}
+
+
+def new_tag(tag_name, attrs=None):
+    tag = etree.Element(tag_name)
+    if attrs is not None:
+        set_attributes(tag, attrs)
+    return tag
+
+
+def unwrap_all(article, tag_name):
+    for tag in list(article.iterdescendants(tag_name)):
+        unwrap(tag)
+
+
+def decompose_all(article, tag_name):
+    for tag in list(article.iterdescendants(tag_name)):
+        extract(tag)
+
+
+def has_immediate_text(tag):
+    """Whether there are words (non-whitespace text) immediately under the parameter tag (immediate_text() > 0)"""
+    return not is_blank(tag.text) or any(not is_blank(child.tail) for child in tag)
+
+
+def imtext_children_descendants_of_tag(tag):
+    """This function return the following information on the parameter tag:
+        1. Whether there are words (non-whitespace text) immediately below the tag
+        2. The names of direct children
+        3. The names of all descendant tags
+    """
+    naked_text = has_immediate_text(tag)
+    child_tags = {c.tag for c in tag}
+    descendants_tags = {c.tag for c in tag.iterdescendants()}
+    return naked_text, child_tags, descendants_tags
+
+
+def markup(tag, bs, void_elements):
+    """The markup of the element for logging: str(tag) of the BeautifulSoup tag (with its empty elements)"""
+    return str(etree_to_bs4(tag, bs, void_elements))
+
+
+def article_to_etree(article, excluded_tags_fun, link_attrs):
+    """Convert the prepared BeautifulSoup article body to an lxml element with UNNAMED elements and
+        return it with the dictionary form (see eltedh_abc.tag_freezer) and the attributes to be preserved of the tags
+        in document order (as tag.find_all() returns them) and the set of elements which can be empty elements
+       The BeautifulSoup article is not modified (the excluded tags functions modify copies of the attributes),
+        therefore it can be processed by the BeautifulSoup implementation if this one fails
+       Raises ValueError if the article can not be converted
+    """
+    root = etree.Element(UNNAMED)
+    frozen_tags, void_elements = [], set()
+    stack = [(article, root)]
+    # The tree is traversed without recursion as the nesting of the articles can be arbitrarily deep
+    while len(stack) > 0:
+        tag, element = stack.pop()
+        if tag is not article:
+            frozen_tags.append((element, *freeze_tag(tag, excluded_tags_fun, link_attrs)))
+        if tag.can_be_empty_element:
+            void_elements.add(element)
+        if tag.interesting_string_types != Tag.MAIN_CONTENT_STRING_TYPES:
+            raise ValueError(f'Tag with special strings: {tag.name}')
+        last, children = None, []
+        for child in tag.contents:
+            if isinstance(child, Tag):
+                last = etree.SubElement(element, UNNAMED)
+                children.append((child, last))
+            elif type(child) is not NavigableString or STRING_SEPARATOR in child:
+                raise ValueError(f'Special string: {type(child).__name__}')
+            elif last is None:
+                element.text = join_strings(element.text, child)
+            else:
+                last.tail = join_strings(last.tail, child)
+        stack.extend(reversed(children))  # Document order
+    return root, frozen_tags, void_elements
+
+
+def freeze_tag(tag, excluded_tags_fun, link_attrs):
+    """This function produces the dictionary form of the current tag (like eltedh_abc.tag_freezer)
+        and returns it with the name, the attributes to be preserved and the language of the tag
+    """
+    lang = language_attr_recognition(tag)
+    if tag.name in link_attrs or lang is not None:
+        # When it has attributes to be preserved, which were marked in the configuration
+        attrs = tag.attrs
+        if any(STRING_SEPARATOR in value for value in attrs.values() if isinstance(value, str)):
+            raise ValueError('Special attribute value')
+    else:  # No attributes are preserved
+        attrs = {}
+    tag_exl = to_friendly(tag, excluded_tags_fun, keep_attrs=True)
+    return tag.name, attrs, lang, tag_exl
+
+
+def etree_to_bs4(element, bs, void_elements):
+    """Convert the (converted) lxml element to a BeautifulSoup tag with the separate strings and empty elements
+        of the BeautifulSoup implementation
+    """
+    root = new_bs4_tag(element, bs, void_elements)
+    stack = [(element, root)]
+    while len(stack) > 0:
+        element, tag = stack.pop()
+        for string in split_strings(element.text):
+            tag.append(NavigableString(string))
+        for child in element:
+            child_tag = new_bs4_tag(child, bs, void_elements)
+            tag.append(child_tag)
+            stack.append((child, child_tag))
+            for string in split_strings(child.tail):
+                tag.append(NavigableString(string))
+    return root
+
+
+def new_bs4_tag(element, bs, void_elements):
+    tag = bs.new_tag(element.tag, attrs=attributes_of(element))
+    tag.can_be_empty_element = element in void_elements
+    return tag
+
+
+def link_attributes(link, portal_url_prefix, portal_url_filter, extra_key, article_url):
+    """This function returns the attributes storing the result of link_corrector
+        (see eltedh_abc.correct_and_store_link)
+    """
+    link = link.strip()
+    link_original = link
+    link_new = link_corrector(link, portal_url_prefix, portal_url_filter, extra_key, article_url)
+    if link_new is None:
+        return {'original': link_original}
+    elif link_original != link_new:
+        return {'target': link_new, 'original': link_original}
+    else:
+        return {'target': link_original}
+
+
+def select_attributes_to_preserve(tag_name, attrs, lang, extra_k, article_url, tei_logger):
+    """Select attributes which was marked in the dictionary as attributes to keep"""
+    relevant_attrs = {}
+    if extra_k != 'default':
+        if extra_k in attrs.keys():
+            relevant_attrs['target'] = attrs[extra_k]
+        else:
+            tei_logger.log('WARNING', f'{article_url}: ATTRIBUTE KEY IS NOT IN THE ATTRIBUTES OF THE TAG '
+                                      f'{tag_name} {attrs}, {extra_k}!')
+    elif lang is not None:
+        relevant_attrs['xml:lang'] = lang
+    return relevant_attrs
+
+
+def normal_tag_names_by_dict_new(article, frozen_tags, tag_normal_dict, link_attrs, url_prefix, portal_url_filter,
+                                 article_url, tei_logger):
+    """This function retrieves the normalized name of the tags from the dictionary by their dictionary form,
+        and then performs the renaming and other specific operations accordingly
+    """
+    # Only wrapping and renaming is done here, so the lengths of the text of the tags do not change
+    text_lengths = real_text_lengths(article)
+    for tag, orig_tag_name, attrs, lang, tag_exl in frozen_tags:
+        if tag_exl in tag_normal_dict.keys():
+            # Look up the normalised name for the tag and return it with the attributes to be retained if there are any
+            normalized_name, extra_key = tag_normal_dict[tag_exl]
+            if normalized_name in UNUSED_TAGS:
+                tag.tag = 'to_unwrap'
+            elif normalized_name in BLOCKS or normalized_name == 'szakasz':
+                tag.tag = normalized_name
+            elif normalized_name == 'decompose':
+                tag.tag = 'to_decompose'
+            elif ';' in normalized_name:
+                inner_level, outer_level = normalized_name.split(';', maxsplit=1)
+                wrap(tag, new_tag(outer_level))
+                tag.tag = inner_level
+            else:
+                tag.tag = normalized_name
+                if len(attrs) != 0:
+                    relevant_attrs = select_attributes_to_preserve(orig_tag_name, attrs, lang, extra_key, article_url,
+                                                                   tei_logger)
+                    if 'target' in relevant_attrs.keys():
+                        relevant_attrs = link_attributes(relevant_attrs['target'], url_prefix, portal_url_filter,
+                                                         extra_key, article_url)
+                        if normalized_name == 'media_hivatkozas' and 'target' not in relevant_attrs:
+                            tag.tag = 'to_unwrap'
+                    set_attributes(tag, relevant_attrs)
+            if tag.tag == 'social_media' and text_lengths[tag] == 0:
+                tag.tag = 'beagyazott_social'
+            if text_lengths[tag] == 0 and tag.tag not in TEMPORARILY_USED_TAGS \
+                    and tag.tag not in MEDIA_DICT.keys() and tag.tag not in USED_NOTEXT_TAGS \
+                    and tag.tag not in link_attrs and tag.tag != 'to_decompose':
+                tag.tag = 'to_unwrap'  # Tags that only currently do not contain text
+        else:  # Unrated tags
+            tei_logger.log('WARNING', f'{article_url} The tag is not in the dictionary.'
+                                      f'The dictionary needs to be updated ({orig_tag_name}, {attrs}, {tag_exl})')
+            tag.tag = 'to_unwrap'
+
+
+def disambiguate_table_or_frame(article, article_url, tei_logger):
+    """This function disambiguates if selected tags are real tables or just frames/boxes (a typical use in HTML)
+        based on the proportion of rows and columns in table tag
+    """
+    tei_logger.log('DEBUG', 'disambiguate_table_or_frame in', article_url)
+    for tag in list(article.iterdescendants('table_text')):
+        cell, row = 0, 0
+        for table_c in tag.iterdescendants():
+            if table_c.tag in TABLE_CELL:
+                cell += 1
+            elif table_c.tag == 'sor':
+                row += 1
+            elif table_c.tag == 'table_text':
+                break
+        if cell == row or cell < 2:
+            tag.tag = 'doboz'
+
+
+def rename_by_bigram_rules(article, change_by_bigram, article_url, tei_logger):
+    """You can specify rules to combine two tag (see eltedh_abc.rename_by_bigram_rules)"""
+    tei_logger.log('DEBUG', 'rename_by_bigram_rules in', article_url)
+    for tag in reversed(list(article.iterdescendants(*change_by_bigram.keys()))):
+        # The structures (which could be recursive) can be handled safely from the inside out (hence reversed).
+        #  Iterating from the outside to the inside crosses the boundaries of the levels
+        naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(tag)
+        # The set of the second tags and the rules: tuples of second_tag_part, case and the new names
+        second_tags_of_bigram, bigram_rules = change_by_bigram[tag.tag]
+        if len(desc_tags & second_tags_of_bigram) > 0:
+            for second_part_tag, case, parent_level_name, child_level_name in bigram_rules:
+                if second_part_tag in desc_tags and case == 'det_by_any_desc':
+                    for c in list(tag.iterdescendants(second_part_tag)):
+                        c.tag = child_level_name
+                    tag.tag = parent_level_name
+                    break
+                elif second_part_tag in child_tags and \
+                        (case == 'det_by_any_child' or
+                         (len(child_tags) == 1 and ((not naked_text and case == 'to_merge')
+                                                    or case == 'det_by_child'))):
+                    for c in list(tag.iterchildren(second_part_tag)):
+                        c.tag = child_level_name
+                    tag.tag = parent_level_name
+                    break
+        else:
+            tag_text = text_of(tag)  # Computed only once as it walks the whole subtree
+            if any(st in tag_text for st in second_tags_of_bigram):
+                for second_part_tag, case, parent_level_name, child_level_name in bigram_rules:
+                    if case == 'det_by_string' and second_part_tag in tag_text:
+                        tag.tag = parent_level_name
+                        break
+
+
+def block_specific_renaming(article, block_dict, article_url, tei_logger):
+    """Within special ("block") structures, some members must be given a different name.
+       Mainly because of TEI rules
+    """
+    tei_logger.log('DEBUG', 'block_specific_renaming in', article_url)
+    # Only the blocks having renaming rules are visited (see eltedh_abc.block_specific_renaming)
+    renaming_blocks = [block_name for block_name in BLOCKS if len(block_dict[block_name]['rename']) > 0]
+    if len(renaming_blocks) > 0:
+        for block_root in reversed(list(article.iterdescendants(*renaming_blocks))):
+            # The structures (which could be recursive) can be handled safely from the inside out (hence reversed).
+            #  Iterating from the outside to the inside crosses the boundaries of the levels
+            rename = block_dict[block_root.tag]['rename']
+            # The BeautifulSoup implementation does not stop at the roots of the inner blocks either
+            for descendant_tag in list(block_root.iterdescendants()):
+                child_tagname = descendant_tag.tag
+                if child_tagname in rename.keys():
+                    descendant_tag.tag = rename[child_tagname]
+    for head in list(article.iterdescendants('cimsor')):
+        for head_desc in list(head.iterdescendants()):
+            if head_desc.tag not in INLINE_TAGS:
+                unwrap(head_desc)
+
+
+def block_specific_curation_of_internal_structure(article, block_dict, article_url, tei_logger):
+    """This function sorts the structures when the special blocks contain each other
+        (see eltedh_abc.block_specific_curation_of_internal_structure)
+    """
+    tei_logger.log('DEBUG', 'rename_by_bigram_rules in', article_url)
+    # Unwrapping does not change the text of the blocks in the tree, so it is computed only once for each block
+    block_texts = {}
+    for tag in list(article.iterdescendants(*BLOCKS)):
+        tag_name = tag.tag
+        tag_text = block_text(tag, block_texts)
+        # Block in block
+        for tag_descendant in list(tag.iterdescendants(*BLOCKS)):
+            ch_text = block_text(tag_descendant, block_texts)
+            if tag_name == tag_descendant.tag and tag_text == ch_text:
+                # Double root
+                unwrap(tag_descendant)
+            else:
+                # Invalid structure
+                block_tag_rules_dict = block_dict[tag_name]
+                if tag_descendant.tag in block_tag_rules_dict['not_valid_inner_blocks']:
+                    unwrap(tag_descendant)
+                elif tag_descendant.tag in block_tag_rules_dict['not_valid_as_outer_for']:
+                    tag.tag = 'to_unwrap'
+
+
+def block_text(tag, block_texts):
+    """Helper function to block_specific_curation_of_internal_structure: the stripped text of the block (cached)"""
+    tag_text = block_texts.get(tag)
+    if tag_text is None:
+        tag_text = text_of(tag).strip()
+        block_texts[tag] = tag_text
+    return tag_text
+
+
+def complex_wrapping(root_tag, default_wrapper, article_url, tei_logger):
+    """Wrap the texts and the lower-level tags (concatenated) under the root into the default wrapper tag
+        (see tei_utils.complex_wrapping)
+    """
+    tei_logger.log('DEBUG', 'complex_wrapping in', article_url)
+    naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(root_tag)
+    if child_tags <= INLINE_TAGS and root_tag.tag not in MEDIA_DICT.keys():
+        wrap(root_tag, new_tag(root_tag.tag))
+        root_tag.tag = default_wrapper
+    elif naked_text or len(INLINE_TAGS & child_tags) > 0 or \
+            (child_tags <= INLINE_TAGS and root_tag.tag in MEDIA_DICT.keys()):
+        root_contents = []
+        naked_text_and_inline_tag = None
+        for node in contents_of(root_tag):
+            if (isinstance(node, str) and len(node.strip()) > 0) or \
+                    (not isinstance(node, str) and node.tag in INLINE_TAGS):
+                if naked_text_and_inline_tag is None:
+                    naked_text_and_inline_tag = new_tag(default_wrapper)
+                append_node(naked_text_and_inline_tag, node)
+            elif not isinstance(node, str):
+                if naked_text_and_inline_tag is not None:
+                    root_contents.append(naked_text_and_inline_tag)
+                root_contents.append(node)
+                naked_text_and_inline_tag = None
+        if naked_text_and_inline_tag is not None:
+            root_contents.append(naked_text_and_inline_tag)
+        set_contents(root_tag, root_contents)
+
+
+def complex_wrapping_for_news_feed(article_tag, default_wrapper, article_url, tei_logger):
+    """The feed-type articles should be built up of <div>-s at the level below the root of the article
+        (see tei_utils.complex_wrapping_for_news_feed)
+    """
+    naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(article_tag)
+    if child_tags != {'div'}:
+        tei_logger.log('DEBUG', 'complex_wrapping_for_news_feed in', article_url)
+        root_contents = []
+        naked_text_and_inline_tag = None
+        for node in contents_of(article_tag):
+            if (isinstance(node, str) and len(node.strip()) > 0) or \
+                    (not isinstance(node, str) and node.tag != 'div'):
+                if naked_text_and_inline_tag is None:
+                    naked_text_and_inline_tag = new_tag(default_wrapper)
+                append_node(naked_text_and_inline_tag, node)
+            elif not isinstance(node, str):
+                if naked_text_and_inline_tag is not None:
+                    root_contents.append(naked_text_and_inline_tag)
+                root_contents.append(node)
+                naked_text_and_inline_tag = None
+        if naked_text_and_inline_tag is not None:
+            root_contents.append(naked_text_and_inline_tag)
+        set_contents(article_tag, root_contents)
+        for div_tag in list(article_tag.iterdescendants('div')):
+            #  It calls the general complex wrapping function to check the internal structure of the newly created divs.
+            complex_wrapping(div_tag, 'p', article_url, tei_logger)
+
+
+def block_structure(article, block_dict, article_url, tei_logger):
+    """Arranges the internal structure of the block for a uniform structure (see eltedh_abc.block_structure)"""
+    tei_logger.log('DEBUG', 'block_structure in', article_url)
+    for block_tag in list(article.iterdescendants(*BLOCKS_MINUS_CIMSOR)):
+        default_child_name = block_dict[block_tag.tag]['default']
+        complex_wrapping(block_tag, default_child_name, article_url, tei_logger)
+    for a_list in list(article.iterdescendants('lista')):
+        list_contents = []
+        for list_root_child in contents_of(a_list):
+            if isinstance(list_root_child, str):
+                if len(list_root_child.strip()) > 0:
+                    list_item = new_tag('listaelem')
+                    list_item.text = list_root_child
+                    list_root_child = list_item
+                list_contents.append(list_root_child)
+            elif list_root_child.tag != 'listaelem':
+                list_item = new_tag('listaelem')
+                append_node(list_item, list_root_child)
+                list_contents.append(list_item)
+            else:
+                list_contents.append(list_root_child)
+        set_contents(a_list, list_contents)
+
+
+def correct_table_structure(article, article_url, tei_logger):
+    """Corrects tables inherited from HTML that are corrupted or incomplete in structure"""
+    tei_logger.log('DEBUG', 'correct_table_structure in', article_url)
+    for tab in list(article.iterdescendants('table_text')):
+        for table_root_direct_child in list(tab):
+            if table_root_direct_child.tag not in TABLES_VALID:  # Non table-member
+                unwrap(table_root_direct_child)
+        for table_root_direct_child in list(tab):
+            if table_root_direct_child.tag == 'sor_valid' and \
+                    next(table_root_direct_child.iterchildren('oszlop_valid'), None) is None:
+                # No column in the row, so we make an 1×1 field
+                table_root_direct_child.tag = 'oszlop_sor'
+    for tab in list(article.iterdescendants('table_text')):
+        # No row around columns
+        if next(tab.iterchildren('oszlop_valid'), None) is not None:
+            missing_root_replacement('oszlop_valid', False, 'sor_valid', tab)
+        unwrap_all(tab, 'bekezdes')
+        for row in list(tab.iterdescendants('sor_valid')):
+            if has_immediate_text(row):
+                complex_wrapping(row, 'oszlop_valid', article_url, tei_logger)
+    for row in list(article.iterdescendants('sor_valid')):
+        for main_subtree in list(row):
+            if main_subtree.tag != 'oszlop_valid':
+                wrap(main_subtree, new_tag('oszlop_valid'))
+
+
+def missing_root_replacement(divname, rec, root_name, tab):
+    """Replace when a block with a fixed structure (e.g., list, table rows) is missing the root.
+        It was not in HTML and this cannot be validated in TEI
+    """
+    row_root = None
+    if rec:
+        tags = list(tab.iterdescendants())
+    else:
+        tags = list(tab)
+    for tag in tags:
+        if tag.tag == divname and tag.getparent().tag != root_name:
+            if row_root is None:
+                row_root = new_tag(root_name)
+                tag.addprevious(row_root)
+            extract(tag)
+            append_node(row_root, tag)
+        elif tag.tag != divname:
+            row_root = None
+
+
+def deal_with_paragraphs(article, article_url, tei_logger):
+    """Decide which levels of the paragraphs (and the tags equivalent to paragraphs) can be omitted
+        for the TEI to be valid (see eltedh_abc.deal_with_paragraphs)
+    """
+    tei_logger.log('DEBUG', 'deal_with_paragraphs in', article_url)
+    for p_tag in list(article.iterdescendants('bekezdes')):
+        p_naked_text, p_child_tags, p_desc_tags = imtext_children_descendants_of_tag(p_tag)
+        if len(p_child_tags & PARAGRAPH_LIKE_TAGS) > 0 or (not p_naked_text and len(p_child_tags & INLINE_TAGS) == 0):
+            unwrap(p_tag)
+        elif not p_naked_text and 'bekezdes' in p_desc_tags and p_desc_tags < PARAGRAPH_AND_INLINES:
+            inner_p_tags = list(p_tag.iterdescendants('bekezdes'))
+            if len(inner_p_tags) == 1:
+                inner_p_tags[0].tag = 'to_unwrap'
+    # It can be handled safely with two separate iterations. The second checks the labels equivalent to the paragraphs
+    #  for non-valid combinations
+    for p_like_tag in list(article.iterdescendants(*PARAGRAPH_LIKE_TAGS)):
+        plike_naked_text, plike_child_tags, plike_desc_tags = imtext_children_descendants_of_tag(p_like_tag)
+        if 'bekezdes' in plike_desc_tags and plike_desc_tags < PARAGRAPH_AND_INLINES:
+            inner_p_tags = list(p_like_tag.iterdescendants('bekezdes'))
+            if len(inner_p_tags) == 1:
+                inner_p_tags[0].tag = 'to_unwrap'
+
+
+def handling_unnecessary_wrappers(article, article_url, tei_logger):
+    """This function:
+        - Interprets the levels inherited from HTML
+        - Finds which level is redundant, or can be omitted for a clear structure free of duplication
+    """
+    tei_logger.log('DEBUG', 'unnecessary_wrappers in', article_url)
+    for a_tag in [tag for tag in article.iterdescendants() if tag.tag not in BLOCKS]:
+        naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(a_tag)
+        if len(child_tags) == 1 and a_tag.tag in child_tags:
+            if not naked_text and len(child_tags) > 0:  # Duplicated level
+                unwrap(a_tag)
+            elif naked_text and a_tag.tag in HI_TAGS:  # Variation of duplicated level
+                unwrap_all(article, a_tag.tag)
+    for i_tag in list(article.iterdescendants(*HI_TAGS)):
+        i_tagname = i_tag.tag
+        # Double formatting
+        in_naked_text, in_child_tags, in_desc_tags = imtext_children_descendants_of_tag(i_tag)
+        if i_tagname in in_desc_tags:
+            unwrap_all(article, i_tagname)
+    for ref in list(article.iterdescendants('hivatkozas')):
+        for p_like_tag in list(ref.iterdescendants(*PARAGRAPH_LIKE_TAGS)):
+            unwrap(p_like_tag)
+
+
+def handling_paragraphs_and_formatting_hierarchy(article, article_url, tei_logger):
+    """Formatting should be at the lowest level.
+       If it is higher than the paragraph, this code restores the hierarchy while preserving the scope of formatting
+    """
+    for i_tag in reversed(list(article.iterdescendants(*HI_TAGS))):
+        # The structures (which could be recursive) can be handled safely from the inside out (hence reversed).
+        #  Iterating from the outside to the inside crosses the boundaries of the levels
+        in_naked_text, in_child_tags, in_desc_tags = imtext_children_descendants_of_tag(i_tag)
+        p_like_child = PARAGRAPH_LIKE_TAGS & in_child_tags
+        if len(p_like_child) == 1 and in_child_tags.difference(in_desc_tags) <= HI_TAGS:
+            p_like_child_name = p_like_child.pop()
+            for inlines_child in list(i_tag.iterchildren(p_like_child_name)):
+                wrap(inlines_child, new_tag(p_like_child_name))
+                if len(inlines_child.attrib) > 0:
+                    tei_logger.log('DEBUG', f'{article_url}: UNEXPECTED ATTRIBUTE HERE:'
+                                            f'{inlines_child.tag}{attributes_of(inlines_child)}')
+                inlines_child.tag = i_tag.tag
+            if in_naked_text:
+                complex_wrapping(i_tag, i_tag.tag, article_url, tei_logger)
+            unwrap(i_tag)
+
+
+def handling_media_blocks_attrs_and_tags(article_url, article, tei_logger):
+    """1. rootless media_link > evaluation
+       2. Automatic elimination of duplicate levels
+       3. independent image and gallery automatic recognition, correction
+       4. where expected, "transporting" the reference to the root
+    """
+    for direct_facs in article.iterchildren('media_hivatkozas'):
+        direct_facs.tag = 'media_tartalom'
+
+    for media in reversed(list(article.iterdescendants(*MEDIA_DICT.keys()))):
+        # The structures (which could be recursive) can be handled safely from the inside out (hence reversed).
+        #  Iterating from the outside to the inside crosses the boundaries of the levels
+        if 'target' in media.attrib or media.tag == 'social_media':
+            for media_inner_tag in list(media.iterdescendants()):
+                if media_inner_tag.tag == 'media_hivatkozas':
+                    media_inner_tag.tag = 'hivatkozas'
+                elif media_inner_tag.tag not in MEDIA_DICT[media.tag] and media_inner_tag.tag not in INLINE_TAGS:
+                    unwrap(media_inner_tag)
+        else:
+            media_facs_list_new = [facs for facs in media.iterdescendants('media_hivatkozas')
+                                   if 'target' in facs.attrib]
+            if len(media_facs_list_new) == 1:
+                first_facs = next(media.iterdescendants('media_hivatkozas'))
+                if first_facs is not media_facs_list_new[0]:
+                    # The BeautifulSoup implementation shares the attributes of the two tags from here
+                    raise ValueError('Shared attributes')
+                media.attrib.clear()
+                media.attrib.update(first_facs.attrib)
+                unwrap(first_facs)
+            elif len(media_facs_list_new) > 1:  # convert into gallery
+                for facs in media.iterdescendants('media_hivatkozas'):
+                    facs.tag = 'media_tartalom'
+                media.tag = 'galeria'
+
+    for caption in list(article.iterdescendants(*FIGURE_REND_ATTRS.keys())):
+        if len(caption.attrib) == 0 and next(caption.iterdescendants(*FIGURE_REND_ATTRS.keys()), None) is not None:
+            unwrap(caption)
+
+    for media in list(article.iterdescendants(*MEDIA_DICT.keys())):
+        for media_inner_tag in list(media.iterdescendants()):
+            if media_inner_tag.tag not in MEDIA_DICT.keys() and media_inner_tag.tag not in MEDIA_DICT[media.tag] \
+                    and media_inner_tag.tag not in INLINE_TAGS:
+                unwrap(media_inner_tag)
+            elif media_inner_tag.tag in MEDIA_DICT.keys():
+                if len(media.attrib) == 0:
+                    unwrap(media)
+                else:
+                    tei_logger.log('DEBUG', f'{article_url}: MEDIA ELEMENT IN MEDIA ELEMENT')
+
+    for rest_media_reference in article.iterdescendants('media_hivatkozas'):
+        rest_media_reference.tag = 'media_tartalom'
+
+
+def isempty_figures_and_galleries(article, article_url, bs, void_elements, tei_logger):
+    """Images and galleries cannot always be downloaded in their entirety, so the code considers which blocks are
+        worth preserving. ('clues' that contain neither a caption nor a link can be discarded)
+    """
+    for fig in list(article.iterdescendants('media_tartalom')):
+        if len(text_of(fig).strip()) == 0 and len(fig.attrib) == 0:
+            extract(fig)
+    for isempty_galeries in list(article.iterdescendants('galeria')):
+        if next(isempty_galeries.iterdescendants('media_tartalom'), None) is None:
+            if real_text_length(isempty_galeries) > 0:
+                tei_logger.log('DEBUG', f'{article_url}: GALLERY WITH CAPTION, BUT WITHOUT ANY FIGURES? '
+                                        f'{markup(isempty_galeries, bs, void_elements)}')
+            isempty_galeries.tag = 'to_decompose'
+    decompose_all(article, 'to_decompose')
+    for social_figure in list(article.iterdescendants(*MEDIA_MINUS_FIG)):
+        has_ref_tags = any('target' in c.attrib for c in social_figure.iterdescendants())
+        if real_text_length(social_figure) == 0 and not has_ref_tags and 'target' not in social_figure.attrib:
+            tei_logger.log('DEBUG', f'{article_url}: EMPTY SOCIAL MEDIA CONTENT OR FIGURE '
+                                    f'{markup(social_figure, bs, void_elements)}')
+            extract(social_figure)
+
+
+def correct_lists(l_article, article_url, tei_logger):
+    """This function corrects irregular lists which was inherited from HTML"""
+    tei_logger.log('DEBUG', 'correct_lists in', article_url)
+    for li in l_article.iterdescendants('item'):
+        if li.getparent().tag != 'list':
+            missing_root_replacement('item', True, 'list', l_article)
+            break
+
+
+def real_lead_general_test(article, article_url, tei_logger):
+    """Verification: If the lead is not at the beginning of the article, it may indicate that the lead tag is
+        being used inconsistently
+    """
+    for i, lead in enumerate(list(article.iterdescendants('vez_bekezdes'))):
+        lead_text = text_of(lead)
+        if text_of(article).find(lead_text[0:20]) > 5 and i > 0:
+            tei_logger.log('DEBUG', f'{article_url} The lead is not at the beginning of the article. {lead_text[0:10]}')
+            lead.tag = 'bekezdes'
+
+
+def convert_link_to_facs_and_make_notes(flo_root, tag):
+    """Helper function to normal_tag_to_tei_xml_converter"""
+    if 'target' in tag.attrib:
+        flo_root.set('facs', tag.get('target'))
+        del tag.attrib['target']
+    if 'original' in tag.attrib:
+        tag.set('type', 'corrected')
+        tag.set('resp', 'script')
+
+        note = new_tag('note')
+        note.text = tag.get('original')
+        del tag.attrib['original']
+        note.set('corresp', 'facs')
+        append_node(tag, note)
+
+
+def normal_tag_to_tei_xml_converter(article):
+    """It replaces the temporary label names with valid TEI labels and inserts the extra levels required by the TEI"""
+    for tag in list(article.iterdescendants()):
+        tag_name = tag.tag
+        if tag_name in XML_CONVERT_DICT.keys():
+            tag.tag = XML_CONVERT_DICT[tag_name]
+        elif tag_name in TAGNAME_AND_ATTR_TABLE:
+            tag.tag = TAGNAME_AND_ATTR_TABLE[tag_name][0]
+            set_attributes(tag, {'rend': TAGNAME_AND_ATTR_TABLE[tag_name][1]})
+        elif tag_name == 'vez_bekezdes':
+            wrap(tag, new_tag('floatingText', {'type': 'lead'}))
+            tag.tag = 'body'
+        elif tag_name == 'doboz':
+            f = next(article.iterchildren('media_tartalom'), None)
+            if f is not None:
+                wrap(f, new_tag('p'))
+            wrap(tag, new_tag('floatingText', {'type': 'frame'}))
+            tag.tag = 'body'
+        elif tag_name == 'kviz':
+            wrap(tag, new_tag('floatingText', {'type': 'quiz'}))
+            tag.tag = 'body'
+        elif tag_name == 'forum':
+            wrap(tag, new_tag('div', {'type': 'forum'}))
+            tag.tag = 'body'
+        elif tag_name == 'galeria':
+            wrap(tag, new_tag('floatingText', {'type': 'gallery'}))
+            tag.tag = 'body'
+            for f in list(tag.iterchildren('media_tartalom')):
+                wrap(f, new_tag('p'))
+        elif tag_name == 'kozvetites':
+            tag.tag = 'div'
+            set_attributes(tag, {'type': 'feed'})
+        elif tag_name == 'komment':
+            tag.tag = 'div'
+            set_attributes(tag, {'type': 'comment'})
+        elif tag_name == 'komment_root':
+            tag.tag = 'div'
+            set_attributes(tag, {'type': 'comments_container'})
+        elif tag_name == 'valaszblokk':
+            tag.tag = 'list'
+            set_attributes(tag, {'type': 'quiz'})
+        elif tag_name == 'editorial_note':
+            tag.tag = 'note'
+            set_attributes(tag, {'type': 'editorial'})
+        elif tag_name == 'social_media':
+            flo_root = new_tag('floatingText', {'type': 'social_media_content'})
+            convert_link_to_facs_and_make_notes(flo_root, tag)
+            flo_root.attrib.update(tag.attrib)
+            wrap(tag, flo_root)
+            tag.tag = 'body'
+            tag.attrib.clear()
+            if len(tag) == 0:
+                append_node(tag, new_tag('p'))
+        elif tag_name in FIGURE_REND_ATTRS:
+            rend = FIGURE_REND_ATTRS[tag_name]
+            tag.tag = 'figure'
+            tag.set('rend', rend)
+            convert_link_to_facs_and_make_notes(tag, tag)
+        elif tag_name == 'oszlop_sor':
+            wrap(tag, new_tag('row'))
+            tag.tag = 'cell'
+        elif tag_name == 'oszlop_valid':
+            tag.tag = 'cell'
+            for p in list(tag.iterchildren('bekezdes')):
+                unwrap(p)
+        elif tag_name == 'hivatkozas':
+            tag.tag = 'ref'
+            if 'original' in tag.attrib:
+                if 'target' in tag.attrib:
+                    tag.set('type', 'corrected')
+                else:
+                    tag.set('type', 'deleted')
+                tag.set('resp', 'script')
+                note = new_tag('note')
+                origi_ref = new_tag('ref', {'type': 'original'})
+                origi_ref.text = tag.get('original')
+                append_node(note, origi_ref)
+                append_node(tag, note)
+                del tag.attrib['original']
+
+
+def prepare_tei_body(art_child_tags, art_naked_text, article, article_url, tei_logger):
+    """Going through the first level below the article root, it prepares the main subtrees before
+        writing out as TEI XML (see eltedh_abc.prepare_tei_body)
+       The texts and inline tags are moved into the new paragraphs instead of copying them
+        as the article root is not used later
+    """
+    tei_logger.log('DEBUG', 'prepare_tei_body in', article_url)
+    tei_body_contents_list = []
+    if art_naked_text or len(INLINE_TAGS & art_child_tags) > 0:
+        concatenated_naked_and_freetag = None
+        for c in contents_of(article):
+            if (isinstance(c, str) and len(c.strip()) > 0) or (not isinstance(c, str) and c.tag in INLINE_TAGS):
+                if concatenated_naked_and_freetag is None:
+                    concatenated_naked_and_freetag = new_tag('p')
+                append_node(concatenated_naked_and_freetag, c)
+            elif not isinstance(c, str):
+                if concatenated_naked_and_freetag is not None:
+                    tei_body_contents_list.append(concatenated_naked_and_freetag)
+                    concatenated_naked_and_freetag = None
+                tei_body_contents_list.append(c)
+        if concatenated_naked_and_freetag is not None:
+            tei_body_contents_list.append(concatenated_naked_and_freetag)
+    else:
+        tei_body_contents_list = list(article)
+    return tei_body_contents_list
+
+
+def article_body_converter(tei_logger, article_url, bs, article, spec_params):
+    """This function cleans and converts HTML content into a valid TEI XML like eltedh_abc.article_body_converter
+        using lxml (falls back to eltedh_abc if the article can not be converted to lxml)
+    """
+    _, decompose_fun, excluded_tags_fun, _, link_attrs, _, _, _, _ = spec_params
+    if article is None:
+        tei_logger.log('WARNING', f'{article_url} ARTICLE BODY ROOT NOT FOUND!')
+        return None
+    article = prepare_article_body(tei_logger, article_url, article, decompose_fun)
+    # The messages are logged only if the conversion succeeds to avoid logging them twice when falling back
+    buffered_logger = BufferedLogger()
+    try:
+        article_etree, frozen_tags, void_elements = article_to_etree(article, excluded_tags_fun, link_attrs)
+        tei_body_contents_list = convert_article_body_etree(buffered_logger, article_url, bs, article_etree,
+                                                            frozen_tags, void_elements, spec_params)
+    except ValueError as err:
+        # Logged on INFO level to be able to count the rate of the fallbacks in the log of the portal
+        tei_logger.log('INFO', f'{article_url}: {FALLBACK_MESSAGE} ({err})')
+        return convert_article_body(tei_logger, article_url, bs, article, spec_params)
+    buffered_logger.replay(tei_logger)
+    if tei_body_contents_list == 'EMPTY ARTICLE':
+        return tei_body_contents_list
+    return [etree_to_bs4(subtree, bs, void_elements) for subtree in tei_body_contents_list]
+
+
+def resolve_marked_tags(article, with_sections=False):
+    """Decompose/unwrap the marked tags and resolve the sections in one traversal
+        (see eltedh_abc.resolve_marked_tags)
+    """
+    tag_names = ('to_decompose', 'to_unwrap', 'szakasz') if with_sections else ('to_decompose', 'to_unwrap')
+    decomposed = set()  # The marked tags in the decomposed subtrees
+    for tag in list(article.iterdescendants(*tag_names)):
+        if tag in decomposed:
+            continue
+        if tag.tag == 'to_decompose':
+            decomposed.update(tag.iterdescendants(*tag_names))
+            extract(tag)
+        elif tag.tag == 'to_unwrap':
+            unwrap(tag)
+        elif has_immediate_text(tag):  # Section
+            tag.tag = 'bekezdes'
+        else:
+            unwrap(tag)
+
+
+def convert_article_body_etree(tei_logger, article_url, bs, article, frozen_tags, void_elements, spec_params):
+    """Convert the lxml article body (see article_to_etree) like eltedh_abc.convert_article_body"""
+    _, _, _, tag_normal_dict, link_attrs, block_dict, change_by_bigram, portal_url_prefix, portal_url_filter = \
+        spec_params
+    # 1) Renaming based on manually evaluated tag table(dictionary)
+    normal_tag_names_by_dict_new(article, frozen_tags, tag_normal_dict, link_attrs, portal_url_prefix,
+                                 portal_url_filter, article_url, tei_logger)
+
+    # Sections and decompose/unwrap
+    resolve_marked_tags(article, with_sections=True)
+
+    # 2) BIGRAM RULES
+    if len(change_by_bigram) > 0:
+        rename_by_bigram_rules(article, change_by_bigram, article_url, tei_logger)
+
+    # 3) FILTER: table/frame
+    disambiguate_table_or_frame(article, article_url, tei_logger)
+
+    # 4) BLOCK specific RENAMING RULES
+    block_specific_renaming(article, block_dict, article_url, tei_logger)
+
+    # Decompose/unwrap
+    resolve_marked_tags(article)
+
+    # 5) Media
+    handling_media_blocks_attrs_and_tags(article_url, article, tei_logger)
+
+    # 6) Cleaning: Delete tags that do not contain text and are used temporarily
+    #  (unwrapping does not change the lengths of the text of the tags remaining in the tree)
+    text_lengths = real_text_lengths(article)
+    for tag in list(article.iterdescendants()):
+        if text_lengths[tag] == 0 and tag.tag not in USED_NOTEXT_TAGS and tag.tag not in link_attrs:
+            unwrap(tag)
+        if tag.tag not in OUR_BUILTIN_TAGS:
+            tag.tag = 'to_unwrap'
+
+    real_lead_general_test(article, article_url, tei_logger)
+
+    # 7/a) Detect and delete unnecessary levels
+    handling_unnecessary_wrappers(article, article_url, tei_logger)
+    unwrap_all(article, 'to_unwrap')
+
+    # 7/b) Detect and delete unnecessary <p>-levels
+    deal_with_paragraphs(article, article_url, tei_logger)
+
+    # 8) Inline tags and paragraphs hierarchy
+    handling_paragraphs_and_formatting_hierarchy(article, article_url, tei_logger)
+
+    # 9) Checking block's structure
+    block_specific_curation_of_internal_structure(article, block_dict, article_url, tei_logger)
+
+    correct_table_structure(article, article_url, tei_logger)
+
+    deal_with_paragraphs(article, article_url, tei_logger)
+
+    block_structure(article, block_dict, article_url, tei_logger)
+
+    unwrap_all(article, 'to_unwrap')
+
+    handling_unnecessary_wrappers(article, article_url, tei_logger)
+
+    isempty_figures_and_galleries(article, article_url, bs, void_elements, tei_logger)
+
+    # 10) Curating the media block's inner structure
+    for media in list(article.iterdescendants(*MEDIA_DICT.keys())):
+        complex_wrapping(media, 'bekezdes', article_url, tei_logger)
+
+    deal_with_paragraphs(article, article_url, tei_logger)
+    unwrap_all(article, 'to_unwrap')
+    missing_root_replacement('komment', False, 'komment_root', article)
+
+    # 11) Rename to XML tags and insert the extra levels required by XML
+    article.tag = 'body'
+    article.attrib.clear()
+    normal_tag_to_tei_xml_converter(article)
+
+    # 12) Checking the structure of the article(<body>) and generating the output of the TEI file printout
+    art_naked_text, art_child_tags, art_desc_tags = imtext_children_descendants_of_tag(article)
+
+    # The TEI schema does not tolerates when the direct subtrees of the article body are '<figure>-s', so an extra
+    #  <p>-level must be inserted (at least in the case of the first occurrence)
+    if 'figure' in art_child_tags and len(art_child_tags) == 1:
+        art_child = next(article.iterchildren('figure'), None)
+        if art_child is not None:
+            wrap(art_child, new_tag('p'))
+    elif 'note' in art_child_tags:
+        for n in list(article.iterchildren('note')):
+            wrap(n, new_tag('p'))
+
+    # Not valid by TEI schema if there is only one figure in the floatingText (an extra 'p' level must be inserted)
+    for flo in list(article.iterdescendants('body')):
+        flo_child = list(flo)
+        if len(flo_child) == 1 and flo_child[0].tag == 'figure':
+            wrap(flo, new_tag('body'))
+            flo.tag = 'p'
+
+    # If a headless list was inherited from the html source
+    correct_lists(article, article_url, tei_logger)
+
+    if real_text_length(article) == 0 and next(article.iterdescendants(), None) is None:
+        tei_logger.log('WARNING', f'{article_url}: ARTICLE BODY IS EMPTY!')
+        return 'EMPTY ARTICLE'
+
+    if any(div.get('type') == 'feed' for div in article.iterdescendants('div')):
+        complex_wrapping_for_news_feed(article, 'div', article_url, tei_logger)
+
+    tei_body_contents_list = prepare_tei_body(art_child_tags, art_naked_text, article, article_url, tei_logger)
+
+    return tei_body_contents_list
@@ -12,7 +12,7 @@ stoplist = get_stoplist('Hungarian')
 def process_article(one_page_of_article_things, body_log, get_meta_fun, spec_body_params):
     """Using the JusText boilerplate removal tool to extract the article's paragraphs
         Returns the metadata dictionary and paragraphs"""
-    url, warc_response_datetime, warc_id, html = one_page_of_article_things
+    url, warc_response_datetime, warc_id, html, _ = one_page_of_article_things
     _ = url, get_meta_fun, spec_body_params  # Silence IDE
     justasoup = BeautifulSoup(features='lxml')
     paragraphs = justext(html, stoplist)
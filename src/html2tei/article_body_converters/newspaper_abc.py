@@ -11,7 +11,7 @@ def process_article(one_page_of_article_things, body_log, get_meta_fun, spec_bod
     """Using the Newspaper3k tool to extract the metadata and paragraphs from the article
         Returns the metadata dictionary and paragraphs"""
     _ = body_log, get_meta_fun, spec_body_params  # Silence IDE
-    url, warc_response_datetime, warc_id, html = one_page_of_article_things
+    url, warc_response_datetime, warc_id, html, _ = one_page_of_article_things
     n3ksoup = BeautifulSoup(features='lxml')
     metas_in_dict = tei_defaultdict()
     metas_in_dict['sch:url'] = url
@@ -21,7 +21,7 @@ def _create_empty_paragraph_list(url, body_log):
 def process_article(one_page_of_article_things, body_log, get_meta_fun, spec_body_params):
 
     _ = body_log, get_meta_fun, spec_body_params  # Silence IDE
-    url, warc_response_datetime, warc_id, raw_html = one_page_of_article_things
+    url, warc_response_datetime, warc_id, raw_html, _ = one_page_of_article_things
     metas_in_dict = tei_defaultdict()
     metas_in_dict['sch:url'] = url
 
@@ -7,7 +7,8 @@ from os.path import join as os_path_join
 from json import dumps as json_dumps, loads as json_loads
 
 from ..tei_utils import to_friendly
-from ..workflow_helpers.processing_utils import run_single_process, dummy_fun, process_article
+from ..workflow_helpers.processing_utils import run_single_process, run_multiple_process, process_article_partial, \
+    merge_partial_accumulator
 
 
 def collect_tags_recursively(out_dict, article_url, tag, excluded_tags_fun):
@@ -33,22 +34,34 @@ def nested_dict():
     return defaultdict(nested_dict)  # Recursive definition!
 
 
+def merge_nested_dicts(root_dict, partial_root_dict):
+    """Merge the (partial) tree of some articles into the tree of the portal (the union of the trees).
+       This is a recursive function!
+    """
+    for tag_name, partial_child_dict in partial_root_dict.items():
+        merge_nested_dicts(root_dict[tag_name], partial_child_dict)
+
+
 def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_level_params, rest_config_params):
     """Init variables for processing a portal: HTML Content Tree (This is the only public function of this file)"""
-    _ = log_dir, run_params, warc_level_params  # Silence IDE
+    _ = log_dir, warc_level_params  # Silence IDE
+
+    run_parallel = run_params.get('run_parallel', False)
 
     article_root_params, decompose_spec, excluded_tags_spec = rest_config_params[1:4]
 
     # The internal structure of the accumulator is defined in nested_dict function
     accumulator = nested_dict()
-    # No files and after processing needed for each article
-    after_article_fun, after_article_params, log_file_names_and_modes = dummy_fun, (), ()
+    # The partial accumulators of the articles are merged into the accumulator after processing each article
+    #  (no files needed)
+    after_article_fun, after_article_params, log_file_names_and_modes = \
+        merge_partial_accumulator, (accumulator, merge_nested_dicts), ()
     # Filenames for the final function
     final_filenames_and_modes = ((os_path_join(output_dir, f'{portal_name}_tree.txt'), 'w'),)
     # Run this function after all articles are processed
     final_fun = final_tree
-    # Process articles one by one with this function
-    process_article_fun = process_article
+    # Process articles one by one with this function (into a new partial accumulator)
+    process_article_fun = process_article_partial
     # From the loaded portal-specific configuration
     #  - TEI logger for logging
     #  - article root params for find_all
@@ -57,11 +70,15 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
     #     with merging the irrelevant variations of values
     # Task specific params:
     #  - (sub)function to run after cleaning the article up (decompose unnecessary parts)
-    #  - the parameters for the subfunction (accumulator)
-    process_article_params = (tei_logger, article_root_params, decompose_spec, excluded_tags_spec,
-                              collect_tags_recursively, (accumulator,))
-    # Runner function (some task can be run only in single-process mode)
-    run_fun = run_single_process
+    #  - the parameters for the subfunction (except the partial accumulator)
+    #  - the function to create the partial accumulator of an article
+    process_article_params = ([tei_logger, article_root_params, decompose_spec, excluded_tags_spec,
+                               collect_tags_recursively, ()], nested_dict)  # Must be list!
+    # Runner function (the partial accumulators can be computed in parallel)
+    if run_parallel:
+        run_fun = run_multiple_process
+    else:
+        run_fun = run_single_process
 
     return accumulator, after_article_fun, after_article_params, log_file_names_and_modes, final_filenames_and_modes, \
         final_fun, process_article_fun, process_article_params, run_fun
@@ -2,31 +2,131 @@
 # -*- coding: utf-8, vim: expandtab:ts=4 -*-
 
 from copy import copy
+from functools import partial
 from collections import defaultdict
 from uuid import uuid5, NAMESPACE_URL
 from os.path import join as os_path_join
 from datetime import datetime, MAXYEAR, MINYEAR
 
 from bs4 import BeautifulSoup
+from lxml import etree
 
-from ..tei_utils import create_new_tag_with_string
-from ..workflow_helpers.validate_hash_zip import init_output_writer
+from ..tei_utils import create_new_tag_with_string, bs4_to_etree
+from ..workflow_helpers.validate_hash_zip import init_output_writer, TEI_ALL_SCHEMA_URL, DEFAULT_SCHEMA_CACHE_DIR
+from ..workflow_helpers.output_containers import DEFAULT_SHARD_SIZE_MB, deflate
 from ..workflow_helpers.processing_utils import run_single_process, run_multiple_process
 
 DUPL_METAS = {'sch:keywords', 'sch:author', 'sch:contentLocation', 'sch:artist', 'sch:source'}
 
+# The serialization formats of the TEI XML output (see TeiTemplate.serialize)
+TEI_XML_FORMATS = ('pretty', 'compact', 'bs4-prettify')
 
-def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents, multipage_warc_datas=None):
+# In deterministic mode (fixed processing time) this value is written in place of the processing time
+#  while the output is validated and hashed, therefore the hashes do not depend on it (see tei_writer)
+PROCESSING_TIME_PLACEHOLDER = datetime(MINYEAR, 1, 1).isoformat()
+# The start of the run (the import of this module) for the processing time fixed for the run
+RUN_START_TIME = datetime.today()
+
+
+def tag_path(tag):
+    """The indices of the tag and its ancestors in the contents of their parents from the root"""
+    path = []
+    while tag.parent is not None:
+        path.append(tag.parent.contents.index(tag))
+        tag = tag.parent
+    path.reverse()
+    return tuple(path)
+
+
+def tag_by_path(root, path):
+    tag = root
+    for i in path:
+        tag = tag.contents[i]
+    return tag
+
+
+def find_tei_template_slots(beauty_xml):
+    """Find the tags of the base TEI XML filled by tei_writer"""
+    file_title = beauty_xml.find('titleStmt')
+    sourcedesc = beauty_xml.find('sourceDesc')
+    revision_desc = beauty_xml.find('revisionDesc')
+    return {'titleStmt': file_title,
+            'titleStmt_title': file_title.title,
+            'idno': beauty_xml.find('idno'),
+            'sourceDesc': sourcedesc,
+            'sourceDesc_title': sourcedesc.title,
+            'sourceDesc_date': sourcedesc.find_all('date')[2],
+            'xeno_meta_datas': beauty_xml.find('rdf:Description'),
+            'tei_change': beauty_xml.find('change', source=True) or revision_desc.change,
+            'revisionDesc': revision_desc,
+            'revisionDesc_change': revision_desc.change,
+            'body': beauty_xml.body}
+
+
+class TeiTemplate:
+    """The base TEI XML of the portal parsed once with the paths of the tags to be filled by tei_writer
+        (see find_tei_template_slots) instead of parsing and searching the base XML for each article
+        and the serialization format of the filled documents (xml_format, see serialize)
+       The object is pickled by its parameters, as the parsed XML is not picklable effectively
+    """
+    def __init__(self, xml_string, xml_format='bs4-prettify'):
+        if xml_format not in TEI_XML_FORMATS:
+            raise ValueError(f'Unknown TEI XML format: {xml_format}')
+        self._xml_string = xml_string
+        self._xml_format = xml_format
+        self._skeleton = BeautifulSoup(xml_string, features='lxml-xml')
+        self._slot_paths = {name: tag_path(tag) for name, tag in find_tei_template_slots(self._skeleton).items()}
+        self._tei_pid_rdf_paths = tuple(tag_path(rdf) for rdf in self._skeleton.find_all('rdf:Description')
+                                        if rdf.attrs['rdf:about'] == 'teiPid')
+
+    def __reduce__(self):
+        return self.__class__, (self._xml_string, self._xml_format)
+
+    def new_document(self):
+        """Return a copy of the parsed base XML, its tags to be filled by name
+            and the RDF descriptions of the TEI file (with teiPid placeholder)
+        """
+        beauty_xml = copy(self._skeleton)  # Copies the tree without parsing it again since BeautifulSoup 4.13
+        slots = {name: tag_by_path(beauty_xml, path) for name, path in self._slot_paths.items()}
+        tei_pid_rdfs = [tag_by_path(beauty_xml, path) for path in self._tei_pid_rdf_paths]
+        return beauty_xml, slots, tei_pid_rdfs
+
+    def serialize(self, beauty_xml):
+        """Serialize the filled document according to xml_format:
+            - pretty: converted to lxml and pretty printed with lxml
+            - compact: converted to lxml and printed without indentation
+            - bs4-prettify: printed with BeautifulSoup.prettify() (the default: slow, but the output is the same
+             as of the earlier versions)
+           Return the serialized XML and its lxml tree (to be validated without parsing it again) or None
+        """
+        if self._xml_format != 'bs4-prettify':
+            try:
+                tei_etree = bs4_to_etree(beauty_xml)
+            except ValueError:
+                pass  # Not well-formed XML, the validator reports the errors of the prettified XML
+            else:
+                return etree.tostring(tei_etree, encoding='UTF-8', xml_declaration=True,
+                                      pretty_print=self._xml_format == 'pretty'), tei_etree
+        return beauty_xml.prettify().encode('UTF-8'), None
+
+
+def tei_writer(warc_date, warc_id, tei_template, meta_data, article_body_contents, multipage_warc_datas=None,
+               processing_time=None, validator_hasher=None):
     """
     Function for writing an article into a file in TEI format
      The input dictionary is used to generate tags from key-value pairs except special keys which are handled separately
     :param warc_date:
     :param warc_id:
-    :param xml_string:
+    :param tei_template: the base TEI XML of the portal (TeiTemplate)
     :param meta_data: a prepared dictionary contains the meta-data to be written
     :param article_body_contents: a list of Tag()-s which is written without further examination.
        Note: Individual subtrees must be cleaned before this function!
     :param multipage_warc_datas
+    :param processing_time: the processing time to be written (ISO format) instead of the current time
+    :param validator_hasher: the validator and hasher of the output (TeiValidatorHasher) or None
+    The verdict of the validation and hashing is returned with the XML (None if validator_hasher is None),
+     with a fixed processing time PROCESSING_TIME_PLACEHOLDER is written in place of it while the output
+     is validated and hashed, then the processing time is set in the tree and the XML is serialized again
     """
     url = meta_data['sch:url']
     art_date_pub = meta_data.get('sch:datePublished') 
@@ -49,14 +149,13 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
     article_title = meta_data['sch:name']
     if 'sch:author' in meta_data.keys():
         article_author = meta_data['sch:author']
-    beauty_xml = BeautifulSoup(xml_string, features='lxml-xml')
+    beauty_xml, slots, tei_pid_rdfs = tei_template.new_document()
 
     # TEI <fileDesc>
-    file_title = beauty_xml.find('titleStmt')
+    file_title = slots['titleStmt']
     if article_title is not None:
-        file_title = beauty_xml.find('titleStmt')
-        file_title.title.string = article_title
-    idno = beauty_xml.find('idno')
+        slots['titleStmt_title'].string = article_title
+    idno = slots['idno']
     idno.string = str(tei_pid)
 
     # Adding the writer in the code below because it should be in sourceDesc in the same way
@@ -70,14 +169,14 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
             file_title.append(source_org_root)
 
     # TEI <sourceDesc><bibl>
-    sourcedesc = beauty_xml.find('sourceDesc')
-    source_date_tag = sourcedesc.find_all('date')[2]
+    sourcedesc = slots['sourceDesc']
+    source_date_tag = slots['sourceDesc_date']
     if art_date_pub is not None:
         source_date_tag.attrs = {'when': art_date_pub.isoformat()}
     else:
         source_date_tag.attrs = {'when-custom': 'unknown'}
     if article_title is not None:
-        sourcedesc.title.string = article_title
+        slots['sourceDesc_title'].string = article_title
     if article_author is not None and len(article_author) != 0:
         for author_name in article_author:
             author_tag = beauty_xml.new_tag('author')
@@ -86,7 +185,7 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
             author_tag.append(one_name)
             file_title.append(author_tag)
             sourcedesc_author = copy(author_tag)
-            sourcedesc.find('title').insert_after(sourcedesc_author)
+            slots['sourceDesc_title'].insert_after(sourcedesc_author)
     # Editorial note on the interpretation of authors and sources, modification of the original string.
     if 'originalAuthorString' in meta_data.keys():
         original_author_string = meta_data['originalAuthorString']
@@ -97,11 +196,11 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
         for auth in original_author_string:
             create_new_tag_with_string(beauty_xml, auth, 'p', note_tag_auth)
 
-        tei_change = beauty_xml.find('change', source=True)
+        tei_change = slots['tei_change']
         tei_change.append(note_tag_auth)
 
     # XENODATA 1: metadata of article source
-    xeno_meta_datas = beauty_xml.find('rdf:Description')
+    xeno_meta_datas = slots['xeno_meta_datas']
     xeno_meta_datas.attrs['rdf:about'] = url
     for k, v in meta_data.items():
         if v is not None:
@@ -120,22 +219,25 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
 
     # XENODATA 2: warc data
     xeno_tei_rdf = ''
-    for rdf in beauty_xml.find_all('rdf:Description'):
-        if rdf.attrs['rdf:about'] == 'teiPid':
-            xeno_tei_rdf = rdf
-            rdf.attrs['rdf:about'] = tei_pid
+    for rdf in tei_pid_rdfs:
+        xeno_tei_rdf = rdf
+        rdf.attrs['rdf:about'] = tei_pid
 
     # XENO 3: TEI file data + article warc response data
     xeno_tei_rdf.find('sch:identifier').string = warc_id[1:-1]
-    current_time = datetime.today().isoformat()
-    xeno_tei_rdf.find('sch:sdDatePublished').string = current_time
+    if processing_time is None:
+        current_time = datetime.today().isoformat()
+    else:
+        current_time = PROCESSING_TIME_PLACEHOLDER
+    sd_date_published = xeno_tei_rdf.find('sch:sdDatePublished')
+    sd_date_published.string = current_time
     warc_date_string = warc_date.isoformat()
     xeno_tei_rdf.find('sch:lastReviewed').string = warc_date_string
 
     # revisionDesc
-    revision_desc = beauty_xml.find('revisionDesc')
+    revision_desc = slots['revisionDesc']
     # Default change tag is already present in the XML skeleton
-    change = revision_desc.change
+    change = slots['revisionDesc_change']
     change.attrs['when'] = current_time
     change.attrs['source'] = tei_pid
     if 'sch:dateModified' in meta_data.keys():
@@ -144,7 +246,7 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
         revision_desc.append(change_art_modified)
 
     # FILL TEI BODY
-    body = beauty_xml.body
+    body = slots['body']
     if article_title is None:
         article_title = 'unknown'
     article_title_tag = beauty_xml.new_tag('head', type='title')
@@ -156,7 +258,7 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
         article_subtitle_tag.string = article_alternate_title
         body.append(article_subtitle_tag)
     if article_body_contents == 'EMPTY ARTICLE':
-        tei_change = beauty_xml.find('change', source=True)
+        tei_change = slots['tei_change']
         empty_body_note = beauty_xml.new_tag('note')
         tei_change.append(empty_body_note)
         empty_body_note.string = 'A cikk tartalma az archiválás pillanatában nem volt elérhető./' \
@@ -190,10 +292,19 @@ def tei_writer(warc_date, warc_id, xml_string, meta_data, article_body_contents,
             create_new_tag_with_string(beauty_xml, w_id[1:-1], 'idno', note_p)
             create_new_tag_with_string(beauty_xml, w_d.isoformat(), 'date', note_p)
             note_tag.append(note_p)
-        tei_change = beauty_xml.find('change', source=True)
+        tei_change = slots['tei_change']
         tei_change.append(note_tag)
-    pretty_xml = beauty_xml.prettify().encode('UTF-8')
-    return final_name, final_suff, pretty_xml, art_date_pub
+    tei_xml, tei_etree = tei_template.serialize(beauty_xml)
+    # The lxml tree of the output (if any) is validated directly, it is not returned to the parent process
+    verdict = None
+    if validator_hasher is not None:
+        verdict = validator_hasher.validate_and_hash(tei_xml, tei_etree)
+    if processing_time is not None:
+        # Only the tags of the processing time are changed (the same value may occur elsewhere, e.g. in dates)
+        sd_date_published.string = processing_time
+        change.attrs['when'] = processing_time
+        tei_xml, _ = tei_template.serialize(beauty_xml)
+    return final_name, final_suff, tei_xml, art_date_pub, verdict
 
 
 def merge_multipage_article_metadata(multipage_article):
@@ -205,7 +316,7 @@ def merge_multipage_article_metadata(multipage_article):
         converted_body_dict[act_url] = converted_body
     # All metadata will be merged
     merged_meta_dict = {}
-    meta_name_cache = defaultdict(set)
+    meta_name_cache = defaultdict(dict)  # The values in the order of their first occurrence (as an ordered set)
     min_pub = datetime(MAXYEAR, 1, 1)
     max_pub = datetime(MINYEAR, 1, 1)
     max_mod = datetime(MINYEAR, 1, 1)
@@ -221,11 +332,11 @@ def merge_multipage_article_metadata(multipage_article):
                 valami = meta_name_cache[meta_name]
                 for meta_value in meta_values:
                     if meta_value not in valami:
-                        valami.add(meta_value)
+                        valami[meta_value] = None
             elif meta_name not in merged_meta_dict.keys():
                 merged_meta_dict[meta_name] = meta_values
     for meta_k, meta_v in meta_name_cache.items():
-        merged_meta_dict[meta_k] = meta_v
+        merged_meta_dict[meta_k] = list(meta_v)
 
     if min_pub != datetime(MAXYEAR, 1, 1):
         merged_meta_dict['sch:datePublished'] = min_pub
@@ -236,77 +347,82 @@ def merge_multipage_article_metadata(multipage_article):
     return merged_meta_dict, converted_body_dict, all_warc_datas_tup_for_note
 
 
-def process_multipage_article(article_tup_list, process_article_and_spec_params):
-    """Process the pages of multi-page articles one after the other"""
-    # Get the url, WARC response date and WARC ID for the first page of the article
-    first_url, first_article_warc_resp_date, first_article_warc_id, _ = article_tup_list[0]
-    (tei_logger, base_xml_string, get_meta_fun, write_out_mode), spec_body_params = process_article_and_spec_params
+def process_pages_of_article(article_tup_list, process_article_and_spec_params):
+    """Process the pages of (multi-page) articles one after the other"""
+    (tei_logger, _, get_meta_fun, write_out_mode, *_), spec_body_params = process_article_and_spec_params
     multipage_article = []
     for article_tup in article_tup_list:
         # Pass to the paragraph extractor function and collect WARC metadata to list
         metas_in_dict, converted_body = write_out_mode(article_tup, tei_logger, get_meta_fun, spec_body_params)
-        multipage_article.append((metas_in_dict, converted_body, article_tup))
-
-    merged_meta_dict, converted_body_dict, all_warc_datas_tup_for_note = \
-        merge_multipage_article_metadata(multipage_article)
-    return first_url, first_article_warc_resp_date, first_article_warc_id, base_xml_string, merged_meta_dict, \
-        converted_body_dict, all_warc_datas_tup_for_note
+        # The parsed HTML of the page is not kept to free memory for the following pages
+        multipage_article.append((metas_in_dict, converted_body, article_tup[:4]))
+    return multipage_article
 
 
 def process_article_clean(params):
-    """This function is the first to receive data from the generator (aggregated_multipage_articles_gen)
+    """This function is the first to receive data from the article assembler (ArticleAssembler.pages_of_article)
         for each article (single-page or multi-page)
        This function should do processing that does allow parallel processing to make the conversion faster,
+        including the validation and hashing of the output (verdict) if the output writer needs it
+        and the compression of the output (if it is written into a compressed zip file)
        The after_clean function is for doing tasks sequentially after processing each individual articles
         (e.g. writing the output to files)
     """
     article_tup_list, process_article_and_spec_params = params
-    converted_body, tei_data = None, (None, None, None, None)
-    if len(article_tup_list) == 1:  # Process single-page article
-        (tei_logger, base_xml_string, get_meta_fun, write_out_mode), spec_body_params = process_article_and_spec_params
-        first_page_of_article = article_tup_list[0]
-        first_url, warc_response_datetime, warc_id, raw_html = first_page_of_article
-
-        metas_in_dict, converted_body = write_out_mode(first_page_of_article, tei_logger, get_meta_fun,
-                                                       spec_body_params)
+    _, tei_template, _, _, validator_hasher, processing_time, compress_level = process_article_and_spec_params[0]
+    converted_body, tei_data, verdict = None, (None, None, None, None), None
+    # write_out_mode is passed into process_pages_of_article with process_article_and_spec_params
+    # The different write_out_mode implementations are defined in article_body_converters
+    multipage_article = process_pages_of_article(article_tup_list, process_article_and_spec_params)
+    # Get the url, WARC response date and WARC ID for the first page of the article
+    first_url, warc_response_datetime, warc_id, _ = multipage_article[0][2]
+    if len(multipage_article) == 1:  # Single-page article
+        metas_in_dict, converted_body, _ = multipage_article[0]
         all_warc_datas_tup_for_note = None
-    else:  # Process multi-page article
-        # write_out_mode is passed into process_multipage_article with process_article_and_spec_params
-        # The different write_out_mode implementations are defined in article_body_converters
+    else:  # Multi-page article
         # Multipage articles:
         #  - URL from the first page
         #  - WARC response datetime from the first page
         #  - WARC ID from the first page
-        #  - the base TEI XML string for the portal (we use this version for simplicity)
+        #  - the base TEI XML (template) for the portal (we use this version for simplicity)
         #  - Metas are merged
         #  - The converted body (extracted paragraphs)
         #  - Extra: All WARC data are collected for '<note>'-ing in TEI
-        first_url, warc_response_datetime, warc_id, base_xml_string, metas_in_dict, converted_body, \
-            all_warc_datas_tup_for_note = process_multipage_article(article_tup_list, process_article_and_spec_params)
+        metas_in_dict, converted_body, all_warc_datas_tup_for_note = \
+            merge_multipage_article_metadata(multipage_article)
     # Create TEI XML if the conversion was successful
     if metas_in_dict is not None and converted_body is not None:
-        tei_data = tei_writer(warc_response_datetime, warc_id, base_xml_string, metas_in_dict, converted_body,
-                              all_warc_datas_tup_for_note)
+        # In deterministic mode the processing time is set after the validation and the hashing
+        final_name, final_suff, tei_xml, art_date_pub, verdict = \
+            tei_writer(warc_response_datetime, warc_id, tei_template, metas_in_dict, converted_body,
+                       all_warc_datas_tup_for_note, processing_time, validator_hasher)
+        # The XMLs to be zipped are compressed here and inserted into the zip file as is (the invalid ones are not)
+        if compress_level is not None and (verdict is None or verdict[0] is None):
+            tei_xml = deflate(tei_xml, compress_level)
+        tei_data = (final_name, final_suff, tei_xml, art_date_pub)
 
-    return first_url, tei_data
+    return first_url, tei_data, verdict
 
 
 def after_clean(ret, validator_hasher_compressor, file_handles):
     """This function write the processed article (process_article_clean, tei_writer) into the output:
         - the URL to the url_list or bad_article_urls file
-        - the XML to the validator_hasher_compressor
-       The input parameters are the url and the output of tei_writer.
+        - the XML (compressed in advance if it goes into a compressed zip file) to the validator_hasher_compressor
+       The input parameters are the url, the output of tei_writer and the verdict of the validation and hashing.
        The function returns the extracted publish_date or None if no tei_string could be extracted
     """
-    url, (desired_filename, filename_suff, tei_string, publish_date) = ret
+    url, (desired_filename, filename_suff, tei_string, publish_date), verdict = ret
     url_list, bad_article_urls, date_container = file_handles
     if tei_string is not None:
-        final_filename = validator_hasher_compressor.process_one_file(url, desired_filename, filename_suff, tei_string)
+        final_filename = validator_hasher_compressor.process_one_file(url, desired_filename, filename_suff, tei_string,
+                                                                      verdict)
         print(url, final_filename, file=url_list)
-        if publish_date is not None:
-            return publish_date
     else:
         print(url, file=bad_article_urls)
+        publish_date = None
+    # The article is completely written, the output can be checkpointed for resuming
+    validator_hasher_compressor.end_of_article(url, file_handles)
+    return publish_date
 
 
 def final_clean(dates, out_files, warc_date_interval, tei_logger):
@@ -320,6 +436,21 @@ def final_clean(dates, out_files, warc_date_interval, tei_logger):
     tei_logger.log('INFO', 'warc last date:', warc_date_interval['date_max'])
 
 
+def resolve_processing_time(processing_time, tei_logger):
+    """The processing time to be written into the output in ISO format from the parameter:
+        None (the current time for each article), 'run' (the start of the run) or a date and time in ISO format
+    """
+    if processing_time is None:
+        return None
+    if processing_time == 'run':
+        return RUN_START_TIME.isoformat()
+    try:
+        return datetime.fromisoformat(processing_time).isoformat()
+    except ValueError:
+        tei_logger.log('CRITICAL', f'processing_time must be "run" or a date and time in ISO format: {processing_time}')
+        exit(1)
+
+
 def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_level_params, rest_config_params):
     """Init variables for processing a portal: Portal Article Cleaner (This is the only public function of this file)"""
 
@@ -337,23 +468,38 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
         tei_logger.log('CRITICAL', 'w_specific_dicts and w_specific_tei_base_file are must set to True in run_params!')
         exit(1)
 
+    # The schema (URL or local file) for validating the output, downloaded schemas are cached in schema_cache_dir
+    tei_schema = run_params.get('tei_schema', TEI_ALL_SCHEMA_URL)
+    schema_cache_dir = run_params.get('schema_cache_dir', DEFAULT_SCHEMA_CACHE_DIR)
+    # The serialization format of the output (see TeiTemplate.serialize)
+    xml_format = run_params.get('xml_format', 'bs4-prettify')
+    # The fixed processing time of the deterministic mode (None: the current time for each article)
+    processing_time = resolve_processing_time(run_params.get('processing_time'), tei_logger)
+
     get_meta_fun_spec, article_root_params, decompose_spec, excluded_tags_spec, portal_url_prefix, \
         portalspec_link_filter, links, block_rules_spec, bigram_rules_spec, tag_normal_dict, \
         portal_specific_block_rules, portal_xml_string, write_out_mode = rest_config_params
 
     # The internal structure of the accumulator is defined in read_portalspec_config function
     # Get a reference to warc_date_interval to be able to use without returning it in the generator
-    #  (aggregated_multipage_articles_gen)
+    #  (track_warc_date_interval)
     accumulator = warc_level_params[4]
     # The function to run after processing each article with process_article_clean
     #  (involves writing to files, which must be done sequentially even if the rest is done in parallel)
     after_article_fun = after_clean
-    # The only extra parameter for after_article_fun is the output writer class (validator-hasher-compressor)
-    after_article_params = init_output_writer(output_dir, portal_name, output_debug, tei_logger)
     # The filenames (and modes) to be written into in after_article_fun
     log_file_names_and_modes = ((os_path_join(log_dir, f'{portal_name}_urls.txt'), 'a'),
                                 (os_path_join(log_dir, f'{portal_name}_bad_urls.txt'), 'a'),
                                 (os_path_join(log_dir, f'{portal_name}_date_container.txt'), 'a'))
+    # The only extra parameter for after_article_fun is the output writer class (validator-hasher-compressor)
+    #  writing into the chosen container(s) of the output files (see OutputContainers),
+    #  in resume mode it continues the output of the previous run (and the files above) from its last checkpoint
+    after_article_params = init_output_writer(output_dir, portal_name, output_debug, tei_logger, tei_schema,
+                                              schema_cache_dir, run_params.get('resume', False), processing_time,
+                                              run_params.get('container'), run_params.get('shard_by'),
+                                              run_params.get('shard_size_mb', DEFAULT_SHARD_SIZE_MB),
+                                              run_params.get('compression_level'),
+                                              [filename for filename, _ in log_file_names_and_modes])
     # Filenames for the final function
     final_filenames_and_modes = ()
     # Run this function after all articles are processed
@@ -362,10 +508,15 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
     process_article_fun = process_article_clean
     # Task specific params (process_article_clean):
     #  - the TEI logger initialised
-    #  - the portal-specific base TEI XML in string format
+    #  - the portal-specific base TEI XML parsed once and the format of the output (TeiTemplate)
     #  - the portal-specific get_meta function
     #  - the write-out mode (e.g. Custom Article Body Converter, JusText, Newspaper3k)
-    process_article_clean_params = [tei_logger, portal_xml_string, get_meta_fun_spec, write_out_mode]  # Must be list!
+    #  - the validator and hasher of the output writer (None if not needed) to run them in parallel
+    #  - the fixed processing time (None if the current time is used for each article)
+    #  - the compression level of the output writer (None if the output is not compressed) to compress in parallel
+    process_article_clean_params = [tei_logger, TeiTemplate(portal_xml_string, xml_format), get_meta_fun_spec,
+                                    write_out_mode, after_article_params.validator_hasher,
+                                    processing_time, after_article_params.compress_level]  # Must be list!
     # Params for write_out_mode from the loaded portal-specific configuration
     # The different write_out_mode implementations are defined in article_body_converters"
     #  - article root params for find_all
@@ -388,6 +539,11 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
         run_fun = run_multiple_process
     else:
         run_fun = run_single_process
+    # Skip the articles already written into the output before the checkpoint of the resumed run
+    #  and write the articles in the order of their completion if the order of the output is not relevant
+    #  (the checkpoints record the set of the written articles, therefore resuming does not depend on the order)
+    run_fun = partial(run_fun, skip_urls=frozenset(after_article_params.processed_urls),
+                      ordered=not run_params.get('unordered_output', False))
 
     return accumulator, after_article_fun, after_article_params, log_file_names_and_modes, final_filenames_and_modes, \
         final_fun, process_article_fun, process_article_params, run_fun
@@ -1,12 +1,34 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8, vim: expandtab:ts=4 -*-
 
+from functools import partial
 from collections import defaultdict
 from os.path import join as os_path_join
-from random import sample as random_sample
 
 from ..tei_utils import to_friendly
-from ..workflow_helpers.processing_utils import run_single_process, dummy_fun, process_article
+from ..workflow_helpers.processing_utils import run_single_process, run_multiple_process, process_article_partial, \
+    merge_partial_accumulator, ReservoirSample
+
+
+def new_bigram_stats(url_sample_size):
+    """The statistics of a bigram: frequency, the sample of the URLs
+        (a module-level function to make the accumulator picklable, see summarize_tag_bigrams)
+    """
+    return [0, ReservoirSample(url_sample_size)]
+
+
+def new_bigram_dict(url_sample_size):
+    return defaultdict(partial(new_bigram_stats, url_sample_size))
+
+
+def merge_bigram_dicts(tag_dict, partial_tag_dict):
+    """Merge the (partial) accumulator of some articles into the accumulator of the portal
+        (the frequencies are summed, the samples of the URLs are merged)
+    """
+    for a_b_name, (frequency, urls) in partial_tag_dict.items():
+        bigram_stats = tag_dict[a_b_name]
+        bigram_stats[0] += frequency
+        bigram_stats[1].merge(urls)
 
 
 def summarize_tag_bigrams(tag_dict, mode_recursive, article_url, article_body_root, excluded_tags_fun):
@@ -39,9 +61,8 @@ def final_bigram(dates, out_files, tag_dict, tei_logger):
     """
     _ = dates, tei_logger  # Silence IDE
     out_file = out_files[0]
-    for root_name_attr, (freq, all_links) in tag_dict.items():
-        random_links = random_sample(all_links, k=min(5, len(all_links)))
-        example_links = ' '.join(random_links)
+    for root_name_attr, (freq, links_sample) in tag_dict.items():
+        example_links = ' '.join(links_sample.items)
         print(freq, root_name_attr, example_links, sep='\t', file=out_file)
 
 
@@ -49,6 +70,8 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
     """Init variables for processing a portal: Tag Bigrams Maker (This is the only public function of this file)"""
     _ = log_dir, warc_level_params  # Silence IDE
 
+    run_parallel = run_params.get('run_parallel', False)
+
     article_root_params, decompose_spec, excluded_tags_spec = rest_config_params[1:4]
 
     recursive = run_params.get('recursive')
@@ -56,16 +79,21 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
         tei_logger.log('CRITICAL', 'recursive is not set in run_params!')
         exit(1)
 
+    # The number of the example URLs sampled for each bigram (uniformly, in constant memory)
+    url_sample_size = run_params.get('url_sample_size', 5)
+
     # The internal structure of the accumulator is defined in summarize_tag_bigrams function
-    accumulator = defaultdict(lambda: [0, set()])
-    # No files and after processing needed for each article
-    after_article_fun, after_article_params, log_file_names_and_modes = dummy_fun, (), ()
+    accumulator = new_bigram_dict(url_sample_size)
+    # The partial accumulators of the articles are merged into the accumulator after processing each article
+    #  (no files needed)
+    after_article_fun, after_article_params, log_file_names_and_modes = \
+        merge_partial_accumulator, (accumulator, merge_bigram_dicts), ()
     # Filenames for the final function
     final_filenames_and_modes = ((os_path_join(output_dir, f'{portal_name}_bigrams.tsv'), 'w'),)
     # Run this function after all articles are processed
     final_fun = final_bigram
-    # Process articles one by one with this function
-    process_article_fun = process_article
+    # Process articles one by one with this function (into a new partial accumulator)
+    process_article_fun = process_article_partial
     # From the loaded portal-specific configuration
     #  - TEI logger for logging
     #  - article root params for find all variation of the range of useful parts of articles
@@ -74,11 +102,16 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
     #     with merging the irrelevant variations of values
     # Task specific params:
     #  - (sub)function to run after cleaning the article up (decompose unnecessary parts)
-    #  - the parameters for the subfunction
-    process_article_params = (tei_logger, article_root_params, decompose_spec, excluded_tags_spec,
-                              summarize_tag_bigrams, (accumulator, recursive))
-    # Runner function (some task can be run only in single-process mode)
-    run_fun = run_single_process
+    #  - the parameters for the subfunction (except the partial accumulator)
+    #  - the function to create the partial accumulator of an article
+    process_article_params = ([tei_logger, article_root_params, decompose_spec, excluded_tags_spec,  # Must be list!
+                               summarize_tag_bigrams, (recursive,)],
+                              partial(new_bigram_dict, url_sample_size))
+    # Runner function (the partial accumulators can be computed in parallel)
+    if run_parallel:
+        run_fun = run_multiple_process
+    else:
+        run_fun = run_single_process
 
     return accumulator, after_article_fun, after_article_params, log_file_names_and_modes, final_filenames_and_modes, \
         final_fun, process_article_fun, process_article_params, run_fun
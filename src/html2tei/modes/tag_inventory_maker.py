@@ -1,12 +1,38 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8, vim: expandtab:ts=4 -*-
 
+from functools import partial
 from collections import defaultdict
 from os.path import join as os_path_join
-from random import sample as random_sample
 
 from ..tei_utils import immediate_text, to_friendly
-from ..workflow_helpers.processing_utils import run_single_process, dummy_fun, process_article
+from ..workflow_helpers.processing_utils import run_single_process, run_multiple_process, process_article_partial, \
+    merge_partial_accumulator, ReservoirSample
+
+
+def new_tag_stats(url_sample_size):
+    """The statistics of a tag: frequency, word count, descendant count, the sample of the URLs,
+        length of immediate texts
+        (a module-level function to make the accumulator picklable, see summarize_children_or_subtree)
+    """
+    return [0, 0, 0, ReservoirSample(url_sample_size), 0]
+
+
+def new_tag_dict(url_sample_size):
+    return defaultdict(partial(new_tag_stats, url_sample_size))
+
+
+def merge_tag_dicts(tag_dict, partial_tag_dict):
+    """Merge the (partial) accumulator of some articles into the accumulator of the portal
+        (the statistics are summed, the samples of the URLs are merged)
+    """
+    for tag_name, (freq, no_of_words, no_of_descendants, links, len_of_immediate_text) in partial_tag_dict.items():
+        tag_stats = tag_dict[tag_name]
+        tag_stats[0] += freq
+        tag_stats[1] += no_of_words
+        tag_stats[2] += no_of_descendants
+        tag_stats[3].merge(links)
+        tag_stats[4] += len_of_immediate_text
 
 
 def summarize_children_or_subtree(tag_dict, recursive, article_url, article_body_root, excluded_tags_fun):
@@ -45,9 +71,8 @@ def final_summarize_children_or_subtree(dates, out_files, tag_dict, tei_logger):
           'URL_example', 'normal_name', 'preserved_attribute', sep='\t', file=out_text_fh)
     print('frequency', 'tag', 'average_word_count', 'average_descendant_num', 'immediate_texts_average_length',
           'URL_example', 'normal_name', 'preserved_attribute', sep='\t', file=out_notext_fh)
-    for root_name_attr, (freq, no_of_words, no_of_descendants, all_links, len_of_immediate_text) in tag_dict.items():
-        random_links = random_sample(all_links, k=min(5, len(all_links)))
-        example_links = ' '.join(random_links)
+    for root_name_attr, (freq, no_of_words, no_of_descendants, links_sample, len_of_immediate_text) in tag_dict.items():
+        example_links = ' '.join(links_sample.items)
         avg_no_of_words = no_of_words / freq
         avg_no_of_descendants = no_of_descendants / freq
         avg_len_of_immediate_text = len_of_immediate_text / freq
@@ -66,6 +91,8 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
     """Init variables for processing a portal: Tag Inventory Maker (This is the only public function of this file)"""
     _ = log_dir, warc_level_params  # Silence IDE
 
+    run_parallel = run_params.get('run_parallel', False)
+
     article_root_params, decompose_spec, excluded_tags_spec = rest_config_params[1:4]
 
     recursive = run_params.get('recursive')
@@ -73,17 +100,22 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
         tei_logger.log('CRITICAL', 'recursive is not set in run_params!')
         exit(1)
 
+    # The number of the example URLs sampled for each tag (uniformly, in constant memory)
+    url_sample_size = run_params.get('url_sample_size', 5)
+
     # The internal structure of the accumulator is defined in summarize_children_or_subtree function
-    accumulator = defaultdict(lambda: [0, 0, 0, set(), 0])
-    # No files and after processing needed for each article
-    after_article_fun, after_article_params, log_file_names_and_modes = dummy_fun, (), ()
+    accumulator = new_tag_dict(url_sample_size)
+    # The partial accumulators of the articles are merged into the accumulator after processing each article
+    #  (no files needed)
+    after_article_fun, after_article_params, log_file_names_and_modes = \
+        merge_partial_accumulator, (accumulator, merge_tag_dicts), ()
     # Filenames for the final function
     final_filenames_and_modes = ((os_path_join(output_dir, f'{portal_name}_notext_tags_normal.tsv'), 'w'),
                                  (os_path_join(output_dir, f'{portal_name}_text_tags_normal.tsv'), 'w'))
     # Run this function after all articles are processed
     final_fun = final_summarize_children_or_subtree
-    # Process articles one by one with this function
-    process_article_fun = process_article
+    # Process articles one by one with this function (into a new partial accumulator)
+    process_article_fun = process_article_partial
     # From the loaded portal-specific configuration
     #  - TEI logger for logging
     #  - article root params for find_all
@@ -92,11 +124,16 @@ def init_portal(log_dir, output_dir, run_params, portal_name, tei_logger, warc_l
     #     with merging the irrelevant variations of values
     # Task specific params:
     #  - (sub)function to run after cleaning the article up (decompose unnecessary parts)
-    #  - the parameters for the subfunction
-    process_article_params = (tei_logger, article_root_params, decompose_spec, excluded_tags_spec,
-                              summarize_children_or_subtree, (accumulator, recursive))
-    # Runner function (some task can be run only in single-process mode)
-    run_fun = run_single_process
+    #  - the parameters for the subfunction (except the partial accumulator)
+    #  - the function to create the partial accumulator of an article
+    process_article_params = ([tei_logger, article_root_params, decompose_spec, excluded_tags_spec,  # Must be list!
+                               summarize_children_or_subtree, (recursive,)],
+                              partial(new_tag_dict, url_sample_size))
+    # Runner function (the partial accumulators can be computed in parallel)
+    if run_parallel:
+        run_fun = run_multiple_process
+    else:
+        run_fun = run_single_process
 
     return accumulator, after_article_fun, after_article_params, log_file_names_and_modes, final_filenames_and_modes, \
         final_fun, process_article_fun, process_article_params, run_fun
@@ -2,14 +2,19 @@
 # -*- coding: utf-8, vim: expandtab:ts=4 -*-
 
 from copy import copy
-from collections import defaultdict
+from os import getpid
+from threading import Lock as threading_Lock
+from collections import defaultdict, OrderedDict
 
 from bs4 import Tag
-from bs4.element import NavigableString, Comment
+from bs4.element import NavigableString, Comment, ProcessingInstruction, Declaration
+from lxml import etree
 
 from .correctors.excluded_tags_collection import excluded_tags_general
 from .basic_tag_dicts import INLINE_TAGS, MEDIA_DICT, XML_CONVERT_DICT, TAGNAME_AND_ATTR_TABLE, FIGURE_REND_ATTRS
 
+FRIENDLY_TAG_CACHE_SIZE = 65536  # The number of distinct tags (name and attributes) cached in each process
+
 
 def join_list(inp_list):
     """Helper function used by to_friendly only"""
@@ -18,20 +23,83 @@ def join_list(inp_list):
     return inp_list
 
 
-def to_friendly(ch, excluded_tags_fun):
+def copy_attrs(attrs):
+    """Copy the attributes of a tag with the multi-valued (list type) attributes (like copy.deepcopy)"""
+    return {k: list(v) if isinstance(v, list) else v for k, v in attrs.items()}
+
+
+class FriendlyTagCache:
+    """A bounded LRU cache of to_friendly from the name and the attributes of the tags (and the excluded tags function)
+        to the string form and the simplified name and attributes, as the same tags are repeated thousands of times
+       Each process has its own copy (see friendly_tag_cache), the lock guards it from the threads of the portals
+    """
+    def __init__(self, maxsize=FRIENDLY_TAG_CACHE_SIZE):
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading_Lock()
+        self.hits = 0
+        self.misses = 0
+        self._reported_lookups = 0
+
+    def get(self, signature):
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(signature)
+            return entry
+
+    def put(self, signature, entry):
+        with self._lock:
+            self._entries[signature] = entry
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def log_stats(self, tei_logger, min_new_lookups=0):
+        """Log the hit rate if there were at least min_new_lookups lookups since the last report"""
+        lookups = self.hits + self.misses
+        if lookups == 0 or lookups - self._reported_lookups < min_new_lookups:
+            return
+        self._reported_lookups = lookups
+        tei_logger.log('INFO', f'Tag signature cache of process {getpid()}: {self.hits} hits of {lookups} lookups'
+                               f' ({self.hits / lookups:.1%}), {len(self._entries)} entries')
+
+
+friendly_tag_cache = FriendlyTagCache()
+
+
+def to_friendly(ch, excluded_tags_fun, keep_attrs=False):
     """This function convert tag name and sorted attributes to string in order to use it later
        (e.g. tag_freezer in the tables)
+       The tag is simplified by the excluded tags functions in place (its attributes are kept if keep_attrs is True)
+        and the results are cached by the name and the attributes of the tag (see FriendlyTagCache)
     """
-    ch = excluded_tags_fun(ch)
-    ch = excluded_tags_general(ch)
-    attrs = ' ' + ' '.join(k + '=' + join_list(v) for k, v in sorted(ch.attrs.items()))
-    if len(attrs) == 1:
-        attrs = ''
-    if '\n' in attrs:
-        attrs = attrs.replace('\n', ' ')
-    if '\r' in attrs:
-        attrs = attrs.replace('\r', ' ')
-    return f'<{ch.name}{attrs}>'
+    original_attrs = ch.attrs
+    signature = (excluded_tags_fun, ch.name,
+                 tuple((k, tuple(v)) if isinstance(v, list) else (k, v) for k, v in original_attrs.items()))
+    entry = friendly_tag_cache.get(signature)
+    if entry is None:
+        ch.attrs = copy_attrs(original_attrs)  # The cached attributes must not be modified through the tag
+        ch = excluded_tags_fun(ch)
+        ch = excluded_tags_general(ch)
+        attrs = ' ' + ' '.join(k + '=' + join_list(v) for k, v in sorted(ch.attrs.items()))
+        if len(attrs) == 1:
+            attrs = ''
+        if '\n' in attrs:
+            attrs = attrs.replace('\n', ' ')
+        if '\r' in attrs:
+            attrs = attrs.replace('\r', ' ')
+        entry = (f'<{ch.name}{attrs}>', ch.name, copy_attrs(ch.attrs))
+        friendly_tag_cache.put(signature, entry)
+        if keep_attrs:
+            ch.attrs = original_attrs
+    else:
+        ch.name = entry[1]
+        if not keep_attrs:
+            ch.attrs = copy_attrs(entry[2])
+    return entry[0]
 
 
 def immediate_text(tag):
@@ -48,6 +116,33 @@ def real_text_length(tag):
     return sum(int(not i.isspace()) for i in tag.text)
 
 
+def real_text_lengths(root):
+    """This function computes real_text_length for the root and all of its descendant tags (keyed by their id)
+        in one bottom-up pass instead of rebuilding the text of the subtree for every tag (tag.text).
+       The lengths remain valid while the tags are only renamed, wrapped or unwrapped (their text does not change)
+    """
+    subtree_lengths = {}  # The lengths by string type (see Tag.interesting_string_types) for the processed subtrees
+    lengths = {}
+    # Reversed document order: the children are processed before their parent
+    for tag in reversed([root, *(desc for desc in root.descendants if isinstance(desc, Tag))]):
+        tag_lengths = defaultdict(int)
+        for child in tag.contents:
+            if isinstance(child, Tag):
+                for string_type, length in subtree_lengths.pop(id(child)).items():
+                    tag_lengths[string_type] += length
+            elif isinstance(child, NavigableString):
+                tag_lengths[type(child)] += sum(int(not i.isspace()) for i in child)
+        subtree_lengths[id(tag)] = tag_lengths
+        # The same string types are counted as in tag.text
+        string_types = tag.interesting_string_types
+        if string_types is None:
+            string_types = Tag.MAIN_CONTENT_STRING_TYPES
+        elif isinstance(string_types, type):
+            string_types = {string_types}
+        lengths[id(tag)] = sum(length for string_type, length in tag_lengths.items() if string_type in string_types)
+    return lengths
+
+
 def imtext_children_descendants_of_tag(tag):
     """This function return the following information on the parameter tag:
         1. The number of words (non-whitespace text) immediately below the tag
@@ -120,6 +215,114 @@ def create_new_tag_with_string(beauty_xml, tag_string, tag_name, append_to=None)
         return the_new_tag
 
 
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+# The TEI elements of the article bodies with mixed content (text and elements) in which the whitespace-only strings
+#  separate the words (e.g. <p><hi>Hello</hi> <hi>world</hi></p>), therefore they are never dropped (see bs4_to_etree)
+TEI_MIXED_CONTENT_TAGS = {'p', 'hi', 'ref', 'head', 'item', 'quote', 'q', 'note', 'cell', 'label', 'lead', 'ab', 'l',
+                          'seg', 'emph', 'foreign', 'del', 'add', 'sic', 'corr', 'caption', 'figDesc'}
+
+
+def _etree_name(name, prefix, namespace, namespaces, is_attribute=False):
+    """Convert a (prefixed) BeautifulSoup tag or attribute name to the {namespace}name form of lxml
+        resolving the prefixes of the tags created with new_tag('prefix:name') by the namespaces in scope
+    """
+    if ':' in name:
+        prefix, name = name.split(':', maxsplit=1)
+    if not namespace:
+        if prefix == 'xml':
+            namespace = XML_NAMESPACE
+        elif prefix is not None:
+            namespace = namespaces.get(prefix)
+            if namespace is None:
+                raise ValueError(f'Undefined namespace prefix: {prefix}')
+        elif not is_attribute:  # Unprefixed tags are in the default namespace, unprefixed attributes are not
+            namespace = namespaces.get(None)
+    if namespace:
+        return f'{{{namespace}}}{name}'
+    return name
+
+
+def _etree_element(tag, parent, namespaces):
+    """Create the lxml element of the tag (without its contents) and return it with the namespaces in its scope"""
+    declared_namespaces, attrs = {}, {}
+    for key, value in tag.attrs.items():
+        if key == 'xmlns' or key.startswith('xmlns:'):
+            declared_namespaces[key[6:] or None] = value
+    if len(declared_namespaces) > 0:
+        namespaces = {**namespaces, **declared_namespaces}
+    for key, value in tag.attrs.items():
+        if key == 'xmlns' or key.startswith('xmlns:'):
+            continue
+        if isinstance(value, list):  # Multi-valued attributes (e.g. class)
+            value = ' '.join(value)
+        attrs[_etree_name(key, getattr(key, 'prefix', None), getattr(key, 'namespace', None), namespaces,
+                          is_attribute=True)] = str(value)
+    name = _etree_name(tag.name, tag.prefix, tag.namespace, namespaces)
+    if parent is None:
+        element = etree.Element(name, attrs, nsmap=declared_namespaces)
+    else:
+        element = etree.SubElement(parent, name, attrs, nsmap=declared_namespaces)
+    return element, namespaces
+
+
+def _etree_special_node(child):
+    """Convert comments and processing instructions (None for other strings)"""
+    if isinstance(child, Comment):
+        return etree.Comment(str(child))
+    if isinstance(child, ProcessingInstruction):
+        target, *text = str(child).rstrip('?').split(maxsplit=1)
+        return etree.ProcessingInstruction(target, *text)
+    return None
+
+
+def bs4_to_etree(beauty_xml):
+    """Convert a BeautifulSoup XML document to an lxml ElementTree without serializing and parsing it
+        The indentation is dropped: the whitespace-only strings in elements whose other children are all elements,
+         except in the TEI elements with mixed content (TEI_MIXED_CONTENT_TAGS) where they separate the words
+        Raises ValueError if the document is not well-formed XML (e.g. invalid names or characters)
+    """
+    root, preceding_nodes = None, []
+    for child in beauty_xml.contents:
+        if isinstance(child, Tag):
+            root = child
+            break
+        special_node = _etree_special_node(child)
+        if special_node is not None and not isinstance(child, Declaration) and \
+                not (isinstance(special_node, etree._ProcessingInstruction) and special_node.target == 'xml'):
+            preceding_nodes.append(special_node)
+    if root is None:
+        raise ValueError('No root element!')
+
+    root_element, namespaces = _etree_element(root, None, {})
+    stack = [(root, root_element, namespaces)]
+    # The tree is traversed without recursion as the nesting of the articles can be arbitrarily deep
+    while len(stack) > 0:
+        tag, element, namespaces = stack.pop()
+        element_only = tag.name not in TEI_MIXED_CONTENT_TAGS and \
+            any(isinstance(child, Tag) for child in tag.contents) and \
+            all(not isinstance(child, NavigableString) or _etree_special_node(child) is not None or
+                len(child.strip()) == 0 for child in tag.contents)
+        last = None
+        for child in tag.contents:
+            if isinstance(child, Tag):
+                last, child_namespaces = _etree_element(child, element, namespaces)
+                stack.append((child, last, child_namespaces))
+                continue
+            special_node = _etree_special_node(child)
+            if special_node is not None:
+                element.append(special_node)
+                last = special_node
+            elif not element_only:
+                if last is None:
+                    element.text = (element.text or '') + child
+                else:
+                    last.tail = (last.tail or '') + child
+
+    for node in preceding_nodes:
+        root_element.addprevious(node)
+    return root_element.getroottree()
+
+
 def language_attr_recognition(original_tag):
     """It saves the attribute that contains language code. Filtering is very basic"""
     for k, v in original_tag.attrs.items():
@@ -139,7 +342,7 @@ def complex_wrapping(bs, root_tag, default_wrapper, article_url, tei_logger):
        For e.g. going through the subtrees of a box/frame, the direct text and tags
         under the root are wrapped in this method to a paragraph tag, which is the default divider
     """
-    tei_logger.log('DEBUG', f'complex_wrapping in {article_url}')
+    tei_logger.log('DEBUG', 'complex_wrapping in', article_url)
     naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(root_tag)
     if child_tags <= INLINE_TAGS and root_tag.name not in MEDIA_DICT.keys():
         root_tag.wrap(bs.new_tag(root_tag.name))
@@ -175,7 +378,7 @@ def complex_wrapping_for_news_feed(bs, article_tag, default_wrapper, article_url
     """
     naked_text, child_tags, desc_tags = imtext_children_descendants_of_tag(article_tag)
     if child_tags != {'div'}:
-        tei_logger.log('DEBUG', f'complex_wrapping_for_news_feed in {article_url}')
+        tei_logger.log('DEBUG', 'complex_wrapping_for_news_feed in', article_url)
         root_contents = []
         naked_text_and_inline_tag = ''
         contents_list = copy(article_tag.contents)
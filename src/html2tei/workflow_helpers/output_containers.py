@@ -0,0 +1,296 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+from io import BytesIO
+from time import time, localtime
+from datetime import datetime
+from collections import namedtuple
+from tarfile import TarFile, TarInfo
+from json import dumps as json_dumps
+from os import makedirs, listdir, remove
+from zlib import compressobj, crc32, DEFLATED, MAX_WBITS
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED
+from os.path import dirname, join as os_path_join
+
+# The files of the containers are written in blocks of this size
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+# The ways of splitting the output of a portal into multiple containers (see OutputContainers)
+SHARD_BY = ('size', 'date')
+DEFAULT_SHARD_SIZE_MB = 1024
+
+# A member of a zip file compressed in advance (see deflate)
+DeflatedMember = namedtuple('DeflatedMember', ('compressed_data', 'crc', 'file_size'))
+
+# Only OUTPUT_CONTAINERS, SHARD_BY, DEFAULT_SHARD_SIZE_MB, OutputContainers and deflate are used outside of this file
+
+
+def zip_date_time(modification_time):
+    """The date and time of the zip entries from the modification time in ISO format (None: the current time)
+        The earliest date supported by the zip format is 1980-01-01
+    """
+    if modification_time is None:
+        return None
+    return max((1980, 1, 1, 0, 0, 0), datetime.fromisoformat(modification_time).timetuple()[:6])
+
+
+def deflate(data, compress_level):
+    """Compress the data of a zip member (raw deflate as in zip files) and compute its CRC and size in advance:
+        it can be done in the worker processes in parallel and ZipContainer.write only inserts the result as is
+    """
+    compressor = compressobj(compress_level, DEFLATED, -MAX_WBITS)
+    return DeflatedMember(compressor.compress(data) + compressor.flush(), crc32(data), len(data))
+
+
+def open_truncated(filename, state):
+    """Open the file of a container for writing from the end of its last checkpointed member (if state is not None)"""
+    if state is None:
+        return open(filename, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+    end_offset, _ = state
+    fh = open(filename, 'r+b', buffering=OUTPUT_BUFFER_SIZE)
+    fh.truncate(end_offset)
+    fh.seek(end_offset)
+    return fh
+
+
+class ZipContainer:
+    """A zip file with the members stored or compressed with deflate (compress_level: 0-9, None: stored)
+       The members are written directly with their CRC and sizes known in advance (the members compressed
+        in the workers are inserted as is, see deflate), the ZipFile only writes the central directory on close
+       Its state (see checkpoint) is the end offset of its last entry and the entries written since the previous
+        checkpoint, the file is restored from the state by continuing it after the last entry
+    """
+    suffix = '.zip'
+
+    def __init__(self, filename, compress_level=None, modification_time=None, state=None):
+        entries = [] if state is None else state[1]
+        self._fh = open_truncated(filename, state)
+        # In 'w' mode with a file object the central directory is written from the current position on close
+        self._zipfile = ZipFile(self._fh, 'w')
+        for entry in entries:
+            self._zipfile.filelist.append(entry)
+            self._zipfile.NameToInfo[entry.filename] = entry
+        self._journaled_entries = len(entries)
+        self._compress_level = compress_level
+        self._date_time = zip_date_time(modification_time)
+
+    @property
+    def size(self):
+        return self._fh.tell()
+
+    def write(self, member_name, data, url=None):
+        """Write the data (bytes or DeflatedMember) as a member (stored or compressed according to compress_level)"""
+        _ = url  # Not stored
+        if not isinstance(data, DeflatedMember) and self._compress_level is not None:
+            data = deflate(data, self._compress_level)
+        # The same as ZipFile.writestr() sets for a filename (the current time if no modification time is fixed)
+        zip_info = ZipInfo(member_name, self._date_time or localtime(time())[:6])
+        zip_info.external_attr = 0o600 << 16
+        if isinstance(data, DeflatedMember):
+            zip_info.compress_type = ZIP_DEFLATED
+            zip_info.CRC, zip_info.file_size = data.crc, data.file_size
+            data = data.compressed_data
+        else:
+            zip_info.compress_type = ZIP_STORED
+            zip_info.CRC, zip_info.file_size = crc32(data), len(data)
+        zip_info.compress_size = len(data)
+        zip_info.header_offset = self._fh.tell()
+        self._fh.write(zip_info.FileHeader())  # The header is final, it is not needed to seek back to update it
+        self._fh.write(data)
+        self._zipfile.filelist.append(zip_info)
+        self._zipfile.NameToInfo[member_name] = zip_info
+        self._zipfile.start_dir = self._fh.tell()
+
+    def checkpoint(self):
+        self._fh.flush()
+        entries = self._zipfile.infolist()
+        new_entries = entries[self._journaled_entries:]
+        self._journaled_entries = len(entries)
+        return self._fh.tell(), new_entries  # The end of the last entry as the central directory is written on close
+
+    def close(self):
+        self._zipfile.close()
+        self._fh.close()
+
+
+class TarContainer:
+    """An uncompressed tar file written as a stream, its state (see checkpoint) is the end offset of its last member
+        (compress_level is ignored as compressed tar files can not be continued on resume)
+    """
+    suffix = '.tar'
+
+    def __init__(self, filename, compress_level=None, modification_time=None, state=None):
+        _ = compress_level  # To be a drop-in replacement
+        self._fh = open_truncated(filename, state)
+        self._tarfile = TarFile(fileobj=self._fh, mode='w')  # Writes from the current position of the file
+        self._mtime = None
+        if modification_time is not None:
+            self._mtime = datetime.fromisoformat(modification_time).timestamp()
+
+    @property
+    def size(self):
+        return self._fh.tell()
+
+    def write(self, member_name, data, url=None):
+        _ = url  # Not stored
+        tar_info = TarInfo(member_name)
+        tar_info.size = len(data)
+        tar_info.mode = 0o600
+        tar_info.mtime = time() if self._mtime is None else self._mtime
+        self._tarfile.addfile(tar_info, BytesIO(data))
+
+    def checkpoint(self):
+        self._fh.flush()
+        return self._fh.tell(), []
+
+    def close(self):
+        self._tarfile.close()  # Writes the end-of-archive marker
+        self._fh.close()
+
+
+class JsonlContainer:
+    """A JSON Lines file with one object for each member (the name, the URL and the XML as string),
+        its state (see checkpoint) is the end offset of its last line
+    """
+    suffix = '.jsonl'
+
+    def __init__(self, filename, compress_level=None, modification_time=None, state=None):
+        _ = compress_level, modification_time  # To be a drop-in replacement
+        self._fh = open_truncated(filename, state)
+
+    @property
+    def size(self):
+        return self._fh.tell()
+
+    def write(self, member_name, data, url=None):
+        self._fh.write(json_dumps({'name': member_name, 'url': url, 'tei': data.decode('UTF-8')},
+                                  ensure_ascii=False).encode('UTF-8'))
+        self._fh.write(b'\n')
+
+    def checkpoint(self):
+        self._fh.flush()
+        return self._fh.tell(), []
+
+    def close(self):
+        self._fh.close()
+
+
+class DirContainer:
+    """A directory with one file for each member (can not be sharded, the files written after the last checkpoint
+        are overwritten on resume as they get the same names)
+    """
+    suffix = ''
+
+    def __init__(self, filename, compress_level=None, modification_time=None, state=None):
+        _ = compress_level, modification_time  # To be a drop-in replacement
+        self._dirname = filename
+        self._size = 0 if state is None else state[0]
+        makedirs(filename, exist_ok=True)
+
+    @property
+    def size(self):
+        return self._size
+
+    def write(self, member_name, data, url=None):
+        _ = url  # Not stored
+        filename = os_path_join(self._dirname, member_name)
+        makedirs(dirname(filename), exist_ok=True)
+        with open(filename, 'wb') as fh:
+            fh.write(data)
+        self._size += len(data)
+
+    def checkpoint(self):
+        return self._size, []
+
+    def close(self):
+        pass
+
+
+OUTPUT_CONTAINERS = {'zip': ZipContainer, 'tar': TarContainer, 'jsonl': JsonlContainer, 'dir': DirContainer}
+
+
+class OutputContainers:
+    """The container(s) of the output files of a portal (see OUTPUT_CONTAINERS) named after base_filename:
+        - not sharded (shard_by is None): base_filename + the suffix of the container (e.g. .zip)
+        - sharded by size: base_filename/00000.zip, base_filename/00001.zip, etc.
+         a new shard is started when the current one reaches shard_size_mb
+        - sharded by date: base_filename/YEAR.zip by the year of the date directory of the written files
+         (see write) or base_filename/unknown.zip
+       The states of the containers (see checkpoint) are journaled by OutputCheckpoints and the containers are restored
+        from them on resume (states), the shards not in the states are removed as they were written after the last
+        checkpoint (or by an earlier run)
+    """
+    def __init__(self, container, base_filename, shard_by=None, shard_size_mb=DEFAULT_SHARD_SIZE_MB,
+                 compress_level=None, modification_time=None, states=None):
+        self._container_class = OUTPUT_CONTAINERS[container]
+        self._base_filename = base_filename
+        self._shard_by = shard_by
+        self._shard_size = shard_size_mb * 1024 * 1024
+        self._container_params = (compress_level, modification_time)
+        self._open_shards = {}  # Shard name -> container
+        self._closed_shard_states = {}  # The final states of the shards closed since the last checkpoint
+        self._curr_size_shard = None
+
+        if states is None:
+            states = {}
+        if shard_by is not None:
+            makedirs(base_filename, exist_ok=True)
+            suffix = self._container_class.suffix
+            for filename in listdir(base_filename):
+                if filename.endswith(suffix) and filename[:-len(suffix)] not in states:
+                    remove(os_path_join(base_filename, filename))
+
+        for shard_name, state in states.items():
+            self._open_shards[shard_name] = self._container_class(self._shard_filename(shard_name),
+                                                                  *self._container_params, state=state)
+        if shard_by == 'size' and len(states) > 0:
+            # Only the last shard is continued, the others are completed
+            self._curr_size_shard = max(states.keys())
+            for shard_name in list(self._open_shards.keys()):
+                if shard_name != self._curr_size_shard:
+                    self._open_shards.pop(shard_name).close()
+
+    def _shard_filename(self, shard_name):
+        if self._shard_by is None:
+            return f'{self._base_filename}{self._container_class.suffix}'
+        return os_path_join(self._base_filename, f'{shard_name}{self._container_class.suffix}')
+
+    def _get_shard(self, shard_name):
+        container = self._open_shards.get(shard_name)
+        if container is None:
+            container = self._container_class(self._shard_filename(shard_name), *self._container_params)
+            self._open_shards[shard_name] = container
+        return container
+
+    def write(self, member_name, data, url=None, date_dir=None):
+        """Write the file (data) with member_name into the container which is selected by the date directory
+            of the file (e.g. 2020-01-31 or unknown_date) if sharded by date
+        """
+        if self._shard_by is None:
+            shard_name = None
+        elif self._shard_by == 'date':
+            shard_name = 'unknown'
+            if date_dir is not None and date_dir[:4].isdigit():
+                shard_name = date_dir[:4]
+        else:
+            if self._curr_size_shard is None:
+                self._curr_size_shard = f'{0:05d}'
+            elif self._open_shards[self._curr_size_shard].size >= self._shard_size:
+                full_shard = self._open_shards.pop(self._curr_size_shard)
+                self._closed_shard_states[self._curr_size_shard] = full_shard.checkpoint()
+                full_shard.close()
+                self._curr_size_shard = f'{int(self._curr_size_shard) + 1:05d}'
+            shard_name = self._curr_size_shard
+        self._get_shard(shard_name).write(member_name, data, url)
+
+    def checkpoint(self):
+        """Flush the containers and return their states (the end offset and the new entries by shard name)"""
+        states = self._closed_shard_states
+        self._closed_shard_states = {}
+        for shard_name, container in self._open_shards.items():
+            states[shard_name] = container.checkpoint()
+        return states
+
+    def close(self):
+        for container in self._open_shards.values():
+            container.close()
+        self._open_shards = {}
@@ -2,17 +2,35 @@
 # -*- coding: utf-8, vim: expandtab:ts=4 -*-
 
 
-from multiprocessing import Pool, Manager
-from contextlib import contextmanager
-from os.path import isdir as os_path_isdir
-from threading import Lock as threading_Lock
-from datetime import datetime, MINYEAR, MAXYEAR
+import sys
+import logging
+from functools import partial, lru_cache
+from os import getpid, remove
+from time import perf_counter
+from itertools import islice, count
+from queue import SimpleQueue as queue_SimpleQueue
+from collections import OrderedDict
+from multiprocessing import Pool, SimpleQueue, cpu_count
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock as threading_Lock, Thread, Event
+from tempfile import TemporaryDirectory, NamedTemporaryFile
+from pickle import dump as pickle_dump, dumps as pickle_dumps, load as pickle_load, loads as pickle_loads, \
+    HIGHEST_PROTOCOL
+from os.path import isdir as os_path_isdir, isfile as os_path_isfile, getsize as os_path_getsize, \
+    join as os_path_join
+from datetime import datetime, timedelta, timezone, MINYEAR, MAXYEAR
+from re import compile as re_compile, escape as re_escape, IGNORECASE
 from locale import setlocale, LC_ALL, Error as locale_Error
+from random import randrange as random_randrange, sample as random_sample
 
 from bs4 import BeautifulSoup
-from webarticlecurator import WarcCachingDownloader
+from warcio.archiveiterator import ArchiveIterator
 
+from ..tei_utils import friendly_tag_cache
 from ..correctors.unicode_error import unicode_test
+from ..workflow_helpers.warc_index import init_warc_index
+from ..workflow_helpers.result_cache import init_result_cache
 from ..workflow_helpers.read_config import check_exists, read_input_config, read_portalspec_config
 
 
@@ -32,57 +50,412 @@ def extract_resp_record_data(resp):
     return warc_response_datetime, warc_id, raw_html
 
 
-def aggregated_multipage_articles_gen(warc_level_params, run_parameters):
-    """Create a generator of article, response date, WARC ID, raw HTML tuples
-       where multi-page articles are treated as one entry
+class ArticleAssembler:
+    """Read the pages of the articles from the WARC file(s) following the next-page links of the pages
+        The WARC files are opened lazily by each process using the object, therefore it can be shared with the workers
+         while the parent process only enumerates the first pages of the articles (see init_article_assembler)
+    """
+    def __init__(self, warc_filenames, warc_index, blacklist, logger, next_page_of_article_fun,
+                 transform_to_html_fun):
+        self._warc_filenames = warc_filenames
+        self._warc_index = warc_index  # URL -> (WARC filename, offset, length of the response record)
+        self._blacklist = blacklist
+        self._logger = logger
+        self._next_page_of_article_fun = next_page_of_article_fun
+        self._transform_to_html_fun = transform_to_html_fun
+        self._streams = {}
+        self._streams_pid = None
+
+    def _get_response_record(self, url):
+        if self._streams_pid != getpid():  # Forked processes must not share the file offsets with their parent
+            self._streams = {}
+            self._streams_pid = getpid()
+        warc_filename, offset, _ = self._warc_index.get(url)
+        stream = self._streams.get(warc_filename)
+        if stream is None:
+            stream = open(warc_filename, 'rb')
+            self._streams[warc_filename] = stream
+        stream.seek(offset)
+        return next(iter(ArchiveIterator(stream, check_digests='raise')))
+
+    def record_id(self, url):
+        """Return the WARC-Record-ID of the response record of the URL (without reading its content)"""
+        return self._get_response_record(url).rec_headers.get_header('WARC-Record-ID')
+
+    def pages_of_article(self, article_url, warc_response_dates):
+        """Create a generator of URL, response date, WARC ID, raw HTML, parsed HTML tuples for the pages of the article
+            starting from its first page and collect the WARC response dates of the pages into warc_response_dates
+           The HTML of each page is parsed once to be shared by the next-page detection and the further processing
+        """
+        while article_url is not None:
+            # Process URL and yield page data
+            warc_response_datetime, warc_id, raw_html = \
+                extract_resp_record_data(self._get_response_record(article_url))
+            if raw_html is None:
+                self._logger.log('CRITICAL', f'UnicodeDecodeError {article_url} in the archive {self._warc_filenames}!')
+                article_url = None
+
+            warc_response_dates.append(warc_response_datetime)
+            raw_html = self._transform_to_html_fun(article_url, raw_html, self._logger)
+            bs = None
+            if raw_html is not None:
+                bs = BeautifulSoup(raw_html, 'lxml')
+
+            # Generate next page URL (before yielding as the consumer may modify the parsed HTML)
+            next_article_url = None
+            if article_url is not None:
+                next_article_url = self._next_page_of_article_fun(bs)
+
+            if next_article_url is None or next_article_url in self._blacklist:
+                next_article_url = None
+            elif next_article_url not in self._warc_index:
+                self._logger.log('CRITICAL', f'The next_page URL {next_article_url} does not present'
+                                             f' in the archive {self._warc_filenames}!')
+                next_article_url = None
+
+            yield article_url, warc_response_datetime, warc_id, raw_html, bs
+            article_url = next_article_url
+
+
+def first_pages_of_articles_gen(url_index, blacklist, multipage_compile, skip_urls=frozenset()):
+    """Create a generator of the first page URLs of the articles (not on blacklist)
+        except the ones in skip_urls (e.g. already processed by a previous run)
+    """
+    for article_url in url_index:
+        if article_url in blacklist or article_url in skip_urls or multipage_compile.match(article_url):
+            continue
+        yield article_url
+
+
+def init_article_assembler(warc_level_params, logger, skip_urls=frozenset()):
+    """Index the WARC file(s) and create the generator of the first pages of the articles
+        (except the ones in skip_urls) and the ArticleAssembler (logging with logger)
+        to read the articles from them
     """
     # We use these variables here, the others are passed blindly to the other processing levels
-    warc_filenames, blacklist, multipage_compile, warc_logger, date_interval, next_page_of_article_fun, \
+    warc_filenames, blacklist, multipage_compile, warc_logger, _, next_page_of_article_fun, \
         transform_to_html_fun = warc_level_params
 
-    # Init WARC cache
-    warc_reader = WarcCachingDownloader(warc_filenames, None, warc_logger, just_cache=True,
-                                        download_params={'strict_mode': True, 'check_digest': True})
+    # Only the locations of the response records are needed to read the pages,
+    #  they are stored in a persistent index next to the WARC files (built on the first run)
+    warc_index = init_warc_index(warc_filenames, warc_logger)
+
+    first_pages = first_pages_of_articles_gen(warc_index, blacklist, multipage_compile, skip_urls)
+    article_assembler = ArticleAssembler(warc_filenames, warc_index, blacklist, logger,
+                                         next_page_of_article_fun, transform_to_html_fun)
+    return first_pages, article_assembler
+
+
+def assemble_and_process_article(article_assembler, main_function, article_url, run_parameters, result_cache=None):
+    """Read the pages of the article with article_assembler and process them with main_function
+        (multi-page articles are treated as one entry) and return the WARC response dates of the pages with the result
+       If the result is in result_cache (ResultCache) it is returned without processing,
+        else the WARC-Record-ID of the first page is also returned to store the new result (see store_new_results)
+    """
+    record_id = None
+    if result_cache is not None:
+        record_id = article_assembler.record_id(article_url)
+        cached_result = result_cache.get(record_id)
+        if cached_result is not None:
+            return (None, *cached_result)
+
+    warc_response_dates = []
+    article = article_assembler.pages_of_article(article_url, warc_response_dates)
+    ret = main_function((article, run_parameters))
+    for _ in article:  # Read the remaining pages if main_function did not consume all of them
+        pass
+    return record_id, warc_response_dates, ret
+
+
+def store_new_results(results, result_cache):
+    """Store the new results of assemble_and_process_article in result_cache (if it is not None)
+        and strip the WARC-Record-IDs from the results
+    """
+    for record_id, warc_response_dates, ret in results:
+        if record_id is not None:
+            result_cache.put(record_id, (warc_response_dates, ret))
+        yield warc_response_dates, ret
+    if result_cache is not None:
+        result_cache.commit()
+
+
+def track_warc_date_interval(results, date_interval):
+    """Strip the WARC response dates from the results of assemble_and_process_article (through store_new_results)
+        and compute their interval while yielding the results
+    """
     # Set defaults
     date_max = datetime(MINYEAR, 1, 1)
     date_min = datetime(MAXYEAR, 1, 1)
 
-    for article_url in warc_reader.url_index:
-        if article_url in blacklist or multipage_compile.match(article_url):
-            continue
-        # Articles first pages not on blacklist
-        article = []
-        while article_url is not None:
-            # Process URL and append page data to article list
-            _, _, resp = warc_reader.get_records(article_url)  # From WebArticleCurator
-            warc_response_datetime, warc_id, raw_html = extract_resp_record_data(resp)
-            if raw_html is None:
-                warc_logger.log('CRITICAL', f'UnicodeDecodeError {article_url} in the archive {warc_filenames}!')
-                article_url = None
-
+    for warc_response_dates, ret in results:
+        for warc_response_datetime in warc_response_dates:
             date_min = min(date_min, warc_response_datetime)
             date_max = max(date_max, warc_response_datetime)
-            raw_html = transform_to_html_fun(article_url, raw_html, warc_logger)
-            article.append((article_url, warc_response_datetime, warc_id, raw_html))
-
-            # Generate next page URL
-            if article_url is not None:
-                article_url = next_page_of_article_fun(raw_html)
-
-            if article_url is None or article_url in blacklist:
-                article_url = None
-            elif article_url not in warc_reader.url_index:
-                warc_logger.log('CRITICAL', f'The next_page URL {article_url} does not present'
-                                            f' in the archive {warc_filenames}!')
-                article_url = None
-
-        yield article, run_parameters  # Return the gathered article
+        yield ret
 
     # Return the computed date interval to the cally by modifying the parameter
     date_interval['date_min'] = date_min
     date_interval['date_max'] = date_max
 
 
+# The contexts (article assembler, main function and its parameters) of the portals in the worker process
+#  by the name of the file they are published in and the number of portals processed concurrently
+#  which is set by the initializer of the pool (see WorkerPool)
+_worker_portal_contexts = OrderedDict()
+_worker_max_portal_contexts = 1
+# The workers log the stats of their tag signature cache (see tei_utils.FriendlyTagCache) after this many new lookups
+WORKER_CACHE_STATS_INTERVAL = 1000000
+
+
+# The queue of the log records sent to the parent process (see WorkerLogger) set by the initializer of the pool
+_worker_log_queue = None
+_worker_log_records = []  # The records waiting to be sent in one batch (see flush_worker_logs)
+WORKER_LOG_BATCH_SIZE = 1000
+LOG_LEVELS = {'DEBUG': logging.DEBUG, 'INFO': logging.INFO, 'WARNING': logging.WARNING, 'ERROR': logging.ERROR,
+              'CRITICAL': logging.CRITICAL}
+
+
+def _init_worker(max_portal_contexts, log_queue):
+    global _worker_max_portal_contexts, _worker_log_queue
+    _worker_max_portal_contexts = max_portal_contexts
+    _worker_log_queue = log_queue
+
+
+def min_log_level(logger):
+    """The lowest level of the records logged by logger (mplogger.Logger does not expose it, DEBUG if not known)"""
+    python_logger = getattr(logger, '_logger', None)
+    if python_logger is None:
+        return logging.DEBUG
+    return python_logger.getEffectiveLevel()
+
+
+class WorkerLogger:
+    """The picklable stand-in of the logger of a portal in the workers (see WorkerPool.log_channel)
+        The records below the level of the logger are dropped before formatting, the others are formatted
+         and sent to the parent process in batches (see flush_worker_logs) to be logged there
+    """
+    __slots__ = ('_channel', '_min_level')
+
+    def __init__(self, channel, min_level):
+        self._channel = channel
+        self._min_level = min_level
+
+    def log(self, level, *message, sep=' ', end='\n', file=None):
+        """A print()-like logging function (see mplogger.Logger.log)"""
+        _ = file  # Silence IDE
+        if LOG_LEVELS.get(level, logging.CRITICAL) < self._min_level:
+            return
+        _worker_log_records.append((self._channel, level, sep.join(str(msg) for msg in message), end))
+        # CRITICAL records may be followed by exit()
+        if len(_worker_log_records) >= WORKER_LOG_BATCH_SIZE or level == 'CRITICAL':
+            flush_worker_logs()
+
+
+def flush_worker_logs():
+    """Send the buffered log records of the worker to the parent process in one batch"""
+    if len(_worker_log_records) > 0:
+        _worker_log_queue.put(list(_worker_log_records))
+        _worker_log_records.clear()
+
+
+def _get_worker_portal_context(context_filename):
+    """Load the context of a portal published by the parent process (WorkerPool.portal_context) once per worker
+        and keep the contexts of the portals being processed concurrently
+    """
+    context = _worker_portal_contexts.get(context_filename)
+    if context is None:
+        with open(context_filename, 'rb') as fh:
+            parent_sys_path, pickled_context = pickle_load(fh)
+        # The portal-specific configs are imported from their directories (see import_python_file)
+        sys.path.extend(path for path in parent_sys_path if path not in sys.path)
+        context = pickle_loads(pickled_context)
+        _worker_portal_contexts[context_filename] = context
+        if len(_worker_portal_contexts) > _worker_max_portal_contexts:
+            _worker_portal_contexts.popitem(last=False)  # The least recently used one is finished already
+    else:
+        _worker_portal_contexts.move_to_end(context_filename)
+    return context
+
+
+def _assemble_and_process_articles_in_worker(context_filename, article_urls):
+    """Process a chunk of articles and return the time it took with the pickled list of the results
+        (they are unpickled by the parent process when they are next in order, see WorkerPool.imap_bounded)
+    """
+    start_time = perf_counter()
+    article_assembler, main_function, run_parameters, result_cache = _get_worker_portal_context(context_filename)
+    try:
+        results = [assemble_and_process_article(article_assembler, main_function, article_url, run_parameters,
+                                                result_cache) for article_url in article_urls]
+        friendly_tag_cache.log_stats(run_parameters[0][0], WORKER_CACHE_STATS_INTERVAL)
+    finally:
+        # The records are sent before the results (the queue writes synchronously) to be logged before the portal ends
+        flush_worker_logs()
+    return perf_counter() - start_time, pickle_dumps(results, HIGHEST_PROTOCOL)
+
+
+# The defaults of the scheduling of the articles in parallel mode (see WorkerPool.imap_bounded)
+MAX_IN_FLIGHT_ARTICLES_PER_WORKER = 256
+MAX_PENDING_RESULTS_MB = 256
+TARGET_CHUNK_SECONDS = 0.5  # The chunks of articles are sized to be processed in about this much time
+INITIAL_CHUNK_SIZE = 16
+
+
+class WorkerPool:
+    """A pool of worker processes shared by the portals processed concurrently
+        As the pool outlives the portals, the context of each portal is published to the workers through a file
+         which is loaded by each worker once (see run_multiple_process)
+       The workers send their log records through one queue inherited from the parent process in batches
+        which are dispatched to the loggers of the portals by a listener thread (see log_channel)
+       The articles of each portal are scheduled with bounded memory usage (see imap_bounded):
+        - max_in_flight: the number of articles submitted but not yet consumed
+         (default: MAX_IN_FLIGHT_ARTICLES_PER_WORKER for each worker process)
+        - max_pending_mb: the size of the results of the processed articles waiting to be consumed in order
+         (default: MAX_PENDING_RESULTS_MB)
+    """
+    def __init__(self, processes=None, max_portals=1, max_in_flight=None, max_pending_mb=None):
+        if processes is None:
+            processes = cpu_count()
+        if max_in_flight is None:
+            max_in_flight = MAX_IN_FLIGHT_ARTICLES_PER_WORKER * processes
+        if max_pending_mb is None:
+            max_pending_mb = MAX_PENDING_RESULTS_MB
+        self._processes = processes
+        self._max_portals = max_portals
+        self._max_in_flight = max_in_flight
+        self._max_pending_bytes = max_pending_mb * 1024 * 1024
+        # At least two chunks for each worker fit into the limit to keep the workers busy
+        self._max_chunk_size = max(1, max_in_flight // (2 * processes))
+        self._exit_stack = None
+        self._context_dir = None
+        self._log_queue = None
+        self._log_channels = {}  # Channel ID -> (logger of the portal, Event set when its last record is logged)
+        self._log_channel_ids = count()
+        self.pool = None
+
+    def __enter__(self):
+        with ExitStack() as stack:
+            self._context_dir = stack.enter_context(TemporaryDirectory(prefix='html2tei_'))
+            self._log_queue = SimpleQueue()
+            # The workers are forked before the listener thread is started to avoid forking a multithreaded process
+            self.pool = stack.enter_context(Pool(self._processes, initializer=_init_worker,
+                                                 initargs=(self._max_portals, self._log_queue)))
+            log_listener = Thread(target=self._log_listener)
+            log_listener.start()
+            stack.callback(log_listener.join)
+            stack.callback(self._log_queue.put, None)
+            stack.callback(self.pool.terminate)  # The workers are stopped before the listener
+            self._exit_stack = stack.pop_all()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return self._exit_stack.__exit__(exc_type, exc_value, exc_traceback)
+
+    def _log_listener(self):
+        """Log the batches of records sent by the workers (see WorkerLogger) with the loggers of their portals"""
+        while True:
+            records = self._log_queue.get()
+            if records is None:
+                break
+            for channel, level, message, end in records:
+                logger_and_closed = self._log_channels.get(channel)
+                if logger_and_closed is None:  # Sent by an abandoned task after its portal was finished
+                    continue
+                logger, closed = logger_and_closed
+                if level is None:  # The marker of the end of the channel (see log_channel)
+                    del self._log_channels[channel]
+                    closed.set()
+                else:
+                    logger.log(level, message, end=end)
+
+    @contextmanager
+    def log_channel(self, logger):
+        """Create a WorkerLogger for the workers which logs with logger while the portal is processed
+            On exit it waits until all records sent by the finished tasks of the portal are logged
+        """
+        channel = next(self._log_channel_ids)
+        closed = Event()
+        self._log_channels[channel] = (logger, closed)
+        try:
+            yield WorkerLogger(channel, min_log_level(logger))
+        finally:
+            self._log_queue.put([(channel, None, None, None)])
+            closed.wait()
+
+    def imap_bounded(self, fun, iterable, ordered=True):
+        """Like Pool.imap(fun, iterable) with adaptive chunk size, but the items of iterable are read lazily:
+            new chunks are submitted only while the number of the items in flight (submitted but not yet yielded)
+             and the size of the results waiting for their predecessors are under the limits of the pool
+             (at least one chunk is always in flight), therefore the memory usage does not grow with the input
+           If ordered is False the results are yielded as their chunks are finished (like Pool.imap_unordered),
+            therefore a slow item does not hold back the items after it and the workers are kept busy meanwhile
+           fun must return the time it took and the pickled list of the results for a list of items
+            (see _assemble_and_process_articles_in_worker)
+           The chunk size is adapted to the measured processing time of the items (see TARGET_CHUNK_SECONDS)
+        """
+        items = iter(iterable)
+        in_flight = OrderedDict()  # Chunk ID -> (AsyncResult, chunk size) in the order of submission
+        in_flight_items = 0
+        finished_chunk_ids = queue_SimpleQueue()  # In the order of finishing (only if not ordered)
+        pending_bytes = [0]  # The size of the finished results (updated by the result handler thread of the pool)
+        pending_bytes_lock = threading_Lock()
+        chunk_size = min(INITIAL_CHUNK_SIZE, self._max_chunk_size)
+        seconds_per_item = None
+
+        def chunk_finished(chunk_id, result):
+            if not isinstance(result, BaseException):
+                with pending_bytes_lock:
+                    pending_bytes[0] += len(result[1])
+            if not ordered:
+                finished_chunk_ids.put(chunk_id)
+
+        chunk_ids = count()
+        exhausted = False
+        while True:
+            while not exhausted and (len(in_flight) == 0 or
+                                     (in_flight_items + chunk_size <= self._max_in_flight and
+                                      pending_bytes[0] <= self._max_pending_bytes)):
+                chunk = list(islice(items, chunk_size))
+                if len(chunk) == 0:
+                    exhausted = True
+                    break
+                chunk_id = next(chunk_ids)
+                callback = partial(chunk_finished, chunk_id)
+                in_flight[chunk_id] = (self.pool.apply_async(fun, (chunk,), callback=callback,
+                                                             error_callback=callback), len(chunk))
+                in_flight_items += len(chunk)
+
+            if len(in_flight) == 0:
+                break
+
+            if ordered:
+                _, (async_result, curr_chunk_size) = in_flight.popitem(last=False)
+            else:
+                async_result, curr_chunk_size = in_flight.pop(finished_chunk_ids.get())
+            elapsed_time, pickled_results = async_result.get()  # Errors of the worker are raised here
+            in_flight_items -= curr_chunk_size
+            with pending_bytes_lock:
+                pending_bytes[0] -= len(pickled_results)
+
+            # Moving average of the processing time of the items
+            if seconds_per_item is None:
+                seconds_per_item = elapsed_time / curr_chunk_size
+            else:
+                seconds_per_item = 0.8 * seconds_per_item + 0.2 * elapsed_time / curr_chunk_size
+            chunk_size = max(1, min(self._max_chunk_size, int(TARGET_CHUNK_SECONDS / max(seconds_per_item, 1e-6))))
+
+            yield from pickle_loads(pickled_results)
+
+    @contextmanager
+    def portal_context(self, *context):
+        """Publish the context of a portal to the workers while it is processed"""
+        with NamedTemporaryFile(dir=self._context_dir, suffix='.pickle', delete=False) as fh:
+            pickle_dump((list(sys.path), pickle_dumps(context)), fh)
+        try:
+            yield fh.name
+        finally:
+            remove(fh.name)
+
+
 @contextmanager
 def open_multiple_files(args):
     """A helper function to open multiple files at once in a contextmanager"""
@@ -98,32 +471,56 @@ def open_multiple_files(args):
 
 # This function is used outside of this file
 def run_single_process(warc_level_params, file_names_and_modes, main_function, sub_functions, after_function,
-                       after_params):
+                       after_params, worker_pool=None, result_cache=None, skip_urls=frozenset(), ordered=True):
     """Read a WARC file and sequentially process all articles in it with main_function
         (multi-page articles are handled as one entry) and yield the result after filtered through after_function
+       The already processed articles are read from result_cache (if it is not None)
+        and the articles in skip_urls are skipped (e.g. written by the resumed run)
     """
+    _ = worker_pool, ordered  # To be a drop-in replacement
     with open_multiple_files(file_names_and_modes) as fhandles:
-        for params in aggregated_multipage_articles_gen(warc_level_params, sub_functions):
-            ret = main_function(params)
+        first_pages, article_assembler = init_article_assembler(warc_level_params, warc_level_params[3],
+                                                                skip_urls)
+        results = (assemble_and_process_article(article_assembler, main_function, article_url, sub_functions,
+                                                result_cache) for article_url in first_pages)
+        for ret in track_warc_date_interval(store_new_results(results, result_cache), warc_level_params[4]):
             yield after_function(ret, after_params, fhandles)
+    friendly_tag_cache.log_stats(warc_level_params[3])
 
 
 # This function is used outside of this file
 def run_multiple_process(warc_level_params, file_names_and_modes, main_function, sub_functions, after_function,
-                         after_params):
+                         after_params, worker_pool=None, result_cache=None, skip_urls=frozenset(), ordered=True):
     """Read a WARC file and sequentially process all articles in it with main_function in parallel preserving ordering
         (multi-page articles are handled as one entry) and yield the result after filtered through after_function
+       If ordered is False the results are yielded in the order of their completion
+        (for the tasks which do not depend on the order of the articles, see WorkerPool.imap_bounded)
+       The parent process only indexes the WARC file, the pages of the articles are read by the workers
+        of worker_pool (WorkerPool) which may be shared with other portals processed concurrently
+       The context of the portal (main_function, sub_functions with the configuration, etc.) is published once and
+        loaded by each worker once (see WorkerPool.portal_context), the tasks contain only the URLs of the articles
+       The already processed articles are read from result_cache (if it is not None) by the workers
+        and the articles in skip_urls are skipped (e.g. written by the resumed run)
     """
+    if worker_pool is None:
+        with WorkerPool() as worker_pool:
+            yield from run_multiple_process(warc_level_params, file_names_and_modes, main_function, sub_functions,
+                                            after_function, after_params, worker_pool, result_cache, skip_urls,
+                                            ordered)
+        return
+
     # This is parallel as it computes each page separately. Order preserved!
-    with Manager() as man:
-        log_queue = man.Queue()
-        logger_obj = sub_functions[0][0]
-        with logger_obj.init_mp_logging_context(log_queue) as mp_logger, \
-                open_multiple_files(file_names_and_modes) as fhandles, Pool() as p:
-            sub_functions[0][0] = mp_logger
-            queue = p.imap(main_function, aggregated_multipage_articles_gen(warc_level_params, sub_functions),
-                           chunksize=1000)
-            for ret in queue:  # This is single process because it writes to files
+    logger_obj = sub_functions[0][0]
+    with worker_pool.log_channel(logger_obj) as worker_logger, open_multiple_files(file_names_and_modes) as fhandles:
+        first_pages, article_assembler = init_article_assembler(warc_level_params, worker_logger, skip_urls)
+        sub_functions[0][0] = worker_logger
+        with worker_pool.portal_context(article_assembler, main_function, sub_functions, result_cache) as \
+                context_filename:
+            sub_functions[0][0] = logger_obj  # The WorkerLogger is used only by the workers
+            queue = worker_pool.imap_bounded(partial(_assemble_and_process_articles_in_worker, context_filename),
+                                             first_pages, ordered)
+            for ret in track_warc_date_interval(store_new_results(queue, result_cache), warc_level_params[4]):
+                # This is single process because it writes to files
                 yield after_function(ret, after_params, fhandles)
 
 
@@ -153,9 +550,135 @@ def safe_setlocale(name):
             setlocale(LC_ALL, saved)
 
 
-# This function is used outside of this file
-def parse_date(date_raw, date_format, locale='hu_HU.UTF-8'):
-    """Parse date according to the parameters (locale and date format)"""
+# The names of the months and the days of the week (from Monday) in full and abbreviated form as in the locales
+#  (the language part of the locale name is the key) to parse dates without setting the locale (see parse_date)
+LOCALE_DATE_NAMES = {'hu': {'B': ('január', 'február', 'március', 'április', 'május', 'június', 'július', 'augusztus',
+                                  'szeptember', 'október', 'november', 'december'),
+                            'b': ('jan', 'febr', 'márc', 'ápr', 'máj', 'jún', 'júl', 'aug', 'szept', 'okt', 'nov',
+                                  'dec'),
+                            'A': ('hétfő', 'kedd', 'szerda', 'csütörtök', 'péntek', 'szombat', 'vasárnap'),
+                            'a': ('H', 'K', 'Sze', 'Cs', 'P', 'Szo', 'V')},
+                     }
+
+# The patterns of the supported directives as in the standard library (_strptime.TimeRE)
+DATE_DIRECTIVE_PATTERNS = {'d': r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])',
+                           'f': r'(?P<f>[0-9]{1,6})',
+                           'H': r'(?P<H>2[0-3]|[0-1]\d|\d)',
+                           'm': r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+                           'M': r'(?P<M>[0-5]\d|\d)',
+                           'S': r'(?P<S>6[0-1]|[0-5]\d|\d)',
+                           'y': r'(?P<y>\d\d)',
+                           'Y': r'(?P<Y>\d\d\d\d)',
+                           'z': r'(?P<z>[+-]\d\d:?[0-5]\d(:?[0-5]\d(\.\d{1,6})?)?|(?-i:Z))',
+                           '%': '%'}
+
+REGEX_CHARS = re_compile(r'([\\.^$*+?(){}\[\]|])')
+WHITESPACES = re_compile(r'\s+')
+# The separator of the seconds must be the same as of the minutes (e.g. +01:00:30 or +010030) as in the standard library
+UTC_OFFSET = re_compile(r'(?P<sign>[+-])(?P<h>\d\d)(?P<sep>:?)(?P<m>\d\d)((?P=sep)(?P<s>\d\d)(\.(?P<f>\d{1,6}))?)?')
+
+
+def _literal_to_pattern(literal):
+    """Escape the literal part of the date format and match any whitespace for whitespaces as the standard library"""
+    return WHITESPACES.sub(r'\\s+', REGEX_CHARS.sub(r'\\\1', literal))
+
+
+@lru_cache(maxsize=None)
+def compile_date_format(date_format, language):
+    """Compile the date format into a regular expression (with the month and weekday names of the language)
+        the same way as the standard library does or return None if the format is not supported
+    """
+    names = LOCALE_DATE_NAMES.get(language)
+    if names is None:
+        return None
+    format_pattern = []
+    seen_directives = set()
+    literal_start = 0
+    directive_start = date_format.find('%')
+    while directive_start > -1:
+        format_pattern.append(_literal_to_pattern(date_format[literal_start:directive_start]))
+        directive = date_format[directive_start + 1:directive_start + 2]
+        if directive in seen_directives:
+            return None  # Redefinition of a group is not supported
+        if directive in DATE_DIRECTIVE_PATTERNS:
+            format_pattern.append(DATE_DIRECTIVE_PATTERNS[directive])
+        elif directive in names:
+            # The longest names first as in the standard library
+            alternatives = '|'.join(re_escape(name) for name in sorted(names[directive], key=len, reverse=True))
+            format_pattern.append(f'(?P<{directive}>{alternatives})')
+        else:
+            return None  # Other directives (e.g. %I, %p, %j) are left to the standard library
+        if directive != '%':
+            seen_directives.add(directive)
+        literal_start = directive_start + 2
+        directive_start = date_format.find('%', literal_start)
+    format_pattern.append(_literal_to_pattern(date_format[literal_start:]))
+    return re_compile(''.join(format_pattern), IGNORECASE)
+
+
+def _index_of_name(names, name):
+    name = name.lower()
+    return next(i for i, curr_name in enumerate(names) if curr_name.lower() == name)
+
+
+def _datetime_from_match(found, names):
+    """Create datetime from the named groups of the match with the defaults of datetime.strptime()"""
+    groups = found.groupdict()
+    year, month, day, hour, minute, second, microsecond, tzinfo = 1900, 1, 1, 0, 0, 0, 0, None
+    if 'Y' in groups:
+        year = int(groups['Y'])
+    elif 'y' in groups:
+        year = int(groups['y'])
+        year += 2000 if year <= 68 else 1900  # As in the standard library
+    if 'm' in groups:
+        month = int(groups['m'])
+    elif 'B' in groups:
+        month = _index_of_name(names['B'], groups['B']) + 1
+    elif 'b' in groups:
+        month = _index_of_name(names['b'], groups['b']) + 1
+    if 'd' in groups:
+        day = int(groups['d'])
+    if 'H' in groups:
+        hour = int(groups['H'])
+    if 'M' in groups:
+        minute = int(groups['M'])
+    if 'S' in groups:
+        second = int(groups['S'])
+    if 'f' in groups:
+        microsecond = int(groups['f'].ljust(6, '0'))
+    if 'z' in groups:
+        if groups['z'] == 'Z':
+            tzinfo = timezone.utc
+        else:
+            offset = UTC_OFFSET.fullmatch(groups['z'])
+            if offset is None:
+                raise ValueError(f'Inconsistent use of : in {groups["z"]}')
+            delta = timedelta(hours=int(offset['h']), minutes=int(offset['m']), seconds=int(offset['s'] or 0),
+                              microseconds=int((offset['f'] or '0').ljust(6, '0')))
+            if offset['sign'] == '-':
+                delta = -delta
+            tzinfo = timezone(delta)
+    return datetime(year, month, day, hour, minute, second, microsecond, tzinfo)
+
+
+@lru_cache(maxsize=65536)
+def _parse_date_cached(date_raw, date_format, locale):
+    """Parse date without setting the locale if it is supported (see parse_date)"""
+    language = locale.split('_', maxsplit=1)[0].split('.', maxsplit=1)[0].lower()
+    format_pattern = compile_date_format(date_format, language)
+    if format_pattern is None:
+        return _parse_date_in_locale(date_raw, date_format, locale)
+
+    found = format_pattern.match(date_raw)
+    if found is None or found.end() != len(date_raw):
+        return None
+    try:
+        return _datetime_from_match(found, LOCALE_DATE_NAMES[language])
+    except ValueError:
+        return None
+
+
+def _parse_date_in_locale(date_raw, date_format, locale):
     with safe_setlocale(locale):
         try:
             return datetime.strptime(date_raw, date_format)
@@ -163,17 +686,28 @@ def parse_date(date_raw, date_format, locale='hu_HU.UTF-8'):
             return None
 
 
+# This function is used outside of this file
+def parse_date(date_raw, date_format, locale='hu_HU.UTF-8'):
+    """Parse date according to the parameters (locale and date format)
+        For the languages in LOCALE_DATE_NAMES the date is parsed with precompiled patterns without setting the locale,
+         otherwise with datetime.strptime() in the locale. The results are cached for the repeated inputs
+    """
+    if isinstance(date_raw, str):
+        # Plain str to not keep alive the parsed HTML of NavigableStrings in the cache
+        return _parse_date_cached(str(date_raw), date_format, locale)
+    return _parse_date_in_locale(date_raw, date_format, locale)
+
+
 def process_article(params):
     """A generic article processing skeleton used by multiple targets.
        It extracts the useful part from the html (=the body of the article), deletes the listed, irrelevant parts,
         and indicates the characteristic errors related to the body of the article (which can be detected at this level)
     """
     article_list, (tei_logger, article_roots, decomp_fun, excluded_tags_fun, sub_fun, sub_fun_params) = params
-    for article_url, warc_date, warc_id, raw_html in article_list:
+    for article_url, warc_date, warc_id, raw_html, bs in article_list:
         if raw_html is None:
             tei_logger.log('CRITICAL', f'UnicodeDecodeError {article_url}!')
             return
-        bs = BeautifulSoup(raw_html, 'lxml')
         for args, kwargs in article_roots:
             article_body_root = bs.find(*args, **kwargs)
             if article_body_root is not None:
@@ -193,37 +727,172 @@ def process_article(params):
             tei_logger.log('ERROR', 'UNICODE error', article_url)
 
 
+# This function is used outside of this file
+def process_article_partial(params):
+    """The map step of the modes summarizing the articles in parallel: process_article into a new (partial) accumulator
+        created by new_accumulator_fun and return it to be merged into the accumulator of the portal
+        (see merge_partial_accumulator). The sub_fun_params of process_article are given without the accumulator
+       The partial accumulators must be picklable as they are sent back by the workers (e.g. no lambda factories)
+    """
+    article_list, (process_article_params, new_accumulator_fun) = params
+    tei_logger, article_roots, decomp_fun, excluded_tags_fun, sub_fun, sub_fun_params = process_article_params
+    partial_accumulator = new_accumulator_fun()
+    process_article((article_list, (tei_logger, article_roots, decomp_fun, excluded_tags_fun, sub_fun,
+                                    (partial_accumulator, *sub_fun_params))))
+    return partial_accumulator
+
+
+# This function is used outside of this file
+def merge_partial_accumulator(partial_accumulator, after_params, fhandles):
+    """The reduce step of the modes summarizing the articles in parallel (see process_article_partial):
+        merge the partial accumulator of the article into the accumulator of the portal with merge_fun
+        in the parent process (in the order of the articles). The merge must be associative
+        (merging the partial accumulators one by one gives the same as merging them with each other first)
+    """
+    _ = fhandles  # Silence IDE
+    accumulator, merge_fun = after_params
+    merge_fun(accumulator, partial_accumulator)
+    return None  # No publish date
+
+
+# This class is used outside of this file
+class ReservoirSample:
+    """A uniform random sample of at most size items (e.g. the URLs of the articles containing a tag)
+        in constant memory regardless of the number of items seen (reservoir sampling)
+       The items are added article by article: the repeated addition of the last item is ignored
+       The samples of disjoint sets of items can be merged (see merge_partial_accumulator)
+    """
+    __slots__ = ('size', 'seen', 'items', '_last_item')
+
+    def __init__(self, size):
+        self.size = size
+        self.seen = 0  # The number of items sampled from
+        self.items = []
+        self._last_item = None
+
+    def add(self, item):
+        if item == self._last_item:
+            return
+        self._last_item = item
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            index = random_randrange(self.seen)
+            if index < self.size:
+                self.items[index] = item
+
+    def merge(self, other):
+        """Merge the sample of an other (disjoint) set of items into this one
+            The sampled items are drawn one by one from the two samples with the probability of the number of
+             the remaining (not drawn) items of their sets, which gives a uniform sample of the union
+        """
+        if self.seen + other.seen <= self.size:
+            self.items.extend(other.items)
+        else:
+            own_remaining, other_remaining = self.seen, other.seen
+            own_drawn = 0
+            for _ in range(self.size):
+                if random_randrange(own_remaining + other_remaining) < own_remaining:
+                    own_remaining -= 1
+                    own_drawn += 1
+                else:
+                    other_remaining -= 1
+            self.items = random_sample(self.items, own_drawn) + random_sample(other.items, self.size - own_drawn)
+        self.seen += other.seen
+        self._last_item = other._last_item
+
+
+def warc_size(warc_dir, warc_name):
+    """The size of the WARC file for scheduling the largest ones first (missing files are reported later)"""
+    warc_filename = os_path_join(warc_dir, warc_name)
+    if os_path_isfile(warc_filename):
+        return os_path_getsize(warc_filename)
+    return 0
+
+
+def run_portal(warc_name, portal_name, configs_dir, log_dir, warc_dir, output_dir, init_portal_fun, run_params,
+               logfile_level, console_level, worker_pool):
+    """Process one WARC file of a portal from reading the configuration to summarizing the accumulated information"""
+    # 1. Read portal-specific configuration (initializing the dictionaries based on the received parameters)
+    tei_logger, warc_level_params, *rest_config_params = \
+        read_portalspec_config(configs_dir, portal_name, warc_dir, warc_name, log_dir, run_params,
+                               logfile_level=logfile_level, console_level=console_level)
+
+    # 2. Initialize variables according to the given task
+    accumulator, after_article_fun, after_article_params, log_file_names_and_modes, out_filenames_and_modes,\
+        final_fun, process_article_fun, process_article_params, run_fun = \
+        init_portal_fun(log_dir, output_dir, run_params, portal_name, tei_logger,
+                        warc_level_params, rest_config_params)
+
+    # 3. Process all articles in the WARC file sequentially or parallel (according to run_fun)
+    #  (skipping the articles already processed with the same configuration if the result cache is used)
+    result_cache = init_result_cache(run_params, configs_dir, portal_name, tei_logger)
+    date_max = datetime(MINYEAR, 1, 1)
+    date_min = datetime(MAXYEAR, 1, 1)
+    for publish_date in run_fun(warc_level_params, log_file_names_and_modes, process_article_fun,
+                                process_article_params, after_article_fun, after_article_params,
+                                worker_pool=worker_pool, result_cache=result_cache):
+        if publish_date is not None:
+            date_min = min(date_min, publish_date)
+            date_max = max(date_max, publish_date)
+
+    # 4. After all articles are processed summarize the accumulated information (dates, etc.)
+    with open_multiple_files(out_filenames_and_modes) as out_files:
+        final_fun((date_min, date_max), out_files, accumulator, tei_logger)
+
+    tei_logger.log('INFO', f'{portal_name} PORTAL FINISHED')
+
+
 # This function is used outside of this file
 def run_main(warc_filename, configs_dir, log_dir, warc_dir, output_dir, init_portal_fun, run_params=None,
              logfile_level='INFO', console_level='INFO'):
-    """This is the main function. It reads the input warc-portalname pairs and process them one by one"""
+    """This is the main function. It reads the input warc-portalname pairs and process them:
+        In parallel mode (run_parallel in run_params) the portals (parallel_portals at once, the largest WARC first)
+         share one pool of worker processes (workers, default: the number of CPUs), otherwise they are processed
+         one by one
+    """
+
+    if run_params is None:
+        run_params = {}
+
+    # The fixed processing time "run" (the start of the run) is resolved here, as it is written into the output,
+    #  the result cache must get the actual time for its fingerprint (see config_fingerprint)
+    if run_params.get('processing_time') == 'run':
+        run_params = {**run_params, 'processing_time': datetime.today().isoformat()}
 
     check_exists(output_dir, check_fun=os_path_isdir, message='Directory not found')
 
-    for warc_name, portal_name in read_input_config(warc_filename):
-
-        # 1. Read portal-specific configuration (initializing the dictionaries based on the received parameters)
-        tei_logger, warc_level_params, *rest_config_params = \
-            read_portalspec_config(configs_dir, portal_name, warc_dir, warc_name, log_dir, run_params,
-                                   logfile_level=logfile_level, console_level=console_level)
-
-        # 2. Initialize variables according to the given task
-        accumulator, after_article_fun, after_article_params, log_file_names_and_modes, out_filenames_and_modes,\
-            final_fun, process_article_fun, process_article_params, run_fun = \
-            init_portal_fun(log_dir, output_dir, run_params, portal_name, tei_logger,
-                            warc_level_params, rest_config_params)
-
-        # 3. Process all articles in the WARC file sequentially or parallel (according to run_fun)
-        date_max = datetime(MINYEAR, 1, 1)
-        date_min = datetime(MAXYEAR, 1, 1)
-        for publish_date in run_fun(warc_level_params, log_file_names_and_modes, process_article_fun,
-                                    process_article_params, after_article_fun, after_article_params):
-            if publish_date is not None:
-                date_min = min(date_min, publish_date)
-                date_max = max(date_max, publish_date)
-
-        # 4. After all articles are processed summarize the accumulated information (dates, etc.)
-        with open_multiple_files(out_filenames_and_modes) as out_files:
-            final_fun((date_min, date_max), out_files, accumulator, tei_logger)
-
-        tei_logger.log('INFO', f'{portal_name} PORTAL FINISHED')
+    # Largest first: the small ones fill the gaps at the end of the run
+    warc_names_and_portal_names = sorted(read_input_config(warc_filename),
+                                         key=lambda warc_and_portal: warc_size(warc_dir, warc_and_portal[0]),
+                                         reverse=True)
+    run_params_for_portal = (configs_dir, log_dir, warc_dir, output_dir, init_portal_fun, run_params, logfile_level,
+                             console_level)
+
+    with ExitStack() as stack:
+        if run_params.get('run_parallel', False):
+            parallel_portals = run_params.get('parallel_portals', 1)
+            # The pool is started before the threads of the portals to avoid forking a multithreaded process
+            worker_pool = stack.enter_context(WorkerPool(run_params.get('workers'), parallel_portals,
+                                                         run_params.get('max_in_flight'),
+                                                         run_params.get('max_pending_mb')))
+        else:
+            parallel_portals = 1
+            worker_pool = None
+
+        if parallel_portals == 1:
+            for warc_name, portal_name in warc_names_and_portal_names:
+                run_portal(warc_name, portal_name, *run_params_for_portal, worker_pool)
+            return
+
+        # The parent process handles the portals in threads (reading WARC files and writing the output)
+        with ThreadPoolExecutor(parallel_portals) as executor:
+            futures = [executor.submit(run_portal, warc_name, portal_name, *run_params_for_portal, worker_pool)
+                       for warc_name, portal_name in warc_names_and_portal_names]
+            try:
+                for future in futures:
+                    future.result()  # Errors (e.g. exit() on CRITICAL errors) are raised here
+            finally:
+                for future in futures:
+                    future.cancel()  # Do not start the remaining portals after an error
@@ -3,6 +3,7 @@
 
 import sys
 import importlib.util
+from re import Pattern
 from copy import deepcopy
 from argparse import Namespace
 from collections import Counter
@@ -48,14 +49,83 @@ def load_portal_specific_dicts(text_tags_normal_fn, notext_tags_normal_fn, porta
                 except ValueError:
                     tei_logger.log('CRITICAL', f'{fn} at line {line_no}: the number of fields does not match!')
                     exit(1)
-                portal_tags_to_normal[freezed_tag] = '\t'.join([normal_name, preserved_attribute])
+                # Stored split to avoid splitting the value at every lookup
+                portal_tags_to_normal[freezed_tag] = (normal_name, preserved_attribute)
     merged_portal_specific_block_rules = deepcopy(BLOCK_RULES)
     for block_key, block_value in portal_specific_block_rules.items():
         for three_key, t_value in block_value.items():
             merged_portal_specific_block_rules[block_key][three_key] = t_value
+    # The lists of the block names are only used for membership tests
+    for block_value in merged_portal_specific_block_rules.values():
+        for three_key in ('not_valid_inner_blocks', 'not_valid_as_outer_for'):
+            block_value[three_key] = frozenset(block_value[three_key])
     return portal_tags_to_normal, merged_portal_specific_block_rules
 
 
+BIGRAM_RULE_CASES = {'to_merge', 'det_by_child', 'det_by_any_child', 'det_by_any_desc', 'det_by_string'}
+
+
+def compile_bigram_rules(bigram_rules_spec, tei_logger):
+    """Compile BIGRAM_RULES_SPEC ({first tag: {(second tag, case): (parent level name, child level name)}})
+        into {first tag: (the set of the second tags, ((second tag, case, parent level name, child level name), ...))}
+        checking the cases (see eltedh_abc.rename_by_bigram_rules), as it is looked up for every matching tag
+       The rules with unknown cases never match, so they are dropped with a warning,
+        but their second tags are kept in the set as it selects the checked cases
+    """
+    compiled_bigram_rules = {}
+    for first_tag, rules in bigram_rules_spec.items():
+        compiled_rules = []
+        for (second_tag, case), (parent_level_name, child_level_name) in rules.items():
+            if case not in BIGRAM_RULE_CASES:
+                tei_logger.log('WARNING', f'Unknown case in the bigram rules of {first_tag}: {case}'
+                                          f' (allowed cases: {sorted(BIGRAM_RULE_CASES)}), the rule is ignored!')
+                continue
+            compiled_rules.append((second_tag, case, parent_level_name, child_level_name))
+        compiled_bigram_rules[first_tag] = (frozenset(second_tag for second_tag, _ in rules.keys()),
+                                            tuple(compiled_rules))
+    return compiled_bigram_rules
+
+
+class UrlBlacklist:
+    """Match URLs against the BLACKLIST_SPEC of a portal in (nearly) constant time
+        Plain URLs are stored in a frozenset, entries ending with * are prefixes stored in a character trie
+         and compiled regular expressions are matched (from the beginning of the URL) one by one
+       The object is built once from the config and shared with the worker processes
+    """
+    _END = ''  # The key marking the end of a prefix in the trie (characters are never empty strings)
+
+    def __init__(self, blacklist_spec):
+        urls = set()
+        self._prefix_trie = {}
+        patterns = []
+        for entry in blacklist_spec:
+            if isinstance(entry, Pattern):
+                patterns.append(entry)
+            elif entry.endswith('*'):
+                node = self._prefix_trie
+                for char in entry[:-1]:
+                    node = node.setdefault(char, {})
+                node[self._END] = True
+            else:
+                urls.add(entry)
+        self._urls = frozenset(urls)
+        self._patterns = tuple(patterns)
+
+    def _match_prefix(self, url):
+        node = self._prefix_trie
+        for char in url:
+            if self._END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self._END in node
+
+    def __contains__(self, url):
+        return url in self._urls or (len(self._prefix_trie) > 0 and self._match_prefix(url)) or \
+            any(pattern.match(url) for pattern in self._patterns)
+
+
 def get_portal_spec_fun_and_dict_names(module_fn, tei_logger):
     """Load portal the specific configuration (python) file and check for the required arguments"""
     try:
@@ -109,6 +179,7 @@ def import_python_file(file_path, package=None):
 
 
 WRITE_OUT_MODES = {'eltedh': ('.article_body_converters.eltedh_abc.py', 'html2tei'),
+                   'eltedh-lxml': ('.article_body_converters.eltedh_lxml_abc.py', 'html2tei'),
                    'justext': ('.article_body_converters.justext_abc.py', 'html2tei'),
                    'newspaper3k': ('.article_body_converters.newspaper_abc.py', 'html2tei'),
                    'trafilatura': ('.article_body_converters.trafilatura_abc.py', 'html2tei'),
@@ -147,8 +218,10 @@ def read_portalspec_config(configs_dir, portal_name, warc_dir, warc_name, log_di
     warc_name = os_path_join(warc_dir, warc_name)
     check_exists(warc_name, tei_logger)
 
+    blacklist = UrlBlacklist(blacklist_spec)  # Built once and shared with the workers
+
     warc_date_interval = {}  # Actually the maximal date interval for HTTP responses in the WARC file
-    warc_level_params = (warc_name, blacklist_spec, multipage_compile, tei_logger, warc_date_interval,
+    warc_level_params = (warc_name, blacklist, multipage_compile, tei_logger, warc_date_interval,
                          next_page_of_article_fun, transform_to_html_fun)
 
     # Portal specific TSV dictionaries stuff
@@ -162,6 +235,7 @@ def read_portalspec_config(configs_dir, portal_name, warc_dir, warc_name, log_di
         tag_normal_dict, portal_specific_block_rules = \
             load_portal_specific_dicts(text_tags_normal_fn, notext_tags_normal_fn, block_rules_spec,
                                        tei_logger)
+        bigram_rules_spec = compile_bigram_rules(bigram_rules_spec, tei_logger)
     else:
         tei_logger.log('INFO', 'Not loading portal specific dicts')
         tag_normal_dict, portal_specific_block_rules = None, None
@@ -0,0 +1,120 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import sqlite3
+from os import getpid, listdir
+from hashlib import sha256
+from os.path import join as os_path_join, isfile, isdir, dirname, abspath
+from pickle import dumps as pickle_dumps, loads as pickle_loads, HIGHEST_PROTOCOL
+
+# Only init_result_cache is used outside of this file
+
+# The run parameters which do not affect the result of processing an article
+RUN_PARAMS_NOT_IN_FINGERPRINT = {'task_name', 'run_parallel', 'parallel_portals', 'workers', 'max_in_flight',
+                                 'max_pending_mb', 'unordered_output', 'result_cache_dir', 'schema_cache_dir',
+                                 'resume', 'container', 'shard_by', 'shard_size_mb'}
+
+
+def update_hash_with_dir(hasher, dir_name, suffixes=None):
+    """Add the names and the contents of the files in the directory (recursively, in fixed order) to the hash"""
+    for filename in sorted(listdir(dir_name)):
+        full_path = os_path_join(dir_name, filename)
+        if isdir(full_path) and filename != '__pycache__':
+            update_hash_with_dir(hasher, full_path, suffixes)
+        elif isfile(full_path) and (suffixes is None or filename.endswith(suffixes)):
+            hasher.update(filename.encode('UTF-8'))
+            with open(full_path, 'rb') as fh:
+                hasher.update(fh.read())
+
+
+def config_fingerprint(configs_dir, portal_name, run_params):
+    """Compute the hash of everything that affects the result of processing an article of the portal:
+        - the files of the portal-specific config directory (python module, tables, base TEI XML, blacklists, etc.)
+        - the source code of this package (e.g. the write-out modes)
+        - the run parameters except the ones which only affect the scheduling (RUN_PARAMS_NOT_IN_FINGERPRINT)
+       The processing time "run" must be resolved before (see run_main) as it is written into the cached output
+    """
+    hasher = sha256()
+    update_hash_with_dir(hasher, os_path_join(configs_dir, portal_name))
+    update_hash_with_dir(hasher, dirname(dirname(abspath(__file__))), suffixes=('.py',))
+    hasher.update(repr(sorted((key, repr(value)) for key, value in run_params.items()
+                              if key not in RUN_PARAMS_NOT_IN_FINGERPRINT)).encode('UTF-8'))
+    return hasher.hexdigest()
+
+
+def init_result_cache(run_params, configs_dir, portal_name, tei_logger):
+    """Create the ResultCache of the portal if result_cache_dir is set in run_params (else return None)"""
+    result_cache_dir = run_params.get('result_cache_dir')
+    if result_cache_dir is None:
+        return None
+    if not isdir(result_cache_dir):
+        tei_logger.log('CRITICAL', f'Directory not found: {result_cache_dir}')
+        exit(1)
+    fingerprint = config_fingerprint(configs_dir, portal_name, run_params)
+    result_cache = ResultCache(os_path_join(result_cache_dir, f'{portal_name}.sqlite'), fingerprint)
+    removed = result_cache.remove_stale_entries()
+    if removed > 0:
+        tei_logger.log('INFO', f'Removed {removed} outdated entries from the result cache of {portal_name}')
+    return result_cache
+
+
+class ResultCache:
+    """Persistent (SQLite) cache for the results of processing the articles keyed by the WARC-Record-ID
+        of their first page and the fingerprint of the configuration (see config_fingerprint)
+       The workers only read the cache (see assemble_and_process_article), the new results are stored by the parent
+        process. The database is opened lazily by each process, therefore the object can be shared with the workers
+    """
+    def __init__(self, db_filename, fingerprint, commit_every=1000):
+        self._db_filename = db_filename
+        self._fingerprint = fingerprint
+        self._commit_every = commit_every
+        self._uncommitted = 0
+        self._connection = None
+        self._connection_pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None  # Each process opens its own connection
+        state['_connection_pid'] = None
+        state['_uncommitted'] = 0
+        return state
+
+    def _get_connection(self):
+        if self._connection_pid != getpid():  # Connections must not be shared between processes
+            self._connection = sqlite3.connect(self._db_filename, timeout=60)
+            self._connection.execute('PRAGMA journal_mode=WAL')  # Readers do not block the writer and vice versa
+            self._connection.execute('CREATE TABLE IF NOT EXISTS results (record_id TEXT NOT NULL, '
+                                     'fingerprint TEXT NOT NULL, result BLOB NOT NULL, '
+                                     'PRIMARY KEY (record_id, fingerprint))')
+            self._connection.commit()
+            self._connection_pid = getpid()
+        return self._connection
+
+    def remove_stale_entries(self):
+        """Remove the entries of the other configurations and return their number"""
+        connection = self._get_connection()
+        removed = connection.execute('DELETE FROM results WHERE fingerprint != ?', (self._fingerprint,)).rowcount
+        connection.commit()
+        return removed
+
+    def get(self, record_id):
+        """Return the cached result for the record or None if it is not cached"""
+        row = self._get_connection().execute('SELECT result FROM results WHERE record_id = ? AND fingerprint = ?',
+                                             (record_id, self._fingerprint)).fetchone()
+        if row is None:
+            return None
+        return pickle_loads(row[0])
+
+    def put(self, record_id, result):
+        """Store the result for the record (the results are committed in batches)"""
+        connection = self._get_connection()
+        connection.execute('INSERT OR REPLACE INTO results (record_id, fingerprint, result) VALUES (?, ?, ?)',
+                           (record_id, self._fingerprint, pickle_dumps(result, protocol=HIGHEST_PROTOCOL)))
+        self._uncommitted += 1
+        if self._uncommitted >= self._commit_every:
+            self.commit()
+
+    def commit(self):
+        if self._connection is not None and self._connection_pid == getpid():
+            self._connection.commit()
+            self._uncommitted = 0
@@ -2,41 +2,143 @@
 # -*- coding: utf-8, vim: expandtab:ts=4 -*-
 
 from io import BytesIO
-from zipfile import ZipFile
+from argparse import Namespace
+from hashlib import sha256
 from unicodedata import normalize
 from urllib.parse import urlparse
+from urllib.error import URLError
 from urllib.request import urlopen
 from re import compile as re_compile
-from os import getcwd, makedirs, listdir
+from os import getcwd, makedirs, listdir, replace
 from os.path import basename as os_path_basename, isabs as os_path_isabs, isdir as os_path_isdir, \
-    exists as os_path_exists, abspath as os_path_abspath, join as os_path_join
+    exists as os_path_exists, abspath as os_path_abspath, join as os_path_join, dirname as os_path_dirname, \
+    expanduser, isfile, getsize
+from pickle import dump as pickle_dump, load as pickle_load, UnpicklingError, HIGHEST_PROTOCOL
 
 import certifi
 from lxml import etree
 from mthasher import MtHasher, ALGORITHMS_GUARANTEED
 
+from ..workflow_helpers.read_config import check_exists
+from ..workflow_helpers.output_containers import OUTPUT_CONTAINERS, SHARD_BY, DEFAULT_SHARD_SIZE_MB, \
+    OUTPUT_BUFFER_SIZE, OutputContainers
+
 NOT_ALNUM_WS_OR_DASH = re_compile(r'[^\w\s-]')
 MORE_DASH_OR_WS = re_compile(r'[-\s]+')
 
-# Only init_output_writer is used outside of this file
+TEI_ALL_SCHEMA_URL = 'https://tei-c.org/release/xml/tei/custom/schema/relaxng/tei_all.rng'
+DEFAULT_SCHEMA_CACHE_DIR = os_path_join(expanduser('~'), '.cache', 'html2tei')
+
+# Only init_output_writer, TEI_ALL_SCHEMA_URL and DEFAULT_SCHEMA_CACHE_DIR are used outside of this file
 
 
-def init_output_writer(output_dir, portal_name, output_debug, tei_logger):
+def init_output_writer(output_dir, portal_name, output_debug, tei_logger, tei_schema=TEI_ALL_SCHEMA_URL,
+                       schema_cache_dir=DEFAULT_SCHEMA_CACHE_DIR, resume=False, processing_time=None, container=None,
+                       shard_by=None, shard_size_mb=DEFAULT_SHARD_SIZE_MB, compress_level=None, log_filenames=()):
     """Initialises the class for writing output:
         1. Normal mode: valid XMLs go into a zip file, invalid ones go to output_dir directory
          while a separate file is created to store the hashsums of the zipped files (all filenames are UUIDs)
         2. Debug mode: all XMLs go into output_dir directory (all filenames are slugs from the URL)
+       The TEI schema (URL or local file) is used only in normal mode, downloaded schemas are cached in schema_cache_dir
+       The state of the output (including the files written by the caller, log_filenames) is checkpointed
+        (see OutputCheckpoints) and if resume is True, the output is continued from the last checkpoint
+        of the previous (interrupted) run
+       If processing_time (ISO format) is given, it is used as the modification time of the zipped files
+        instead of the current time (deterministic mode)
+       The XMLs can be written into other containers instead of the default (zip or directory in debug mode)
+        which may be sharded by size or date and zip files may be compressed (see OutputContainers)
     """
+    if container is None:
+        container = 'dir' if output_debug else 'zip'
+    if container not in OUTPUT_CONTAINERS:
+        tei_logger.log('CRITICAL', f'Unknown output container: {container} (choices: {", ".join(OUTPUT_CONTAINERS)})')
+        exit(1)
+    if shard_by is not None and (shard_by not in SHARD_BY or container == 'dir'):
+        tei_logger.log('CRITICAL', f'Can not shard the {container} output container by {shard_by}!')
+        exit(1)
+    if compress_level is not None and (container != 'zip' or not 0 <= compress_level <= 9):
+        tei_logger.log('CRITICAL', f'Compression level {compress_level} is not supported for the {container} output'
+                                   ' container (only for zip: 0-9)!')
+        exit(1)
+
     if output_debug:
         output_writer_class = StoreFilesWithReadableName
     else:
         output_writer_class = ValidatorHasherCompressor
     output_writer = output_writer_class(tei_logger, os_path_join(output_dir, f'{portal_name}_not_valid'),
-                                        os_path_join(output_dir, f'{portal_name}.zip'),
-                                        os_path_join(output_dir, f'{portal_name}.hashsums'))
+                                        os_path_join(output_dir, portal_name),
+                                        os_path_join(output_dir, f'{portal_name}.hashsums'), tei_schema=tei_schema,
+                                        schema_cache_dir=schema_cache_dir,
+                                        checkpoint_filename=os_path_join(output_dir, f'{portal_name}.checkpoint'),
+                                        resume=resume, processing_time=processing_time, container=container,
+                                        shard_by=shard_by, shard_size_mb=shard_size_mb, compress_level=compress_level,
+                                        log_filenames=log_filenames)
     return output_writer
 
 
+def read_tei_schema(tei_schema, schema_cache_dir, tei_logger):
+    """Read the TEI schema from a local file or from the URL through the cache (if schema_cache_dir is not None):
+        The cached copy is named after the hash of the URL and stored with the checksum of its content
+         which is checked on every load. The schema is downloaded only if there is no valid cached copy
+    """
+    if urlparse(tei_schema).scheme not in {'http', 'https', 'ftp', 'file'}:
+        check_exists(tei_schema, tei_logger, message='TEI schema file not found')
+        with open(tei_schema, 'rb') as fh:
+            return fh.read()
+
+    cached_schema_fn, cached_checksum_fn = None, None
+    if schema_cache_dir is not None:
+        url_hash = sha256(tei_schema.encode('UTF-8')).hexdigest()
+        cached_schema_fn = os_path_join(schema_cache_dir, f'{url_hash}.rng')
+        cached_checksum_fn = os_path_join(schema_cache_dir, f'{url_hash}.sha256')
+        if isfile(cached_schema_fn) and isfile(cached_checksum_fn):
+            with open(cached_schema_fn, 'rb') as schema_fh, open(cached_checksum_fn, encoding='UTF-8') as checksum_fh:
+                tei_schema_str = schema_fh.read()
+                checksum = checksum_fh.read().strip()
+            if sha256(tei_schema_str).hexdigest() == checksum:
+                tei_logger.log('DEBUG', f'Using the cached copy of {tei_schema} ({cached_schema_fn})')
+                return tei_schema_str
+            tei_logger.log('WARNING', f'The checksum of the cached copy of {tei_schema} does not match,'
+                                      f' downloading it again!')
+
+    tei_logger.log('INFO', f'Downloading {tei_schema}')
+    try:
+        with urlopen(tei_schema, cafile=certifi.where()) as response:
+            tei_schema_str = response.read()
+    except (URLError, OSError) as err:
+        tei_logger.log('CRITICAL', f'Could not download {tei_schema} ({err}),'
+                                   f' a local copy of the schema can be set with --tei-schema !')
+        exit(1)
+        tei_schema_str = None  # Silence dummy IDE
+
+    if schema_cache_dir is not None:
+        makedirs(schema_cache_dir, exist_ok=True)
+        # Write to temporary files and rename them to avoid leaving half-written files in the cache
+        for out_fn, content in ((cached_schema_fn, tei_schema_str),
+                                (cached_checksum_fn, sha256(tei_schema_str).hexdigest().encode('UTF-8'))):
+            with open(f'{out_fn}.tmp', 'wb') as fh:
+                fh.write(content)
+            replace(f'{out_fn}.tmp', out_fn)
+    return tei_schema_str
+
+
+# The compiled RelaxNG validators by schema and cache directory as compiling the TEI schema takes seconds
+#  and it is the same for all portals in a run
+_relaxng_validators = {}
+
+
+def get_relaxng_validator(tei_schema, schema_cache_dir, tei_logger):
+    """Read and compile the TEI schema once per run"""
+    key = (tei_schema, schema_cache_dir)
+    validator = _relaxng_validators.get(key)
+    if validator is None:
+        relaxng_doc = etree.fromstring(read_tei_schema(tei_schema, schema_cache_dir, tei_logger))
+        # LXML FAQ: You can share RelaxNG, XMLSchema and (with restrictions) XSLT objects between threads.
+        validator = etree.RelaxNG(relaxng_doc)
+        _relaxng_validators[key] = validator
+    return validator
+
+
 def slugify(value, allow_unicode=True):
     """
     Original source:
@@ -86,31 +188,170 @@ def check_for_filename_collision(url, desired_filename, filename_suff, assigned_
         if final_name not in assigned_filenames:  # If it is already assigned, modify the filename!
             break
         final_name = f'{desired_filename}_{i}{filename_suff}'
-        assigned_filenames.add(final_name)
     else:
         tei_logger.log('CRITICAL', f'Too much URL with same name {url} !')
         exit(1)
         final_name = None
+    assigned_filenames.add(final_name)
     return final_name
 
 
+class OutputCheckpoints:
+    """Journal of the state of the output of a portal to be able to resume an interrupted run
+       After every checkpoint_every articles a record is appended to the journal (checkpoint_filename) with
+        the URLs of the newly processed articles, the newly assigned filenames, the states of the output containers
+        (the end offset of their last member and the entries newly written into the zip files,
+        see OutputContainers.checkpoint) and the sizes of the other output files (e.g. URL lists, hashsums)
+       A new run starts with an initial record (see initial_checkpoint), therefore the output files are truncated
+        on resume even if the run was interrupted before its first checkpoint
+       On resume the output files are truncated to their state at the last complete checkpoint
+        (the containers are restored from container_states) and the articles written before it are skipped
+    """
+    def __init__(self, checkpoint_filename, tei_logger, resume=False, checkpoint_every=1000):
+        self._tei_logger = tei_logger
+        self._checkpoint_every = checkpoint_every
+        self.processed_urls = set()
+        self.assigned_filenames = set()
+        self.container_states = {}  # Shard name -> (end offset, all entries) at the last checkpoint
+        self.resumed = False
+
+        journal_size = 0
+        if resume:
+            if isfile(checkpoint_filename):
+                journal_size = self._load(checkpoint_filename)
+            self.resumed = journal_size > 0
+            if self.resumed:
+                tei_logger.log('INFO', f'Resuming after {len(self.processed_urls)} articles ({checkpoint_filename})')
+            else:
+                tei_logger.log('WARNING', f'No checkpoint found in {checkpoint_filename}, starting from the beginning!')
+
+        self._new_urls = []
+        self._new_filenames = []
+        self._file_handles = ()
+        self._journal_fh = open(checkpoint_filename, 'r+b' if self.resumed else 'wb')
+        self._journal_fh.truncate(journal_size)  # Drop the incomplete record if there is any
+        self._journal_fh.seek(journal_size)
+
+    def _load(self, checkpoint_filename):
+        """Read the complete records of the journal, truncate the output files to the last checkpoint
+            and return the size of the complete records
+        """
+        journal_size = 0
+        file_sizes = {}
+        with open(checkpoint_filename, 'rb') as fh:
+            while True:
+                try:
+                    new_urls, new_filenames, container_states, file_sizes_at_checkpoint = pickle_load(fh)
+                except (EOFError, UnpicklingError):  # The last record is incomplete if the run was killed writing it
+                    break
+                self.processed_urls.update(new_urls)
+                self.assigned_filenames.update(new_filenames)
+                for shard_name, (end_offset, new_entries) in container_states.items():
+                    _, entries = self.container_states.get(shard_name, (None, []))
+                    entries.extend(new_entries)
+                    self.container_states[shard_name] = (end_offset, entries)
+                file_sizes = file_sizes_at_checkpoint
+                journal_size = fh.tell()
+
+        for filename, size in file_sizes.items():
+            if size == 0 and not isfile(filename):
+                continue  # Not created before the interruption (see initial_checkpoint)
+            check_exists(filename, self._tei_logger, message='Can not resume, output file not found')
+            with open(filename, 'r+b') as fh:
+                fh.truncate(size)
+        return journal_size
+
+    def add_filename(self, filename):
+        self.assigned_filenames.add(filename)
+        self._new_filenames.append(filename)
+
+    def end_of_article(self, url, file_handles, containers):
+        """Register the article written into the file handles and containers and checkpoint if it is due"""
+        self._file_handles = file_handles
+        self._new_urls.append(url)
+        if len(self._new_urls) >= self._checkpoint_every:
+            self.checkpoint(containers)
+
+    def initial_checkpoint(self, filenames, containers):
+        """Append the initial state of the output (the files to be written and the containers) to the journal
+            at the start of a new run (not resumed), the files do not have to exist yet
+        """
+        if not self.resumed:
+            file_sizes = {os_path_abspath(filename): getsize(filename) if isfile(filename) else 0
+                          for filename in filenames}
+            self._write_record(containers.checkpoint(), file_sizes)
+
+    def checkpoint(self, containers):
+        """Flush the output files and append their state to the journal"""
+        file_sizes = {}
+        for fh in self._file_handles:
+            if not fh.closed:
+                fh.flush()
+            file_sizes[os_path_abspath(fh.name)] = getsize(fh.name)
+        self._write_record(containers.checkpoint(), file_sizes)
+
+    def _write_record(self, container_states, file_sizes):
+        pickle_dump((self._new_urls, self._new_filenames, container_states, file_sizes), self._journal_fh,
+                    protocol=HIGHEST_PROTOCOL)
+        self._journal_fh.flush()
+        self.processed_urls.update(self._new_urls)
+        self._new_urls = []
+        self._new_filenames = []
+
+
 class StoreFilesWithReadableName:
-    """Store output files in bad_urls_dir directory for later examination
-        (no zipping, no validation, filenames are slugified urls)
+    """Store output files in bad_urls_dir directory (or in the given container) for later examination
+        (no validation, filenames are slugified urls)
     """
-    def __init__(self, tei_logger, bad_urls_dir, zipfile_name=None, hashsums_filename=None, hash_algos=None,
-                 tei_schema=None):
+    def __init__(self, tei_logger, bad_urls_dir, output_basename=None, hashsums_filename=None, hash_algos=None,
+                 tei_schema=None, schema_cache_dir=None, checkpoint_filename=None, resume=False, processing_time=None,
+                 container='dir', shard_by=None, shard_size_mb=DEFAULT_SHARD_SIZE_MB, compress_level=None,
+                 log_filenames=()):
         # To be a drop-in replacement
-        _ = zipfile_name, hashsums_filename, hash_algos, tei_schema
+        _ = hashsums_filename, hash_algos, tei_schema, schema_cache_dir
 
-        # Init directory
-        self._bad_urls_dir = init_directory(bad_urls_dir, tei_logger)
+        # Init checkpoints (and restore the state of the previous run)
+        self._checkpoints = OutputCheckpoints(checkpoint_filename, tei_logger, resume)
+
+        # Init directory or the container named after the output
+        if container == 'dir':
+            output_basename = init_directory(bad_urls_dir, tei_logger)
+        self._containers = OutputContainers(container, output_basename, shard_by, shard_size_mb, compress_level,
+                                            processing_time, self._checkpoints.container_states
+                                            if self._checkpoints.resumed else None)
 
         self._tei_logger = tei_logger
-        self._assigned_filenames = set()
+        self._assigned_filenames = self._checkpoints.assigned_filenames
+
+        # No validation and hashing is needed (see ValidatorHasherCompressor)
+        self.validator_hasher = None
+        # The members of the zip container can be compressed in advance in parallel (see ValidatorHasherCompressor)
+        self.compress_level = compress_level
+
+        # The files written by the caller are truncated on resume even if there was no checkpoint in the previous run
+        self._checkpoints.initial_checkpoint(log_filenames, self._containers)
+
+    def __del__(self):
+        checkpoints = getattr(self, '_checkpoints', None)
+        containers = getattr(self, '_containers', None)
+        if checkpoints is not None and containers is not None:
+            checkpoints.checkpoint(containers)
+        if containers is not None:
+            containers.close()
 
-    def process_one_file(self, url, desired_filename, filename_suff, raw_xml_str):
-        _ = desired_filename  # This contains the UUID
+    @property
+    def processed_urls(self):
+        """The URLs of the articles written before the last checkpoint (of the resumed run)"""
+        return self._checkpoints.processed_urls
+
+    def end_of_article(self, url, file_handles):
+        self._checkpoints.end_of_article(url, file_handles, self._containers)
+
+    def process_one_file(self, url, desired_filename, filename_suff, raw_xml_str, verdict=None):
+        _ = verdict  # No validation
+        # The desired filename contains the UUID, only its date directory is used for sharding
+        date_dir = os_path_dirname(desired_filename)
+        article_url = url
         if url.endswith('/'):
             url = url[:-1]
         # The last segment (249 characters) of the URL something.html or .../something/ (trailing slash omitted)
@@ -118,66 +359,130 @@ class StoreFilesWithReadableName:
         desired_filename_slug = slugify(desired_filename)
         xml_filename = check_for_filename_collision(url, desired_filename_slug, filename_suff, self._assigned_filenames,
                                                     self._tei_logger)
-        with open(os_path_join(self._bad_urls_dir, xml_filename), 'wb') as fh:
-            fh.write(raw_xml_str)
+        self._checkpoints.add_filename(xml_filename)
+        self._containers.write(xml_filename, raw_xml_str, article_url, date_dir)
 
         return xml_filename
 
 
-class ValidatorHasherCompressor:
-    """Validate output TEI XML files, zip the valid ones and compute their hashsums, invalid XMLs go
-        to bad_urls_dir directory with UUID filenames"""
-    def __init__(self, tei_logger, bad_urls_dir, zipfile_name, hashsums_filename, hash_algos=ALGORITHMS_GUARANTEED,
-                 tei_schema='https://tei-c.org/release/xml/tei/custom/schema/relaxng/tei_all.rng'):
-        # Init Zipfile
-        self._zipfile = ZipFile(zipfile_name, 'w')
+class TeiValidatorHasher:
+    """Validate TEI XML files and compute the hashsums of the valid ones
+        This is the part of ValidatorHasherCompressor which can be run in the workers in parallel:
+         the object is pickled by its parameters and the compiled validator is looked up (or loaded) on unpickling
+         (the workers are started before the portals are initialised, therefore each worker compiles the schema
+          once on its first unpickling and reuses it for the later portals of the run)
+    """
+    def __init__(self, tei_logger, hash_algos=ALGORITHMS_GUARANTEED, tei_schema=TEI_ALL_SCHEMA_URL,
+                 schema_cache_dir=DEFAULT_SCHEMA_CACHE_DIR):
+        if tei_logger is None:
+            tei_logger = Namespace(log=print)  # Hack, dummy logger! ;)
+        self._params = (hash_algos, tei_schema, schema_cache_dir)
 
         # Setup RelaxNG validator
-        with urlopen(tei_schema, cafile=certifi.where()) as response:
-            tei_schema_str = response.read()
-        relaxng_doc = etree.fromstring(tei_schema_str)
-        # LXML FAQ: You can share RelaxNG, XMLSchema and (with restrictions) XSLT objects between threads.
-        self._validator = etree.RelaxNG(relaxng_doc)
+        self._validator = get_relaxng_validator(tei_schema, schema_cache_dir, tei_logger)
 
         # Init Hasher
         self._hasher = MtHasher(hash_algos)
 
+    def __reduce__(self):
+        return self.__class__, (None, *self._params)
+
+    @property
+    def header(self):
+        return self._hasher.header
+
+    def validate_and_hash(self, raw_xml_str, xml_etree=None):
+        """Return the validation error (None if the XML is valid) and the digests of the valid XML
+            The XML is parsed only if its tree (xml_etree) is not given
+        """
+        if xml_etree is None:
+            xml_etree = etree.fromstring(raw_xml_str)
+        try:
+            self._validator.assert_(xml_etree)
+        except AssertionError as err:
+            return str(err), None
+        return None, self._hasher.hash_file(BytesIO(raw_xml_str))
+
+
+class ValidatorHasherCompressor:
+    """Validate output TEI XML files, write the valid ones into the container(s) named after output_basename
+        (a zip file by default, see OutputContainers) and compute their hashsums, invalid XMLs go
+        to bad_urls_dir directory with UUID filenames
+       The validation, the hashing (validator_hasher) and the compression of the valid XMLs (with compress_level)
+        can be done in advance in parallel, in this case only the ordered writing of the results remains
+        for process_one_file
+    """
+    def __init__(self, tei_logger, bad_urls_dir, output_basename, hashsums_filename, hash_algos=ALGORITHMS_GUARANTEED,
+                 tei_schema=TEI_ALL_SCHEMA_URL, schema_cache_dir=DEFAULT_SCHEMA_CACHE_DIR, checkpoint_filename=None,
+                 resume=False, processing_time=None, container='zip', shard_by=None,
+                 shard_size_mb=DEFAULT_SHARD_SIZE_MB, compress_level=None, log_filenames=()):
+        # Init checkpoints (and restore the state of the previous run)
+        self._checkpoints = OutputCheckpoints(checkpoint_filename, tei_logger, resume)
+
+        # Init the container(s) (the members get the current time if no processing time is fixed)
+        self._containers = OutputContainers(container, output_basename, shard_by, shard_size_mb, compress_level,
+                                            processing_time, self._checkpoints.container_states
+                                            if self._checkpoints.resumed else None)
+
+        # Setup RelaxNG validator and Hasher
+        self.validator_hasher = TeiValidatorHasher(tei_logger, hash_algos, tei_schema, schema_cache_dir)
+        # The members of the zip container (if compress_level is not None) can be compressed in advance in parallel
+        #  with this level (see deflate), they are inserted into the zip file as is
+        self.compress_level = compress_level
+
         # Init hashsums file
-        self._hashsums_fh = open(hashsums_filename, 'w', encoding='UTF-8')
-        print(*self._hasher.header, sep='\t', file=self._hashsums_fh)
+        if self._checkpoints.resumed:
+            self._hashsums_fh = open(hashsums_filename, 'a', encoding='UTF-8', buffering=OUTPUT_BUFFER_SIZE)
+        else:
+            self._hashsums_fh = open(hashsums_filename, 'w', encoding='UTF-8', buffering=OUTPUT_BUFFER_SIZE)
+            print(*self.validator_hasher.header, sep='\t', file=self._hashsums_fh)
 
         # Init directory
         self._bad_urls_dir = init_directory(bad_urls_dir, tei_logger)
 
         self._tei_logger = tei_logger
-        self._assigned_filenames = set()
+        self._assigned_filenames = self._checkpoints.assigned_filenames
+
+        # The files written by the caller and the hashsums (with its header) are truncated on resume
+        #  even if there was no checkpoint in the previous run
+        self._hashsums_fh.flush()
+        self._checkpoints.initial_checkpoint((*log_filenames, hashsums_filename), self._containers)
 
     def __del__(self):
         # Else essential records will not be written!
-        zipfile = getattr(self, '_zipfile', None)
-        if zipfile is not None:
-            close = getattr(zipfile, 'close', None)
-            if close is not None:
-                close()
+        containers = getattr(self, '_containers', None)
+        checkpoints = getattr(self, '_checkpoints', None)
+        if checkpoints is not None and containers is not None:
+            checkpoints.checkpoint(containers)
+        if containers is not None:
+            containers.close()
 
-    def process_one_file(self, url, desired_filename, filename_suff, raw_xml_str):
-
-        xml_etree = etree.fromstring(raw_xml_str)
+    def process_one_file(self, url, desired_filename, filename_suff, raw_xml_str, verdict=None):
+        """Write the XML according to the verdict (validation error, digests) computed by validator_hasher
+            (if it was not computed in advance, it is computed here)
+        """
+        if verdict is None:
+            verdict = self.validator_hasher.validate_and_hash(raw_xml_str)
+        err, digests = verdict
         xml_filename = check_for_filename_collision(url, desired_filename, filename_suff, self._assigned_filenames,
                                                     self._tei_logger)
+        self._checkpoints.add_filename(xml_filename)
         out_filename = os_path_basename(xml_filename)
-        try:
-            self._validator.assert_(xml_etree)
-            valid = True
-        except AssertionError as err:
-            self._tei_logger.log('ERROR', 'TEI validation error:', url, out_filename, err)
-            valid = False
-        if valid:
-            digests = self._hasher.hash_file(BytesIO(raw_xml_str))
-            self._zipfile.writestr(xml_filename, raw_xml_str)
+        if err is None:
+            self._containers.write(xml_filename, raw_xml_str, url, os_path_dirname(desired_filename))
             print(out_filename, url, *digests, sep='\t', file=self._hashsums_fh)
         else:
+            self._tei_logger.log('ERROR', 'TEI validation error:', url, out_filename, err)
             with open(os_path_join(self._bad_urls_dir, out_filename), 'wb') as fh:
                 fh.write(raw_xml_str)
 
         return xml_filename
+
+    @property
+    def processed_urls(self):
+        """The URLs of the articles written before the last checkpoint (of the resumed run)"""
+        return self._checkpoints.processed_urls
+
+    def end_of_article(self, url, file_handles):
+        """Checkpoint the output (with the file handles written by the caller) after every checkpoint_every articles"""
+        self._checkpoints.end_of_article(url, (*file_handles, self._hashsums_fh), self._containers)
@@ -0,0 +1,170 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import sqlite3
+from os import getpid, replace, remove, stat, access, W_OK
+from hashlib import sha256
+from tempfile import gettempdir
+from urllib.request import pathname2url
+from os.path import join as os_path_join, abspath, dirname, isfile
+
+from warcio.archiveiterator import ArchiveIterator
+from warcio.exceptions import ArchiveLoadFailed
+
+# Only init_warc_index is used outside of this file
+
+# Increase when the layout of the index changes to rebuild the existing ones
+WARC_INDEX_VERSION = '1'
+WARC_INDEX_SUFFIX = '.urlindex'
+
+
+def warc_index_filename(warc_filename, logger):
+    """The sidecar index is stored next to the WARC file or in the temporary directory if it is not writable"""
+    index_filename = f'{warc_filename}{WARC_INDEX_SUFFIX}'
+    if not access(dirname(abspath(warc_filename)), W_OK):
+        abs_warc_hash = sha256(abspath(warc_filename).encode('UTF-8')).hexdigest()
+        index_filename = os_path_join(gettempdir(), f'{abs_warc_hash}{WARC_INDEX_SUFFIX}')
+        logger.log('WARNING', f'Can not write the index next to {warc_filename}, using {index_filename} instead!')
+    return index_filename
+
+
+def warc_fingerprint(warc_filename):
+    """The index is rebuilt if the WARC file changes"""
+    warc_stat = stat(warc_filename)
+    return f'{WARC_INDEX_VERSION} {warc_stat.st_size} {warc_stat.st_mtime_ns}'
+
+
+def read_index_fingerprint(index_filename):
+    if not isfile(index_filename):
+        return None
+    connection = sqlite3.connect(f'file:{pathname2url(index_filename)}?mode=ro', uri=True)
+    try:
+        row = connection.execute('SELECT value FROM meta WHERE key = \'fingerprint\'').fetchone()
+    except sqlite3.DatabaseError:  # Broken index
+        return None
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    return row[0]
+
+
+def build_warc_index(warc_filename, index_filename, fingerprint, logger, batch_size=10000):
+    """Stream through the WARC file once and store the offset and length of the response records by URL
+        in the order of the WARC file (checking the structure and the digests like WebArticleCurator)
+       The index is written into a temporary file which is renamed at the end to avoid leaving half-written indices
+    """
+    logger.log('INFO', f'Creating index for {warc_filename}...')
+    tmp_index_filename = f'{index_filename}.tmp'
+    if isfile(tmp_index_filename):
+        remove(tmp_index_filename)
+    connection = sqlite3.connect(tmp_index_filename)
+    connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    connection.execute('CREATE TABLE records (url TEXT PRIMARY KEY, offset INTEGER NOT NULL, length INTEGER NOT NULL)')
+    batch = []
+    with open(warc_filename, 'rb') as stream:
+        archive_it = ArchiveIterator(stream, check_digests='raise')
+        try:
+            # First record should be an info record, then it should be followed by the request-response pairs
+            if next(archive_it).rec_type != 'warcinfo':
+                logger.log('CRITICAL', f'The first record of {warc_filename} is not a warcinfo record!')
+                exit(1)
+            reqv_url = None
+            for record in archive_it:
+                if record.rec_type == 'request':
+                    reqv_url = record.rec_headers.get_header('WARC-Target-URI')
+                elif record.rec_type == 'response':
+                    resp_url = record.rec_headers.get_header('WARC-Target-URI')
+                    if resp_url != reqv_url:
+                        logger.log('CRITICAL', f'The response for {resp_url} does not follow its request'
+                                               f' in {warc_filename}!')
+                        exit(1)
+                    batch.append((resp_url, archive_it.get_record_offset(), archive_it.get_record_length()))
+                    if len(batch) >= batch_size:
+                        connection.executemany('INSERT INTO records (url, offset, length) VALUES (?, ?, ?)', batch)
+                        batch = []
+            connection.executemany('INSERT INTO records (url, offset, length) VALUES (?, ?, ?)', batch)
+        except (ArchiveLoadFailed, StopIteration) as err:
+            logger.log('CRITICAL', f'Could not read {warc_filename}: {err}')
+            exit(1)
+        except sqlite3.IntegrityError as err:
+            logger.log('CRITICAL', f'Double URLs detected in {warc_filename} ({err})!')
+            exit(1)
+    connection.execute('INSERT INTO meta (key, value) VALUES (\'fingerprint\', ?)', (fingerprint,))
+    connection.commit()
+    connection.close()
+    replace(tmp_index_filename, index_filename)
+    logger.log('INFO', 'Index successfully created.')
+
+
+def init_warc_index(warc_filenames, logger):
+    """Create the WarcIndex of the WARC file(s) building the sidecar index of the new or changed WARC files"""
+    if isinstance(warc_filenames, str):
+        warc_filenames = [warc_filenames]
+    index_filenames = []
+    for warc_filename in warc_filenames:
+        index_filename = warc_index_filename(warc_filename, logger)
+        fingerprint = warc_fingerprint(warc_filename)
+        if read_index_fingerprint(index_filename) != fingerprint:
+            build_warc_index(warc_filename, index_filename, fingerprint, logger)
+        else:
+            logger.log('INFO', f'Using the index of {warc_filename} ({index_filename})')
+        index_filenames.append(index_filename)
+    return WarcIndex(warc_filenames, index_filenames)
+
+
+class WarcIndex:
+    """The persistent (SQLite, memory-mapped) indices of the WARC files: URL -> (WARC filename, offset, length)
+        of the response records (a URL is looked up in the WARC files in order, the first occurrence is used)
+       The indices are opened lazily read-only by each process, therefore the object can be shared with the workers
+        and the WARC files need not be read through on later runs
+    """
+    def __init__(self, warc_filenames, index_filenames, mmap_size=2 ** 32):
+        self._warc_filenames = warc_filenames
+        self._index_filenames = index_filenames
+        self._mmap_size = mmap_size
+        self._connections = None
+        self._connections_pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connections'] = None  # Each process opens its own connections
+        state['_connections_pid'] = None
+        return state
+
+    def _connect(self, index_filename):
+        connection = sqlite3.connect(f'file:{pathname2url(index_filename)}?mode=ro', uri=True,
+                                     check_same_thread=False)
+        connection.execute(f'PRAGMA mmap_size={self._mmap_size}')
+        return connection
+
+    def _get_connections(self):
+        if self._connections_pid != getpid():  # Connections must not be shared between processes
+            self._connections = [self._connect(index_filename) for index_filename in self._index_filenames]
+            self._connections_pid = getpid()
+        return self._connections
+
+    def _lookup(self, url, num_of_warcs):
+        for warc_filename, connection in zip(self._warc_filenames[:num_of_warcs], self._get_connections()):
+            row = connection.execute('SELECT offset, length FROM records WHERE url = ?', (url,)).fetchone()
+            if row is not None:
+                return (warc_filename, *row)
+        return None
+
+    def get(self, url):
+        """Return the WARC filename, the offset and the length of the response record of the URL or None"""
+        return self._lookup(url, len(self._warc_filenames))
+
+    def __contains__(self, url):
+        return self.get(url) is not None
+
+    def __iter__(self):
+        """Iterate over the URLs of the WARC files in their order (without loading the whole index into memory)"""
+        for i, index_filename in enumerate(self._index_filenames):
+            connection = self._connect(index_filename)  # Separate connection as the iteration may run in a thread
+            try:
+                for url, in connection.execute('SELECT url FROM records ORDER BY rowid'):
+                    if i == 0 or self._lookup(url, i) is None:  # Only the first occurrence of the URL is used
+                        yield url
+            finally:
+                connection.close()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import re
+import warnings
+from random import Random
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from html2tei.tei_utils import tei_defaultdict
+from html2tei.workflow_helpers.read_config import get_portal_spec_fun_and_dict_names, load_portal_specific_dicts, \
+    compile_bigram_rules, read_portal_tei_base_file
+from html2tei.modes.portal_article_cleaner import TeiTemplate, TEI_XML_FORMATS, tei_writer
+from html2tei.article_body_converters import eltedh_abc, eltedh_lxml_abc
+
+CONFIGS_DIR = Path(__file__).resolve().parent.parent / 'configs'
+# The portals with different tag tables, block rules and bigram rules (kurucinfo and merce have script tags
+#  in their article bodies which are converted by the fallback)
+PORTALS = ('hvg', 'abcug', 'alfahir', 'kurucinfo', 'merce', 'telex_koronavirus', 'index_koronavirus', 'valasz')
+NUM_OF_ARTICLES = 30
+PROCESSING_TIME = '2021-11-11T11:11:11'
+
+WORDS = ('alma', 'körte', ' ', '\n', '  ', '\t', 'Hello world', '„idézet”', 'http://example.com', '&amp;', '<br>',
+         '<br/>', '<!-- comment -->')
+ATTR_VALUES = ('123', 'abc12', 'https://example.com/x/1', 'hu', 'en')
+HREF_VALUES = ('/cikk/1', 'https://example.com/a', 'javascript:x', '#')
+OTHER_TAGS = ('span', 'div', 'font', 'img', 'a', 'table', 'tr', 'td')
+FROZEN_TAG = re.compile(r'<(\S+?)( .*)?>')
+TAG_NAME = re.compile(r'[a-zA-Z][a-zA-Z0-9]*')
+
+
+class RecordingLogger:
+    """Record the messages as Logger.log formats them"""
+    def __init__(self):
+        self.messages = []
+
+    def log(self, level, *message, sep=' '):
+        self.messages.append((level, sep.join(str(msg) for msg in message)))
+
+
+def load_portal(portal_name):
+    """The parameters of the article body converters and the base TEI XML of the portal (see read_portalspec_config)"""
+    logger = RecordingLogger()
+    portal_dir = CONFIGS_DIR / portal_name
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)  # Invalid escape sequences in the configurations
+        _, _, _, _, article_root_params, decompose_spec, excluded_tags_spec, portal_url_prefix, link_filter_spec, \
+            links, block_rules_spec, bigram_rules_spec, _ = \
+            get_portal_spec_fun_and_dict_names(str(portal_dir / f'{portal_name}_specific.py'), logger)
+    tag_normal_dict, portal_specific_block_rules = \
+        load_portal_specific_dicts(str(portal_dir / f'{portal_name}_text_tags_normal.tsv'),
+                                   str(portal_dir / f'{portal_name}_notext_tags_normal.tsv'), block_rules_spec, logger)
+    bigram_rules = compile_bigram_rules(bigram_rules_spec, logger)
+    portal_xml_string = read_portal_tei_base_file(str(portal_dir / f'{portal_name}_BASE.xml'), logger)
+    spec_params = (article_root_params, decompose_spec, excluded_tags_spec, tag_normal_dict, links,
+                   portal_specific_block_rules, bigram_rules, portal_url_prefix, link_filter_spec)
+    return spec_params, portal_xml_string
+
+
+def generate_articles(portal_name, article_root_params, tag_normal_dict):
+    """Random article bodies from the tags (with their attributes) of the tag table of the portal"""
+    tags = []
+    for frozen_tag in tag_normal_dict.keys():
+        m = FROZEN_TAG.fullmatch(frozen_tag)
+        if m is not None and TAG_NAME.fullmatch(m.group(1)):
+            tags.append((m.group(1), re.findall(r'(\S+?)=(\S*)', m.group(2) or '')))
+    rnd = Random(portal_name)
+
+    def attr_value(value):
+        if value.startswith('@'):
+            return rnd.choice(ATTR_VALUES)
+        return value
+
+    def contents(depth):
+        out = []
+        for _ in range(rnd.randint(0, 5 if depth < 5 else 0)):
+            if rnd.random() < 0.4:
+                out.append(rnd.choice(WORDS))
+                continue
+            if rnd.random() < 0.05:
+                name, attrs = rnd.choice(OTHER_TAGS), []
+            else:
+                name, attrs = rnd.choice(tags)
+            attrs_str = ''.join(f' {key}="{attr_value(value)}"' for key, value in attrs)
+            if rnd.random() < 0.1:
+                attrs_str += f' href="{rnd.choice(HREF_VALUES)}"'
+            if rnd.random() < 0.05:
+                attrs_str += ' lang="hu"'
+            out.append(f'<{name}{attrs_str}>{contents(depth + 1)}</{name}>')
+        return ''.join(out)
+
+    return [article_html(article_root_params, contents(0)) for _ in range(NUM_OF_ARTICLES)]
+
+
+def article_html(article_root_params, body):
+    """The HTML page with the body in the article root (see ARTICLE_ROOT_PARAMS_SPEC of the portal)"""
+    (root_args, root_kwargs), *_ = article_root_params
+    root_attrs = ''.join(f' {key}="{value}"' for key, value in root_kwargs.items() if isinstance(value, str))
+    return f'<html><body><{root_args[0]}{root_attrs}>{body}</{root_args[0]}></body></html>'
+
+
+def get_meta(tei_logger, url, bs):
+    _ = tei_logger, bs  # To be a drop-in replacement
+    data = tei_defaultdict()
+    data['sch:url'] = url
+    data['sch:name'] = 'Title'
+    data['sch:datePublished'] = datetime(2020, 1, 2)
+    return data
+
+
+def convert(write_out_mode, url, html, spec_params, tei_template):
+    """The TEI XML of the article (or None) and the logged messages"""
+    logger = RecordingLogger()
+    article_page_tup = (url, datetime(2021, 1, 1, 10), '<urn:uuid:00000000-0000-0000-0000-000000000000>', html,
+                        BeautifulSoup(html, 'lxml'))
+    meta, body = write_out_mode.process_article(article_page_tup, logger, get_meta, spec_params)
+    tei_xml = None
+    if meta is not None and body is not None and body != 'EMPTY ARTICLE':
+        _, _, tei_xml, _, _ = tei_writer(article_page_tup[1], article_page_tup[2], tei_template, meta, body,
+                                         processing_time=PROCESSING_TIME)
+    return tei_xml, logger.messages
+
+
+@pytest.mark.parametrize('portal_name', PORTALS)
+def test_same_tei_as_eltedh(portal_name):
+    """eltedh-lxml must write the same TEI XML (in every format) and log the same messages as eltedh
+        (the fallbacks to eltedh are logged additionally)
+    """
+    spec_params, portal_xml_string = load_portal(portal_name)
+    articles = generate_articles(portal_name, spec_params[0], spec_params[3])
+    fallbacks = 0
+    for xml_format in TEI_XML_FORMATS:
+        tei_template = TeiTemplate(portal_xml_string, xml_format)
+        for i, html in enumerate(articles):
+            url = f'https://example.com/{portal_name}/{i}'
+            tei_xml, messages = convert(eltedh_abc, url, html, spec_params, tei_template)
+            lxml_tei_xml, lxml_messages = convert(eltedh_lxml_abc, url, html, spec_params, tei_template)
+            fallback_messages = [message for message in lxml_messages
+                                 if message[0] == 'INFO' and eltedh_lxml_abc.FALLBACK_MESSAGE in message[1]]
+            fallbacks += len(fallback_messages)
+            assert lxml_tei_xml == tei_xml, url
+            assert [message for message in lxml_messages if message not in fallback_messages] == messages, url
+    # The lxml implementation must have converted the articles without special strings (e.g. script tags)
+    assert fallbacks < len(articles) * len(TEI_XML_FORMATS)
+
+
+def test_fallback_is_logged():
+    spec_params, portal_xml_string = load_portal('kurucinfo')
+    html = article_html(spec_params[0], '<p>Hello <b>world</b></p><script>var x = 1 < 2;</script>')
+    tei_template = TeiTemplate(portal_xml_string)
+    tei_xml, messages = convert(eltedh_abc, 'https://example.com/1', html, spec_params, tei_template)
+    lxml_tei_xml, lxml_messages = convert(eltedh_lxml_abc, 'https://example.com/1', html, spec_params, tei_template)
+    assert lxml_tei_xml == tei_xml
+    fallback_message = \
+        ('INFO', f'https://example.com/1: {eltedh_lxml_abc.FALLBACK_MESSAGE} (Tag with special strings: script)')
+    assert [message for message in lxml_messages if message != fallback_message] == messages
+    assert fallback_message in lxml_messages
+
+
+def test_same_log_of_empty_elements():
+    """The empty elements which were void HTML elements (e.g. embed) must be logged as <tag/> as in BeautifulSoup"""
+    spec_params, portal_xml_string = load_portal('kurucinfo')
+    html = article_html(spec_params[0], '<p>Hello <b>world</b></p><embed allowfullscreen="true" '
+                                        'allowscriptaccess="always" height="1" src="123" '
+                                        'type="application/x-shockwave-flash" width="1">')
+    tei_template = TeiTemplate(portal_xml_string)
+    tei_xml, messages = convert(eltedh_abc, 'https://example.com/1', html, spec_params, tei_template)
+    lxml_tei_xml, lxml_messages = convert(eltedh_lxml_abc, 'https://example.com/1', html, spec_params, tei_template)
+    assert lxml_tei_xml == tei_xml
+    assert lxml_messages == messages
+    assert ('DEBUG', 'https://example.com/1: EMPTY SOCIAL MEDIA CONTENT OR FIGURE '
+            '<beagyazott_tartalom original="123"/>') in messages
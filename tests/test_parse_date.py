@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import ast
+import warnings
+from locale import Error as locale_Error
+from pathlib import Path
+from datetime import datetime
+from re import compile as re_compile
+
+import pytest
+
+from html2tei.workflow_helpers.processing_utils import parse_date, safe_setlocale, _parse_date_in_locale, \
+    LOCALE_DATE_NAMES
+
+CONFIGS_DIR = Path(__file__).resolve().parent.parent / 'configs'
+HU_LOCALE = 'hu_HU.UTF-8'
+
+NAME_DIRECTIVES = ('A', 'a', 'B', 'b')
+# The strings consisting of literals and the directives used for dates (e.g. %Y-%m-%d, but not URL-encoded strings)
+DATE_FORMAT = re_compile(r'(?:[^%]|%[YymdHMSfzAaBb])*%[YymdHMSfzAaBb](?:[^%]|%[YymdHMSfzAaBb])*')
+DIRECTIVE = re_compile(r'%([YymdHMSfzAaBb])')
+
+
+def date_formats_in_configs():
+    """The distinct date formats (string literals) in the portal-specific configurations"""
+    date_formats = set()
+    for config_file in CONFIGS_DIR.glob('*/*.py'):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)  # Invalid escape sequences in the configurations
+            tree = ast.parse(config_file.read_text(encoding='UTF-8'))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and DATE_FORMAT.fullmatch(node.value):
+                date_formats.add(node.value)
+    return sorted(date_formats)
+
+
+DATE_FORMATS = date_formats_in_configs()
+NUMERIC_DATE_FORMATS = [date_format for date_format in DATE_FORMATS
+                        if not any(f'%{directive}' in date_format for directive in NAME_DIRECTIVES)]
+NAMED_DATE_FORMATS = [date_format for date_format in DATE_FORMATS if date_format not in NUMERIC_DATE_FORMATS]
+
+
+def hu_locale_available():
+    try:
+        with safe_setlocale(HU_LOCALE):
+            return True
+    except locale_Error:
+        return False
+
+
+def render(date_format, values):
+    """Fill the date format with the values of the directives (the literals are kept)"""
+    return DIRECTIVE.sub(lambda m: values[m.group(1)], date_format)
+
+
+def with_variants(date_format, values):
+    """The rendered date with more whitespace and with trailing text (which must fail)"""
+    date_str = render(date_format, values)
+    return date_str, date_str.replace(' ', '  '), f'{date_str} x', f'{date_str}.'
+
+
+def numeric_values(dt, utc_offset='+0100'):
+    return {'Y': f'{dt.year:04d}', 'y': f'{dt.year % 100:02d}', 'm': f'{dt.month:02d}', 'd': f'{dt.day:02d}',
+            'H': f'{dt.hour:02d}', 'M': f'{dt.minute:02d}', 'S': f'{dt.second:02d}', 'f': f'{dt.microsecond:06d}',
+            'z': utc_offset}
+
+
+NUMERIC_CASES = [numeric_values(datetime(2020, 1, 5, 7, 5, 9, 123456)),
+                 numeric_values(datetime(1999, 12, 31, 23, 59, 59), '-05:30'),
+                 numeric_values(datetime(2024, 2, 29), 'Z'),
+                 numeric_values(datetime(2069, 6, 15, 12, 30, 45, 500), '+01:00:30'),
+                 # Not zero-padded values and shorter fractions
+                 {**numeric_values(datetime(2021, 3, 4, 5, 6, 7)), 'd': '4', 'm': '3', 'H': '5', 'M': '6', 'S': '7',
+                  'f': '123', 'y': '70'},
+                 # Out of range values and other invalid inputs (must fail)
+                 {**numeric_values(datetime(2021, 4, 1)), 'd': '31'},
+                 {**numeric_values(datetime(2021, 2, 1)), 'd': '29'},
+                 {**numeric_values(datetime(2021, 1, 1)), 'd': '32'},
+                 {**numeric_values(datetime(2021, 1, 1)), 'm': '13'},
+                 {**numeric_values(datetime(2021, 1, 1)), 'm': '0'},
+                 {**numeric_values(datetime(2021, 1, 1)), 'H': '24', 'M': '60'},
+                 {**numeric_values(datetime(2021, 1, 1)), 'Y': '20a1', 'z': '+1:00'},
+                 {**numeric_values(datetime(2021, 1, 1)), 'z': '+01:0030'},
+                 {**numeric_values(datetime(2021, 1, 1)), 'z': '+0100:30'},
+                 ]
+
+
+def strptime_or_none(date_str, date_format):
+    try:
+        return datetime.strptime(date_str, date_format)
+    except ValueError:
+        return None
+
+
+def with_offset(dt):
+    """The datetime with its UTC offset to distinguish the aware datetimes of the same moment"""
+    return dt, None if dt is None else dt.utcoffset()
+
+
+def test_date_formats_found():
+    assert len(DATE_FORMATS) >= 15
+    assert len(NAMED_DATE_FORMATS) > 0
+
+
+@pytest.mark.parametrize('date_format', NUMERIC_DATE_FORMATS)
+def test_numeric_date_formats(date_format):
+    """The numeric directives do not depend on the locale, the results must be the same as of datetime.strptime()"""
+    for values in NUMERIC_CASES:
+        for date_str in with_variants(date_format, values):
+            expected = strptime_or_none(date_str, date_format)
+            assert with_offset(parse_date(date_str, date_format)) == with_offset(expected), date_str
+
+
+@pytest.mark.skipif(not hu_locale_available(), reason=f'{HU_LOCALE} locale is not available')
+@pytest.mark.parametrize('date_format', NAMED_DATE_FORMATS)
+def test_named_date_formats(date_format):
+    """The names of the months and the weekdays (LOCALE_DATE_NAMES) must be parsed the same way
+        as datetime.strptime() does in the locale (with the names of the locale and the names of LOCALE_DATE_NAMES)
+    """
+    with safe_setlocale(HU_LOCALE):
+        locale_names = {directive: [datetime(2021, 1, 4 + i).strftime(f'%{directive}') for i in range(7)]
+                        for directive in ('A', 'a')}
+        locale_names.update({directive: [datetime(2021, i, 1).strftime(f'%{directive}') for i in range(1, 13)]
+                             for directive in ('B', 'b')})
+
+    cases = []
+    for names in (locale_names, LOCALE_DATE_NAMES['hu']):
+        for month in range(12):
+            dt = datetime(2021, month + 1, 28, 9, 41)
+            values = {**numeric_values(dt), 'B': names['B'][month], 'b': names['b'][month],
+                      'A': names['A'][dt.weekday()], 'a': names['a'][dt.weekday()]}
+            cases.extend((values, {**values, **{d: values[d].upper() for d in NAME_DIRECTIVES}}))
+    base = cases[0]
+    cases.extend(({**base, 'B': 'foo', 'b': 'foo'}, {**base, 'A': 'foo', 'a': 'foo'},
+                  {**base, 'B': locale_names['B'][3], 'b': locale_names['b'][3], 'd': '31'},
+                  {**base, 'B': locale_names['B'][1], 'b': locale_names['b'][1], 'd': '29'}))
+
+    for values in cases:
+        for date_str in with_variants(date_format, values):
+            expected = _parse_date_in_locale(date_str, date_format, HU_LOCALE)
+            assert parse_date(date_str, date_format, HU_LOCALE) == expected, date_str
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import sys
+import subprocess
+from pathlib import Path
+from zipfile import ZipFile
+
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
+
+# Every XML document is valid according to this schema
+ANY_XML_SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+  <start><ref name="any"/></start>
+  <define name="any">
+    <element>
+      <anyName/>
+      <zeroOrMore><choice><attribute><anyName/></attribute><text/><ref name="any"/></choice></zeroOrMore>
+    </element>
+  </define>
+</grammar>
+"""
+
+# Write the articles into the output and the URL list as the Portal Article Cleaner does (see after_clean)
+#  and exit without closing anything at kill_at as if the run was killed
+WRITER_SCRIPT = """
+import os
+import sys
+from html2tei.workflow_helpers.validate_hash_zip import init_output_writer
+
+
+class Logger:
+    @staticmethod
+    def log(level, *args):
+        print(level, *args, file=sys.stderr)
+
+
+output_dir, resume, num_of_articles, kill_at = sys.argv[1], sys.argv[2] == 'True', int(sys.argv[3]), int(sys.argv[4])
+urls_filename = os.path.join(output_dir, 'portal_urls.txt')
+writer = init_output_writer(output_dir, 'portal', False, Logger, os.path.join(output_dir, 'any.rng'), None, resume,
+                            log_filenames=[urls_filename])
+with open(urls_filename, 'a', encoding='UTF-8') as url_list:
+    for i in range(num_of_articles):
+        url = f'https://example.com/{i}'
+        if url in writer.processed_urls:
+            continue
+        if i == kill_at:
+            url_list.flush()
+            os._exit(1)
+        filename = writer.process_one_file(url, f'2020-01-01/{i:05d}', '.xml', f'<TEI n="{i}"/>'.encode('UTF-8'))
+        print(url, filename, file=url_list)
+        writer.end_of_article(url, (url_list,))
+    del writer
+"""
+
+
+def run_writer(output_dir, resume, num_of_articles, kill_at=-1):
+    return subprocess.run([sys.executable, '-c', WRITER_SCRIPT, str(output_dir), str(resume), str(num_of_articles),
+                           str(kill_at)], env={'PYTHONPATH': str(SRC_DIR)}, capture_output=True, text=True)
+
+
+def test_resume_before_first_checkpoint(tmp_path):
+    """The run is killed before its first checkpoint (after every 1000 articles), the resumed run must not duplicate
+        the articles written before the interruption in the URL list, in the hashsums or in the zip file
+    """
+    (tmp_path / 'any.rng').write_text(ANY_XML_SCHEMA, encoding='UTF-8')
+
+    killed_run = run_writer(tmp_path, False, 50, kill_at=30)
+    assert killed_run.returncode == 1, killed_run.stderr
+    assert len((tmp_path / 'portal_urls.txt').read_text(encoding='UTF-8').splitlines()) == 30
+
+    resumed_run = run_writer(tmp_path, True, 50)
+    assert resumed_run.returncode == 0, resumed_run.stderr
+    assert 'Resuming after 0 articles' in resumed_run.stderr
+
+    urls = [line.split()[0] for line in (tmp_path / 'portal_urls.txt').read_text(encoding='UTF-8').splitlines()]
+    assert urls == [f'https://example.com/{i}' for i in range(50)]
+    hashsums = (tmp_path / 'portal.hashsums').read_text(encoding='UTF-8').splitlines()
+    assert hashsums[0].startswith('filename\t')
+    assert [line.split('\t')[1] for line in hashsums[1:]] == urls
+    with ZipFile(tmp_path / 'portal.zip') as zipfile:
+        assert zipfile.testzip() is None
+        assert sorted(zipfile.namelist()) == [f'2020-01-01/{i:05d}.xml' for i in range(50)]
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8, vim: expandtab:ts=4 -*-
+
+import pytest
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from html2tei.tei_utils import bs4_to_etree
+
+# Mixed content where the whitespace-only strings between the elements separate the words
+MIXED_CONTENT_DOCUMENTS = ['<p><hi rend="bold">Hello</hi> <hi rend="italic">world</hi></p>',
+                           '<p><hi>Hello</hi>\n<hi>world</hi></p>',
+                           '<body><p>A <ref target="x">link</ref> <hi>and</hi>\t<hi>more</hi></p></body>',
+                           '<body><head><hi>Title</hi> <hi>words</hi></head><list><item><hi>a</hi> <ref>b</ref></item>'
+                           '</list></body>',
+                           '<p><quote><hi>quoted</hi> <hi>words</hi></quote> <hi>x</hi>\n<hi>y</hi></p>',
+                           '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><p><hi>Hello</hi> <hi>world</hi></p>'
+                           '<note><ref>a</ref> <ref>b</ref></note></body></text></TEI>',
+                           ]
+
+
+@pytest.mark.parametrize('document', MIXED_CONTENT_DOCUMENTS)
+def test_bs4_to_etree_keeps_the_text(document):
+    """The text of the converted tree must be the same as the text of the BeautifulSoup document"""
+    beauty_xml = BeautifulSoup(document, features='lxml-xml')
+    tei_etree = bs4_to_etree(beauty_xml)
+    assert ''.join(tei_etree.getroot().itertext()) == beauty_xml.get_text()
+
+
+def test_bs4_to_etree_compact_mixed_content():
+    beauty_xml = BeautifulSoup('<p><hi rend="bold">Hello</hi> <hi rend="italic">world</hi></p>', features='lxml-xml')
+    assert etree.tostring(bs4_to_etree(beauty_xml), encoding='UTF-8') == \
+        b'<p><hi rend="bold">Hello</hi> <hi rend="italic">world</hi></p>'
+
+
+def test_bs4_to_etree_drops_the_indentation():
+    """The indentation of element-only content is dropped to be able to pretty print the tree"""
+    beauty_xml = BeautifulSoup('<div>\n  <div>\n    <p>a</p>\n  </div>\n</div>', features='lxml-xml')
+    assert etree.tostring(bs4_to_etree(beauty_xml), encoding='UTF-8', pretty_print=True) == \
+        b'<div>\n  <div>\n    <p>a</p>\n  </div>\n</div>\n'